@@ -0,0 +1,68 @@
+import os
+from frontiers_yildizetal.emulators import ScalarEmulators, VectorEmulators
+from frontiers_yildizetal.utilities import synthetic
+from . import common
+
+names = ('synth', 'synth_validation', 'synth_pem')
+
+class ScalarEmulatorsSuite:
+    params = [common.grids, common.samples]
+    param_names = ['cols', 'samples']
+    timeout = 1200
+
+    def setup_cache(self):
+        root = os.path.abspath('stacks')
+        for cols in common.grids:
+            common.write(root, cols, names=names)
+        return root
+
+    def setup(self, root, cols, samples):
+        self.process = common.serve(common.directory(root, cols))
+        self.emulator = ScalarEmulators('synth', threshold=0.1, loc_x=1000, loc_y=2000)
+        self.input_pred = synthetic.design(samples, seed=0)
+
+    def teardown(self, root, cols, samples):
+        common.stop(self.process)
+
+    def time_construct(self, root, cols, samples):
+        ScalarEmulators('synth', threshold=0.1, loc_x=1000, loc_y=2000)
+
+    def time_model(self, root, cols, samples):
+        self.emulator.model('ia')
+
+    def time_predict_scalar(self, root, cols, samples):
+        self.emulator.predict_scalar('ia', self.input_pred)
+
+    def time_cv_loo(self, root, cols, samples):
+        self.emulator.cv_loo('ia')
+
+class VectorEmulatorsSuite:
+    params = [common.grids, common.samples]
+    param_names = ['cols', 'samples']
+    timeout = 1200
+
+    def setup_cache(self):
+        root = os.path.abspath('stacks')
+        for cols in common.grids:
+            common.write(root, cols, names=names)
+        return root
+
+    def setup(self, root, cols, samples):
+        self.process = common.serve(common.directory(root, cols))
+        self.emulator = VectorEmulators('synth', qoi='hmax', threshold=0.1)
+        self.input_pred = synthetic.design(samples, seed=0)
+
+    def teardown(self, root, cols, samples):
+        common.stop(self.process)
+
+    def time_construct(self, root, cols, samples):
+        VectorEmulators('synth', qoi='hmax', threshold=0.1)
+
+    def peakmem_construct(self, root, cols, samples):
+        VectorEmulators('synth', qoi='hmax', threshold=0.1)
+
+    def time_predict_vector(self, root, cols, samples):
+        self.emulator.predict_vector(self.input_pred)
+
+    def peakmem_predict_vector(self, root, cols, samples):
+        self.emulator.predict_vector(self.input_pred)
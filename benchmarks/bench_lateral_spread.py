@@ -0,0 +1,29 @@
+import os
+from frontiers_yildizetal.analysis import lateral_spread
+from frontiers_yildizetal.utilities import data
+from . import common
+
+class LateralSpreadSuite:
+    params = [common.grids, common.sizes]
+    param_names = ['cols', 'size']
+    timeout = 1200
+
+    def setup_cache(self):
+        root = os.path.abspath('stacks')
+        for cols in common.grids:
+            for size in common.sizes:
+                common.write(root, cols, size)
+        return root
+
+    def setup(self, root, cols, size):
+        self.process = common.serve(common.directory(root, cols, size))
+        self.link = data.FigshareData('synth').raster_link('hmax')
+
+    def teardown(self, root, cols, size):
+        common.stop(self.process)
+
+    def time_calculate(self, root, cols, size):
+        lateral_spread.calculate(self.link, 0.1)
+
+    def peakmem_calculate(self, root, cols, size):
+        lateral_spread.calculate(self.link, 0.1)
@@ -0,0 +1,68 @@
+import os
+from frontiers_yildizetal.ravaflow import Simulations
+from frontiers_yildizetal.utilities import data
+from . import common
+
+class SimulationsSuite:
+    params = [common.grids, common.sizes]
+    param_names = ['cols', 'size']
+    timeout = 1200
+
+    def setup_cache(self):
+        root = os.path.abspath('stacks')
+        for cols in common.grids:
+            for size in common.sizes:
+                common.write(root, cols, size)
+        return root
+
+    def setup(self, root, cols, size):
+        self.process = common.serve(common.directory(root, cols, size))
+        self.sims = Simulations('synth')
+
+    def teardown(self, root, cols, size):
+        common.stop(self.process)
+
+    def time_figshare_data(self, root, cols, size):
+        data.FigshareData('synth')
+
+    def time_calc_ia(self, root, cols, size):
+        self.sims.calc_ia(0.1)
+
+    def time_calc_da(self, root, cols, size):
+        self.sims.calc_da(0.1)
+
+    def time_calc_dv(self, root, cols, size):
+        self.sims.calc_dv(0.1)
+
+    def time_extract_qoi_at(self, root, cols, size):
+        self.sims.extract_qoi_at('hmax', 1000, 2000)
+
+    def time_create_vector(self, root, cols, size):
+        self.sims.create_vector('hmax', 0.1)
+
+    def peakmem_create_vector(self, root, cols, size):
+        self.sims.create_vector('hmax', 0.1)
+
+class CachedSimulationsSuite:
+    """ create_vector served from a warm result cache, for comparison with SimulationsSuite """
+    params = [common.grids, common.sizes]
+    param_names = ['cols', 'size']
+    timeout = 1200
+
+    def setup_cache(self):
+        root = os.path.abspath('stacks')
+        for cols in common.grids:
+            for size in common.sizes:
+                common.write(root, cols, size)
+        return root
+
+    def setup(self, root, cols, size):
+        self.process = common.serve(common.directory(root, cols, size), cached=True)
+        self.sims = Simulations('synth')
+        self.sims.create_vector('hmax', 0.1)
+
+    def teardown(self, root, cols, size):
+        common.stop(self.process)
+
+    def time_create_vector(self, root, cols, size):
+        self.sims.create_vector('hmax', 0.1)
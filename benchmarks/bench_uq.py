@@ -0,0 +1,29 @@
+import os
+from frontiers_yildizetal.analysis import uq
+from . import common
+
+class MomentsSuite:
+    params = [common.grids]
+    param_names = ['cols']
+    timeout = 1800
+
+    def setup_cache(self):
+        root = os.path.abspath('stacks')
+        for cols in common.grids:
+            common.write(root, cols, names=('synth', 'synth_pem'))
+        return root
+
+    def setup(self, root, cols):
+        self.process = common.serve(common.directory(root, cols))
+
+    def teardown(self, root, cols):
+        common.stop(self.process)
+
+    def time_get_mcs(self, root, cols):
+        uq.Moments('synth').get_mcs()
+
+    def time_get_pem(self, root, cols):
+        uq.Moments('synth').get_pem()
+
+    def peakmem_get_pem(self, root, cols):
+        uq.Moments('synth').get_pem()
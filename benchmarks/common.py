@@ -0,0 +1,40 @@
+"""
+Helpers shared by the benchmarks
+
+The benchmarks run against synthetic stacks served by the local stand-in of the Figshare API.
+Every grid covers the extent of the synth set, i.e. 5000 m x 4000 m, so that the extraction
+location of uq.Moments is valid for every grid. Edit the sweeps below to probe other scales.
+
+Every benchmark runs with an empty package cache in a temporary directory and with the result
+cache disabled, so that the timings measure the raster work instead of cache hits.
+"""
+import os
+import shutil
+import tempfile
+from frontiers_yildizetal.utilities import figshare_server, results, synthetic
+
+grids = [125, 500, 1250]
+sizes = [100, 400]
+samples = [1000, 10000]
+
+def directory(root:str, cols:int, size=None) -> str:
+    return os.path.join(root, 'grid%d_size%s' % (cols, size))
+
+def write(root:str, cols:int, size=None, names=('synth',)) -> str:
+    path = directory(root, cols, size)
+    if not os.path.exists(path):
+        synthetic.write_articles(path, rows=int(0.8 * cols), cols=cols, res=5000 / cols, size=size, seed=0, names=list(names))
+    return path
+
+def serve(path:str, cached:bool=False):
+    process, base_url = figshare_server.serve(path)
+    os.environ['FIGSHARE_BASE_URL'] = base_url
+    os.environ['FRONTIERS_YILDIZETAL_CACHE'] = tempfile.mkdtemp(prefix='frontiers_yildizetal_bench_')
+    results.set_enabled(cached)
+    return process
+
+def stop(process):
+    process.terminate()
+    os.environ.pop('FIGSHARE_BASE_URL', None)
+    shutil.rmtree(os.environ.pop('FRONTIERS_YILDIZETAL_CACHE', ''), ignore_errors=True)
+    results.set_enabled(None)
@@ -0,0 +1,70 @@
+from frontiers_yildizetal.ravaflow import Simulations
+from frontiers_yildizetal.emulators import ScalarEmulators, VectorEmulators
+from frontiers_yildizetal.analysis import uq
+from frontiers_yildizetal.utilities import data
+from frontiers_yildizetal.utilities.pipeline import Pipeline
+import numpy as np
+
+# The emulators hold the curated scalars only, and their RobustGaSP models are fitted again in
+# every process, so the predictions at all MCS input sets are made once in mcs_predictions and
+# shared by the artifacts that need them.
+def scalar_emulators(name, threshold, loc_x, loc_y):
+    return ScalarEmulators(name, threshold=threshold, loc_x=loc_x, loc_y=loc_y)
+
+def mcs_predictions(emulator):
+    mcss = ['mcs1', 'mcs2', 'mcs3']
+    inputs = [data.load_input(emulator.name, mcs) for mcs in mcss]
+    splits = np.cumsum([len(x) for x in inputs])[:-1]
+    predictions = {}
+    for scalar in emulator.output:
+        predicted = emulator.predict_scalar(scalar, np.concatenate(inputs))[0]
+        predictions[scalar] = dict(zip(mcss, np.split(predicted, splits)))
+    return predictions
+
+def mcs_moments(predictions, name):
+    return uq.Moments(name).get_mcs(predicted=predictions)
+
+def pem_moments(name):
+    return uq.Moments(name).get_pem()
+
+def scalar_predictions(predictions, analysis):
+    return {scalar: predicted[analysis] for scalar, predicted in predictions.items()}
+
+def vector_emulators(name, qoi, threshold):
+    return VectorEmulators(name, qoi=qoi, threshold=threshold)
+
+def vector_predictions(emulator, analysis):
+    mean, sd = emulator.predict_vector(data.load_input(emulator.name, analysis))
+    return {'mean':mean, 'sd':sd, 'valid_cols':emulator.valid_cols, 'mask':emulator.mask, 'rows':emulator.rows, 'cols':emulator.cols}
+
+def pem_vector(emulator):
+    pem, _ = Simulations(emulator.name + '_pem').create_vector(
+        qoi=emulator.qoi, threshold=emulator.threshold, valid_cols=emulator.mask
+    )
+    return pem
+
+pipeline = Pipeline()
+for name in ['synth', 'acheron']:
+    loc_x, loc_y = uq.Moments.loc_all[name]
+    pipeline.add('scalar_emulators:' + name, scalar_emulators, stacks=[name], name=name, threshold=0.1, loc_x=loc_x, loc_y=loc_y)
+    pipeline.add('mcs_predictions:' + name, mcs_predictions, deps=['scalar_emulators:' + name])
+    pipeline.add('mcs_moments:' + name, mcs_moments, deps=['mcs_predictions:' + name], name=name)
+    pipeline.add('pem_moments:' + name, pem_moments, stacks=[name + '_pem'], name=name)
+    pipeline.add('scalar_predictions:' + name, scalar_predictions, deps=['mcs_predictions:' + name], analysis='mcs3')
+    pipeline.add('vector_emulators:' + name, vector_emulators, stacks=[name, name + '_validation'], name=name, qoi='hmax', threshold=0.1)
+    pipeline.add('vector_predictions:' + name, vector_predictions, deps=['vector_emulators:' + name], analysis='mcs3')
+    pipeline.add('pem_vector:' + name, pem_vector, deps=['vector_emulators:' + name], stacks=[name + '_pem'])
+
+figures = {
+    'fig1': [],
+    'fig2': [],
+    'fig3': ['pem_moments:synth', 'mcs_moments:synth'],
+    'fig4': ['pem_moments:acheron', 'mcs_moments:acheron'],
+    'fig5': ['scalar_predictions:synth'],
+    'fig6': ['scalar_predictions:acheron'],
+    'fig7': ['vector_predictions:synth', 'pem_vector:synth'],
+    'fig8': ['vector_predictions:acheron', 'pem_vector:acheron'],
+}
+
+def get(name):
+    return pipeline.get(name)
@@ -1,11 +1,12 @@
 from frontiers_yildizetal.analysis import uq
+import artifacts
 import numpy as np
 from matplotlib.lines import Line2D
 import matplotlib.pyplot as plt
 import string
 
-pem_mom = uq.Moments('synth').get_pem()
-mcs_mom = uq.Moments('synth').get_mcs()
+pem_mom = artifacts.get('pem_moments:synth')
+mcs_mom = artifacts.get('mcs_moments:synth')
 
 f_names = list(uq.Moments.funcs.keys())
 scalars = list(pem_mom['mean'].keys())
@@ -1,11 +1,12 @@
 from frontiers_yildizetal.analysis import uq
+import artifacts
 import numpy as np
 from matplotlib.lines import Line2D
 import matplotlib.pyplot as plt
 import string
 
-pem_mom = uq.Moments('acheron').get_pem()
-mcs_mom = uq.Moments('acheron').get_mcs()
+pem_mom = artifacts.get('pem_moments:acheron')
+mcs_mom = artifacts.get('mcs_moments:acheron')
 
 f_names = list(uq.Moments.funcs.keys())
 scalars = list(pem_mom['mean'].keys())
@@ -1,16 +1,12 @@
-from frontiers_yildizetal.emulators import ScalarEmulators
 from frontiers_yildizetal.utilities import data
 import matplotlib.pyplot as plt
 import numpy as np
+import artifacts
 
-synth = ScalarEmulators('synth', threshold=0.1, loc_x=1000, loc_y=2000)
 input_mcs3 = data.load_input('synth','mcs3')
 
-scalars = list(synth.output.keys())
-
-predicted = {}
-for scalar in scalars:
-    predicted[scalar] = synth.predict_scalar(scalar, input_mcs3)[0]
+predicted = artifacts.get('scalar_predictions:synth')
+scalars = list(predicted.keys())
 
 (
     fig,
@@ -1,16 +1,12 @@
-from frontiers_yildizetal.emulators import ScalarEmulators
 from frontiers_yildizetal.utilities import data
 import matplotlib.pyplot as plt
 import numpy as np
+import artifacts
 
-acheron = ScalarEmulators('acheron', threshold=0.1, loc_x=1490100, loc_y=5204100)
 input_mcs3 = data.load_input('acheron','mcs3')
 
-scalars = list(acheron.output.keys())
-
-predicted = {}
-for scalar in scalars:
-    predicted[scalar] = acheron.predict_scalar(scalar, input_mcs3)[0]
+predicted = artifacts.get('scalar_predictions:acheron')
+scalars = list(predicted.keys())
 
 (
     fig,
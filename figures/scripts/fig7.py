@@ -1,35 +1,25 @@
-from frontiers_yildizetal.ravaflow import Simulations
-from frontiers_yildizetal.emulators import VectorEmulators
-from frontiers_yildizetal.utilities import data
 from pkg_resources import resource_filename
 import matplotlib.pyplot as plt
 import numpy as np
 import rasterio
+import artifacts
 
 path = 'files/raster/elev.tif'
 dem_path = resource_filename('frontiers_yildizetal', path)
 with rasterio.open(dem_path, 'r') as src:
     dem = src.read(1)
 
-synth = VectorEmulators('synth', qoi='hmax', threshold=0.1)
-input_mcs3 = data.load_input('synth','mcs3')
-
-mcs3_mean, mcs3_sd = synth.predict_vector(input_mcs3)
+synth = artifacts.get('vector_predictions:synth')
+mcs3_mean, mcs3_sd = synth['mean'], synth['sd']
 mcs3_mean_ma = np.ma.masked_where(mcs3_mean < 0.1, mcs3_mean, copy=True)
 mcs3_sd_ma = np.ma.masked_where(mcs3_mean < 0.1, mcs3_sd, copy=True)
 
-synth_pem = Simulations('synth_pem').create_vector(
-    qoi='hmax', threshold=0.1, valid_cols=synth.valid_cols
-)
+synth_pem = artifacts.get('pem_vector:synth')
 
-pem3_mean = np.zeros((1, synth.rows * synth.cols))
-pem3_mean[:,synth.valid_cols.nonzero()] = synth_pem[0][16:24].mean(axis=0)
-pem3_mean = pem3_mean.reshape(synth.rows, synth.cols)
+pem3_mean = synth['mask'].scatter(synth_pem[16:24].mean(axis=0), crop=False)
 pem3_mean_ma = np.ma.masked_where(pem3_mean < 0.1, pem3_mean, copy=True)
 
-pem3_sd = np.zeros((1, synth.rows * synth.cols))
-pem3_sd[:,synth.valid_cols.nonzero()] = synth_pem[0][16:24].std(axis=0)
-pem3_sd = pem3_sd.reshape(synth.rows, synth.cols)
+pem3_sd = synth['mask'].scatter(synth_pem[16:24].std(axis=0), crop=False)
 pem3_sd_ma = np.ma.masked_where(pem3_mean < 0.1, pem3_sd, copy=True)
 
 diff_mean = pem3_mean - mcs3_mean
@@ -1,11 +1,9 @@
-from frontiers_yildizetal.ravaflow import Simulations
-from frontiers_yildizetal.emulators import VectorEmulators
-from frontiers_yildizetal.utilities import data
 from pkg_resources import resource_filename
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import rasterio
+import artifacts
 from rasterio.plot import plotting_extent
 
 path = 'files/raster/hillshade_acheron.tif'
@@ -14,25 +12,17 @@ with rasterio.open(hill_path, 'r') as hill:
     hill_arr = hill.read(1)
 hill_ma = np.ma.masked_where(hill_arr < -30000, hill_arr, copy=True)
 
-ac = VectorEmulators('acheron', qoi='hmax', threshold=0.1)
-input_mcs3 = data.load_input('acheron','mcs3')
-
-mcs3_mean, mcs3_sd = ac.predict_vector(input_mcs3)
+ac = artifacts.get('vector_predictions:acheron')
+mcs3_mean, mcs3_sd = ac['mean'], ac['sd']
 mcs3_mean_ma = np.ma.masked_where(mcs3_mean < 0.1, mcs3_mean, copy=True)
 mcs3_sd_ma = np.ma.masked_where(mcs3_mean < 0.1, mcs3_sd, copy=True)
 
-ac_pem = Simulations('acheron_pem').create_vector(
-    qoi='hmax', threshold=0.1, valid_cols=ac.valid_cols
-)
+ac_pem = artifacts.get('pem_vector:acheron')
 
-pem3_mean = np.zeros((1, ac.rows * ac.cols))
-pem3_mean[:,ac.valid_cols.nonzero()] = ac_pem[0][16:24].mean(axis=0)
-pem3_mean = pem3_mean.reshape(ac.rows, ac.cols)
+pem3_mean = ac['mask'].scatter(ac_pem[16:24].mean(axis=0), crop=False)
 pem3_mean_ma = np.ma.masked_where(pem3_mean < 0.1, pem3_mean, copy=True)
 
-pem3_sd = np.zeros((1, ac.rows * ac.cols))
-pem3_sd[:,ac.valid_cols.nonzero()] = ac_pem[0][16:24].std(axis=0)
-pem3_sd = pem3_sd.reshape(ac.rows, ac.cols)
+pem3_sd = ac['mask'].scatter(ac_pem[16:24].std(axis=0), crop=False)
 pem3_sd_ma = np.ma.masked_where(pem3_mean < 0.1, pem3_sd, copy=True)
 
 diff_mean = pem3_mean - mcs3_mean
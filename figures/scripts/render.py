@@ -0,0 +1,23 @@
+import argparse
+import multiprocessing
+import os
+import runpy
+from concurrent.futures import ProcessPoolExecutor
+import artifacts
+
+def render(figure):
+    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), figure + '.py'), run_name='__main__')
+    return figure
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the shared artifacts and renders the figures in parallel')
+    parser.add_argument('figures', nargs='*', default=list(artifacts.figures.keys()), help='figures to render, e.g. fig3 fig7')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    needed = [name for figure in args.figures for name in artifacts.figures[figure]]
+    artifacts.pipeline.run(needed, workers=args.workers)
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for figure in executor.map(render, args.figures):
+            print(figure + ' rendered.')
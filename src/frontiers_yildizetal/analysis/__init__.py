@@ -1 +1 @@
-from frontiers_yildizetal.analysis import lateral_spread, uq
\ No newline at end of file
+from frontiers_yildizetal.analysis import design, lateral_spread, quantiles, sensitivity, uq
\ No newline at end of file
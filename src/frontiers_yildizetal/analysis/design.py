@@ -0,0 +1,169 @@
+import copy
+import numpy as np
+from scipy.stats import qmc
+
+def candidates(design:np.ndarray, size:int, seed=None) -> np.ndarray:
+    """ Draws a Latin hypercube of candidate inputs within the ranges of a design
+
+    Args:
+        design (np.ndarray): training design, e.g. ScalarEmulators.input_train, with one input variable per column
+        size (int): number of candidates
+        seed (int, optional): seed of the sampler. Defaults to None.
+
+    Raises:
+        ValueError: size must be positive
+
+    Returns:
+        np.ndarray: candidate inputs (rows)
+    """
+    if size < 1:
+        raise ValueError('size must be positive')
+    design = np.asarray(design)
+    sample = qmc.LatinHypercube(d=design.shape[1], seed=seed).random(size)
+    return qmc.scale(sample, design.min(axis=0), design.max(axis=0))
+
+def _variance(emulator, points:np.ndarray, batch_size:int) -> np.ndarray:
+    return np.concatenate([emulator.covariance(points[start:start + batch_size])
+                           for start in range(0, len(points), batch_size)])
+
+def scores(emulator, points:np.ndarray, criterion:str='ivr', reference:np.ndarray=None, batch_size:int=1000,
+           nugget:float=1e-6, neighbours:int=50) -> np.ndarray:
+    """ Scores candidate inputs for the next simulation
+
+    All criteria use the posterior covariance of the emulator, which does not depend on the
+    responses and is shared by all cells of a vector emulator. The candidates are scored in batches
+    of batch_size, so large candidate sets are scored with a few vectorised linear solves.
+
+    variance is the predictive variance at the candidate. ivr is the integrated variance reduction
+    over the reference inputs if the candidate were simulated, i.e. the mean of cov(r, c)^2 / var(c)
+    over the reference inputs r. mice is the mutual information criterion of Beck and Guillas (2016),
+    the ratio of the variance at the candidate given the design to its prior variance given the other
+    candidates. As suggested there, the latter is conditioned on the neighbours most correlated
+    with the candidate only, so it costs a small solve per candidate instead of inverting the
+    correlation matrix of all candidates.
+
+    Args:
+        emulator (IncrementalGP): fitted emulator, e.g. ScalarEmulators.incremental or VectorEmulators.incremental
+        points (np.ndarray): candidate inputs (rows)
+        criterion (str, optional): variance, ivr or mice. Defaults to ivr.
+        reference (np.ndarray, optional): inputs over which ivr is integrated. Defaults to at most 1000 evenly spaced candidates.
+        batch_size (int, optional): number of candidates per batch. Defaults to 1000.
+        nugget (float, optional): nugget of the variances given the other candidates in mice. Defaults to 1e-6.
+        neighbours (int, optional): number of other candidates that the variances in mice are conditioned on. Defaults to 50.
+
+    Raises:
+        Exception: Invalid criterion. It must be variance, ivr or mice.
+
+    Returns:
+        np.ndarray: score of every candidate, the larger the better
+    """
+    if criterion not in ['variance', 'ivr', 'mice']:
+        raise Exception('Invalid criterion. It must be variance, ivr or mice.')
+    points = np.asarray(points, dtype=np.float64)
+    return _scores(emulator, points, criterion, _reference(points, reference), batch_size, nugget, neighbours)
+
+def _reference(points:np.ndarray, reference:np.ndarray) -> np.ndarray:
+    if reference is not None:
+        return np.asarray(reference, dtype=np.float64)
+    return points[::max(1, len(points) // 1000)]
+
+def _given_others(emulator, points:np.ndarray, nugget:float, neighbours:int, batch_size:int, available:np.ndarray=None,
+                  rows:np.ndarray=None):
+    # the prior variance of every candidate in rows given its most correlated other available
+    # candidates, with the indices of these neighbours to update it after every choice
+    available = np.flatnonzero(np.ones(len(points), dtype=bool) if available is None else available)
+    rows = np.arange(len(points)) if rows is None else np.asarray(rows)
+    size = max(min(neighbours, len(available) - 1), 0)
+    given = np.full(len(rows), 1 + nugget)
+    index = np.empty((len(rows), size), dtype=np.int64)
+    if size == 0:
+        return given, index
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        corr = emulator.correlation(points[batch], points[available])
+        corr[available[np.newaxis, :] == batch[:, np.newaxis]] = -np.inf
+        top = np.argpartition(-corr, size - 1, axis=1)[:, :size]
+        cov = np.take_along_axis(corr, top, axis=1)
+        near = available[top]
+        own = np.stack([emulator.correlation(points[cells], points[cells]) for cells in near]) + nugget * np.eye(size)
+        given[start:start + batch_size] -= np.sum(cov * np.linalg.solve(own, cov[..., np.newaxis])[..., 0], axis=1)
+        index[start:start + batch_size] = near
+    return given, index
+
+def _scores(emulator, points, criterion, reference, batch_size, nugget, neighbours, given_others=None) -> np.ndarray:
+    variance = np.maximum(_variance(emulator, points, batch_size), 0) + emulator.nugget
+
+    if criterion == 'variance':
+        return variance
+    if criterion == 'ivr':
+        reduction = np.empty(len(points))
+        for start in range(0, len(points), batch_size):
+            cov = emulator.covariance(reference, points[start:start + batch_size])
+            reduction[start:start + batch_size] = np.mean(cov ** 2, axis=0) / variance[start:start + batch_size]
+        return reduction
+
+    if given_others is None:
+        given_others, _ = _given_others(emulator, points, nugget, neighbours, batch_size)
+    return variance / given_others
+
+def propose(emulators, points:np.ndarray, size:int, criterion:str='ivr', reference:np.ndarray=None,
+            batch_size:int=1000, nugget:float=1e-6, neighbours:int=50) -> np.ndarray:
+    """ Proposes a batch of inputs for new simulations
+
+    The batch is chosen greedily. After every choice, the emulators are updated with the chosen
+    input as if it had been simulated, which changes the posterior covariance but not the
+    hyperparameters, so the next choice accounts for the earlier ones. In mice, the chosen input
+    is also removed from the other candidates, and the variances of the candidates that had it as
+    a neighbour are conditioned on their next neighbours. Several emulators, e.g. of
+    all scalars, are combined by summing their scores normalised to a maximum of one.
+
+    Args:
+        emulators (IncrementalGP, list): fitted emulator or emulators
+        points (np.ndarray): candidate inputs (rows), e.g. from candidates
+        size (int): number of inputs to propose
+        criterion (str, optional): variance, ivr or mice. Defaults to ivr.
+        reference (np.ndarray, optional): inputs over which ivr is integrated. Defaults to at most 1000 evenly spaced candidates.
+        batch_size (int, optional): number of candidates per batch. Defaults to 1000.
+        nugget (float, optional): nugget of the variances given the other candidates in mice. Defaults to 1e-6.
+        neighbours (int, optional): number of other candidates that the variances in mice are conditioned on. Defaults to 50.
+
+    Raises:
+        ValueError: size must be between 1 and the number of candidates
+        Exception: Invalid criterion. It must be variance, ivr or mice.
+
+    Returns:
+        np.ndarray: proposed inputs (rows) in the order of choice
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if size < 1 or size > len(points):
+        raise ValueError('size must be between 1 and the number of candidates')
+    # update replaces the arrays of an emulator instead of changing them, so shallow copies suffice
+    emulators = [copy.copy(emulator) for emulator in (emulators if isinstance(emulators, (list, tuple)) else [emulators])]
+    for emulator in emulators:
+        emulator.drift_threshold = None
+
+    if criterion not in ['variance', 'ivr', 'mice']:
+        raise Exception('Invalid criterion. It must be variance, ivr or mice.')
+    reference = _reference(points, reference)
+    given_others = [_given_others(emulator, points, nugget, neighbours, batch_size) if criterion == 'mice' else (None, None)
+                    for emulator in emulators]
+
+    chosen = []
+    available = np.ones(len(points), dtype=bool)
+    for _ in range(size):
+        total = np.zeros(len(points))
+        for emulator, (given, _) in zip(emulators, given_others):
+            score = _scores(emulator, points, criterion, reference, batch_size, nugget, neighbours, given)
+            total += score / max(score[available].max(), np.finfo(float).tiny)
+        index = int(np.flatnonzero(available)[np.argmax(total[available])])
+        chosen.append(index)
+        available[index] = False
+        for emulator, (given, near) in zip(emulators, given_others):
+            mean, _ = emulator.predict(points[index])
+            emulator.update(points[index], mean)
+            if given is not None:
+                rows = np.flatnonzero(available & np.any(near == index, axis=1))
+                given[rows], updated = _given_others(emulator, points, nugget, neighbours, batch_size, available, rows)
+                near[rows, :updated.shape[1]] = updated
+                near[rows, updated.shape[1]:] = -1
+    return points[chosen]
@@ -1,34 +1,414 @@
 import rasterio
 import numpy as np
 import pandas as pd
+import os
+from rasterio.windows import Window
+from frontiers_yildizetal.analysis.quantiles import QuantileSketch
+from frontiers_yildizetal.utilities import memory, tracing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-def calculate(raster_path, threshold):
+def column_counts(data:np.ndarray, threshold:float) -> np.ndarray:
+    """ counts the flow cells in every raster column
+
+    A cell belongs to the flow if its value is not below the threshold and not zero.
+
+    Args:
+        data (np.ndarray): flow heights of one or more simulations with shape (..., rows, cols)
+        threshold (float): threshold of flow height, e.g. 0.1 m
+
+    Returns:
+        np.ndarray: number of flow cells with shape (..., cols)
+    """
+    return np.count_nonzero(~(data < threshold) & (data != 0), axis=-2)
+
+def reduce_counts(counts:np.ndarray):
+    """ finds the widest column of each simulation
+
+    Args:
+        counts (np.ndarray): number of flow cells per column with shape (n_sims, cols)
+
+    Returns:
+        column (np.ndarray): raster column of the maximum lateral spread, -1 if there is no flow
+        index (np.ndarray): position of that column among the columns occupied by the flow, -1 if there is no flow
+        width (np.ndarray): number of flow cells in that column
+    """
+    column = np.argmax(counts, axis=-1)
+    width = np.take_along_axis(counts, column[:, np.newaxis], axis=-1)[:, 0]
+    occupied = np.cumsum(counts > 0, axis=-1)
+    index = np.take_along_axis(occupied, column[:, np.newaxis], axis=-1)[:, 0] - 1
+    column = np.where(width > 0, column, -1)
+    index = np.where(width > 0, index, -1)
+    return column, index, width
+
+def _band_counts(raster_path, threshold, bands, block_rows=None):
+    with tracing.span('raster_open', path=raster_path):
+        src = rasterio.open(raster_path)
+    counts = []
+    with src:
+        block_rows = block_rows or src.height
+        for band in bands:
+            band_counts = np.zeros(src.width, dtype=np.int64)
+            for row in range(0, src.height, block_rows):
+                window = Window(0, row, src.width, min(block_rows, src.height - row))
+                with tracing.span('band_decode', band=int(band) + 1):
+                    values = src.read(int(band) + 1, window=window)
+                with tracing.span('reduction', band=int(band) + 1):
+                    band_counts += column_counts(values, threshold)
+            counts.append(band_counts)
+    return np.stack(counts)
+
+def calculate(raster_path, threshold, workers=None, executor='thread'):
     """ calculates the maximum lateral spread and finds its location
 
+    Lateral spread is the number of flow cells in a raster column multiplied by the resolution.
+    The location of the maximum is given in three ways. location is the distance res * index,
+    where index is the position of the widest column among the columns occupied by the flow,
+    which is the definition used in Yildiz et al. (2022). It is the distance from the first column
+    that the flow reaches only if the footprint has no empty columns. column is the raster column,
+    and x is the absolute x coordinate of the centre of that column. If a simulation has no flow
+    cells, its value is 0 and its location, index, column and x are NaN or -1.
+
     Args:
         raster_path (str): path of the hmax_stack.tif raster file
         threshold (float): threshold of flow height, e.g. 0.1 m
+        workers (int, optional): number of parallel workers. Defaults to the number of processors.
+        executor (str, optional): thread or process pool. Defaults to thread.
+
+    Raises:
+        ValueError: executor must be thread or process
 
     Returns:
-        Pandas DataFrame: a data frame with two columns, i.e. location and value of the maximum lateral spread
+        Pandas DataFrame: a data frame with the location and value of the maximum lateral spread, and
+        index, column and x of its location
     """
+    if executor not in ['thread', 'process']:
+        raise ValueError('executor must be thread or process')
+
     with rasterio.open(raster_path) as src:
         sim_size = src.count
-        res= src.res[0]
-        
-        max_vals = []
-        max_locs = []
-        for i in range(sim_size):
-            data = np.where(src.read(i+1) < threshold, 0, src.read(i+1))
-            columns = np.unique(np.nonzero(data)[1]).tolist()
-    
-            rows = []
-            for col in columns:
-                rows.append(len(np.nonzero(data[:,col])[0]))
-            max_loc = res * np.argmax(rows)
-            max_val = res * np.max(rows)
-            max_vals.append(max_val)
-            max_locs.append(max_loc)
-    
-    lateral = pd.DataFrame({'location':max_locs, 'value':max_vals})
-    return lateral
\ No newline at end of file
+        res = src.res[0]
+        transform = src.transform
+        # a block of rows is held with its dtype and the masks of column_counts
+        row_bytes = src.width * (np.dtype(src.dtypes[0]).itemsize + 3)
+        height = src.height
+        width = src.width
+
+    n_chunks = max(1, min(sim_size, workers or os.cpu_count() or 1))
+    block_rows = memory.rows_within(row_bytes, height, share=0.5 / n_chunks)
+    if block_rows < height:
+        n_chunks = max(1, min(n_chunks, memory.rows_within(row_bytes * height, n_chunks, share=0.5)))
+        block_rows = memory.rows_within(row_bytes, height, share=0.5 / n_chunks)
+    memory.report('lateral_spread', workers=n_chunks, block_rows=block_rows, storage='ram')
+
+    chunks = np.array_split(np.arange(sim_size), n_chunks)
+    if sim_size == 0:
+        counts = np.zeros((0, width), dtype=np.int64)
+    else:
+        pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+        with pool(max_workers=n_chunks) as ex:
+            counts = np.concatenate(list(ex.map(_band_counts, [raster_path] * n_chunks, [threshold] * n_chunks, chunks,
+                                                [block_rows] * n_chunks)))
+
+    column, index, width = reduce_counts(counts)
+    x = transform.c + (column + 0.5) * transform.a
+
+    lateral = pd.DataFrame({
+        'location':np.where(index >= 0, res * index, np.nan),
+        'value':res * width,
+        'index':index,
+        'column':column,
+        'x':np.where(column >= 0, x, np.nan),
+    })
+    return lateral
+
+def emulated(emulator, input_pred, threshold, batch_size=100, k=200, seed=None):
+    """ calculates the maximum lateral spread of hazard maps predicted by a vector emulator
+
+    The predictions are processed in batches, so that any number of scenarios can be used without
+    holding all maps in memory or writing rasters. The flow cells of a batch are counted per raster
+    column directly from the valid cells, which is the same as reconstructing the maps on the grid
+    and applying column_counts. The distribution of the results is kept in quantile sketches.
+
+    Args:
+        emulator (VectorEmulators): vector emulator of hmax
+        input_pred (np.ndarray): input dataset of the scenarios
+        threshold (float): threshold of flow height, e.g. 0.1 m
+        batch_size (int, optional): number of scenarios per prediction call. Defaults to 100.
+        k (int, optional): capacity of the top level of the sketches. Defaults to 200.
+        seed (int, optional): seed of the random compaction offsets. Defaults to None.
+
+    Returns:
+        spread (dict): quantile sketches of the value and the x coordinate of the maximum lateral spread, and
+        the number of scenarios without flow cells
+    """
+    cells = emulator.mask.indices
+    cell_cols = cells % emulator.cols
+
+    spread = {'value':QuantileSketch(k=k, seed=seed), 'x':QuantileSketch(k=k, seed=seed), 'no_flow':0}
+    for predicted in emulator.predict_batches(input_pred, batch_size=batch_size):
+        flooded = ~(predicted < threshold) & (predicted != 0)
+        offsets = np.arange(predicted.shape[0])[:, np.newaxis] * emulator.cols
+        counts = np.bincount((offsets + cell_cols).ravel(), weights=flooded.ravel(),
+                             minlength=predicted.shape[0] * emulator.cols)
+        column, _, width = reduce_counts(counts.reshape(predicted.shape[0], emulator.cols))
+
+        spread['value'].update(emulator.res * width)
+        has_flow = column >= 0
+        spread['x'].update(emulator.transform.c + (column[has_flow] + 0.5) * emulator.transform.a)
+        spread['no_flow'] += int(np.count_nonzero(~has_flow))
+    return spread
+
+def frequency(raster_path, threshold) -> np.ndarray:
+    """ calculates the flow frequency, i.e. the fraction of simulations in which a cell is flooded
+
+    Args:
+        raster_path (str): path of the hmax_stack.tif raster file
+        threshold (float): threshold of flow height, e.g. 0.1 m
+
+    Returns:
+        np.ndarray: flow frequency with the shape of the raster
+    """
+    with rasterio.open(raster_path) as src:
+        grid = np.zeros((src.height, src.width), dtype=memory.get_dtype())
+        for band in range(src.count):
+            with tracing.span('band_decode', band=band + 1):
+                data = src.read(band + 1)
+            grid += ~(data < threshold) & (data != 0)
+        grid /= src.count
+    return grid
+
+def flow_path(raster_path, threshold, n_points=50, frequency_grid=None):
+    """ derives a centerline of the flow from a stack of simulations
+
+    The flow frequency, i.e. the fraction of simulations in which a cell is flooded, is used as weight.
+    The footprint is projected on its principal axis, divided into n_points bins along the axis, and
+    the weighted centroid of every bin becomes a vertex of the centerline.
+
+    Args:
+        raster_path (str): path of the hmax_stack.tif raster file
+        threshold (float): threshold of flow height, e.g. 0.1 m
+        n_points (int, optional): number of vertices of the centerline. Defaults to 50.
+        frequency_grid (np.ndarray, optional): flow frequency of the stack, e.g. from an earlier call of frequency. Defaults to None, i.e. calculated.
+
+    Raises:
+        ValueError: there are no flow cells in the stack
+
+    Returns:
+        centerline (np.ndarray): x and y coordinates of the vertices with shape (n_points, 2)
+        half_width (float): largest distance of the footprint from the principal axis
+    """
+    if frequency_grid is None:
+        frequency_grid = frequency(raster_path, threshold)
+    with rasterio.open(raster_path) as src:
+        transform = src.transform
+        res = src.res[0]
+        frequency_grid = frequency_grid.reshape(src.height, src.width)
+
+    rows, cols = np.nonzero(frequency_grid)
+    if rows.size == 0:
+        raise ValueError('there are no flow cells in the stack')
+    weights = frequency_grid[rows, cols]
+    xs = transform.c + (cols + 0.5) * transform.a + (rows + 0.5) * transform.b
+    ys = transform.f + (cols + 0.5) * transform.d + (rows + 0.5) * transform.e
+    coords = np.column_stack([xs, ys])
+
+    centroid = np.average(coords, axis=0, weights=weights)
+    cov = np.cov((coords - centroid).T, aweights=weights)
+    axis = np.linalg.eigh(cov)[1][:, -1]
+    along = (coords - centroid) @ axis
+    across = (coords - centroid) @ np.array([-axis[1], axis[0]])
+
+    edges = np.linspace(along.min(), along.max(), n_points + 1)
+    bins = np.clip(np.digitize(along, edges) - 1, 0, n_points - 1)
+    bin_weights = np.bincount(bins, weights=weights, minlength=n_points)
+    filled = bin_weights > 0
+    centerline = np.column_stack([
+        np.bincount(bins, weights=weights * xs, minlength=n_points)[filled] / bin_weights[filled],
+        np.bincount(bins, weights=weights * ys, minlength=n_points)[filled] / bin_weights[filled],
+    ])
+    half_width = np.abs(across).max() + res
+    return centerline, half_width
+
+class Transects:
+    """
+    A class to represent transects perpendicular to a centerline
+
+    The stations are placed along the centerline at a fixed spacing, and every transect is sampled at
+    a fixed step between -half_width and half_width. The raster indices of the samples are computed
+    once, so that widths of any number of simulations are gathered either from the bounding window
+    of all samples or, with read, from the raster blocks that contain samples only.
+
+    Attributes:
+        stations (Pandas DataFrame): distance along the centerline, x and y of every station
+        shape (tuple): rows and columns of the raster
+        cells (np.ndarray): flat indices of the samples in the raster with shape (n_stations, n_samples), -1 outside the raster
+        window (rasterio Window): bounding window of all samples
+        indices (np.ndarray): flat indices of the samples in the window with shape (n_stations, n_samples), -1 outside the raster
+        step (float): distance between two samples of a transect
+
+    Methods:
+        read(src, valid): reads the samples of all simulations
+        widths(data, threshold): calculates the flow widths along the transects from the window
+        sample_widths(samples, threshold): calculates the flow widths along the transects from the samples
+    """
+    def __init__(self, centerline, transform, shape, spacing, half_width, step=None):
+        """
+        Initialising Transects class
+
+        Args:
+            centerline (np.ndarray): x and y coordinates of the vertices of the centerline with shape (n, 2)
+            transform (Affine): affine transform of the raster
+            shape (tuple): rows and columns of the raster
+            spacing (float): distance between two stations along the centerline
+            half_width (float): half of the length of a transect
+            step (float, optional): distance between two samples of a transect. Defaults to the resolution.
+
+        Raises:
+            ValueError: centerline must have at least two vertices
+            ValueError: spacing, half_width and step must be positive
+        """
+        centerline = np.asarray(centerline, dtype=float)
+        if centerline.ndim != 2 or centerline.shape[0] < 2:
+            raise ValueError('centerline must have at least two vertices')
+        step = abs(transform.a) if step is None else step
+        if spacing <= 0 or half_width <= 0 or step <= 0:
+            raise ValueError('spacing, half_width and step must be positive')
+
+        keep = np.concatenate([[True], np.diff(centerline, axis=0).any(axis=1)])
+        centerline = centerline[keep]
+        if centerline.shape[0] < 2:
+            raise ValueError('centerline must have at least two vertices')
+        segments = np.diff(centerline, axis=0)
+        lengths = np.hypot(segments[:, 0], segments[:, 1])
+        vertices = np.concatenate([[0], np.cumsum(lengths)])
+        distance = np.arange(0, vertices[-1] + spacing / 2, spacing)
+        x = np.interp(distance, vertices, centerline[:, 0])
+        y = np.interp(distance, vertices, centerline[:, 1])
+
+        segment = np.clip(np.searchsorted(vertices, distance, side='right') - 1, 0, len(lengths) - 1)
+        tangent = segments[segment] / lengths[segment, np.newaxis]
+        normal = np.column_stack([-tangent[:, 1], tangent[:, 0]])
+        offsets = np.arange(-half_width, half_width + step / 2, step)
+
+        sample_x = x[:, np.newaxis] + offsets * normal[:, [0]]
+        sample_y = y[:, np.newaxis] + offsets * normal[:, [1]]
+        inverse = ~transform
+        cols = np.floor(inverse.a * sample_x + inverse.b * sample_y + inverse.c).astype(int)
+        rows = np.floor(inverse.d * sample_x + inverse.e * sample_y + inverse.f).astype(int)
+        inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+        if not inside.any():
+            raise ValueError('transects do not intersect the raster')
+
+        row_off, col_off = rows[inside].min(), cols[inside].min()
+        height = rows[inside].max() - row_off + 1
+        width = cols[inside].max() - col_off + 1
+
+        self.stations = pd.DataFrame({'distance':distance, 'x':x, 'y':y})
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.cells = np.where(inside, rows * shape[1] + cols, -1)
+        self.window = Window(col_off, row_off, width, height)
+        self.indices = np.where(inside, (rows - row_off) * width + (cols - col_off), -1)
+        self.step = step
+
+    def widths(self, data:np.ndarray, threshold:float) -> np.ndarray:
+        """ calculates the flow widths along the transects
+
+        Args:
+            data (np.ndarray): flow heights in the window with shape (n_sims, window rows, window cols)
+            threshold (float): threshold of flow height, e.g. 0.1 m
+
+        Returns:
+            np.ndarray: flow widths with shape (n_sims, n_stations)
+        """
+        flat = data.reshape(data.shape[0], -1)
+        samples = flat[:, np.maximum(self.indices, 0)]
+        return self.sample_widths(np.where(self.indices >= 0, samples, 0), threshold)
+
+    def sample_widths(self, samples:np.ndarray, threshold:float) -> np.ndarray:
+        """ calculates the flow widths along the transects from the samples, e.g. of read
+
+        Args:
+            samples (np.ndarray): flow heights of the samples with shape (n_sims, n_stations, n_samples), 0 outside the raster
+            threshold (float): threshold of flow height, e.g. 0.1 m
+
+        Returns:
+            np.ndarray: flow widths with shape (n_sims, n_stations)
+        """
+        flooded = ~(samples < threshold) & (samples != 0)
+        return self.step * np.count_nonzero(flooded, axis=-1)
+
+    def read(self, src, valid:np.ndarray=None) -> np.ndarray:
+        """ reads the samples of all simulations from the raster blocks that contain them
+
+        The samples are grouped by the internal blocks of the raster, and every block is read only
+        within the bounding window of its samples, so the bounding window of all transects is never
+        read as a whole.
+
+        Args:
+            src (rasterio.DatasetReader): raster of the stack with the shape of the transects
+            valid (np.ndarray, optional): cells that are flooded in any simulation, e.g. frequency > 0. Other samples are not read. Defaults to None, i.e. all.
+
+        Returns:
+            np.ndarray: flow heights of the samples with shape (n_sims, n_stations, n_samples), 0 outside the raster or the valid cells
+        """
+        cells = self.cells.reshape(-1)
+        wanted = cells >= 0
+        if valid is not None:
+            wanted &= np.asarray(valid).reshape(-1)[np.maximum(cells, 0)] != 0
+        positions = np.flatnonzero(wanted)
+        rows, cols = cells[positions] // self.shape[1], cells[positions] % self.shape[1]
+
+        block_rows, block_cols = src.block_shapes[0]
+        blocks = (rows // block_rows) * (-(-self.shape[1] // block_cols)) + cols // block_cols
+        order = np.argsort(blocks, kind='stable')
+        starts = np.flatnonzero(np.diff(blocks[order], prepend=-1))
+
+        samples = np.zeros((src.count, cells.size), dtype=src.dtypes[0])
+        with tracing.span('band_decode', blocks=len(starts), samples=len(positions)):
+            for group in np.split(order, starts[1:]):
+                if group.size == 0:
+                    continue
+                row_off, col_off = rows[group].min(), cols[group].min()
+                window = Window(col_off, row_off, cols[group].max() - col_off + 1, rows[group].max() - row_off + 1)
+                data = src.read(window=window)
+                samples[:, positions[group]] = data[:, rows[group] - row_off, cols[group] - col_off]
+        return samples.reshape((src.count,) + self.cells.shape)
+
+def profiles(raster_path, threshold, centerline=None, spacing=None, half_width=None, step=None):
+    """ calculates lateral spread profiles along transects perpendicular to a centerline
+
+    Unlike calculate, which measures the spread along raster columns, the profiles follow the flow
+    direction. If no centerline is given, it is derived from the stack with flow_path, and the
+    frequency grid of that pass limits the samples that are read to the cells flooded in any
+    simulation. Only the raster blocks that contain such samples are read.
+
+    Args:
+        raster_path (str): path of the hmax_stack.tif raster file
+        threshold (float): threshold of flow height, e.g. 0.1 m
+        centerline (np.ndarray, optional): x and y coordinates of the vertices of the centerline. Defaults to None.
+        spacing (float, optional): distance between two stations along the centerline. Defaults to the resolution.
+        half_width (float, optional): half of the length of a transect. Required if centerline is given.
+        step (float, optional): distance between two samples of a transect. Defaults to the resolution.
+
+    Raises:
+        ValueError: half_width must be given with a centerline
+
+    Returns:
+        widths (np.ndarray): flow widths with shape (n_sims, n_stations)
+        stations (Pandas DataFrame): distance along the centerline, x and y of every station
+    """
+    valid = None
+    if centerline is None:
+        valid = frequency(raster_path, threshold)
+        centerline, auto_width = flow_path(raster_path, threshold, frequency_grid=valid)
+        half_width = auto_width if half_width is None else half_width
+    elif half_width is None:
+        raise ValueError('half_width must be given with a centerline')
+
+    with rasterio.open(raster_path) as src:
+        spacing = src.res[0] if spacing is None else spacing
+        transects = Transects(centerline, src.transform, (src.height, src.width), spacing, half_width, step)
+        samples = transects.read(src, valid)
+
+    widths = transects.sample_widths(samples, threshold)
+    return widths, transects.stations
@@ -0,0 +1,227 @@
+import numpy as np
+
+class QuantileSketch:
+    """
+    A class to represent mergeable quantile sketches of emulator outputs
+
+    The sketch follows the compactor hierarchy of Karnin, Lang and Liberty (2016), KLL. Each level
+    stores items that represent 2**level values. When a level exceeds its capacity, it is sorted and
+    every second item is promoted to the next level. A sketch holds one stream per element of shape,
+    e.g. one stream per valid cell of a vector emulator. All streams receive the same number of
+    values, so they share the compaction schedule and are updated at once.
+
+    Attributes:
+        k (int): Capacity of the top level. Controls the accuracy and the memory of the sketch
+        shape (tuple): Shape of a single value, i.e. () for scalars or (n_cells,) for vector outputs
+        count (int): Number of values added to each stream
+        levels (list): Compactor levels of shape shape + (n_items,)
+
+    Methods:
+        update(values): adds a batch of values to the streams
+        merge(other): merges another sketch into this one
+        quantile(q): returns the estimated quantiles of every stream
+        save(path): writes the sketch into a .npz file
+        load(path): reads a sketch from a .npz file
+    """
+    decay = 2 / 3
+
+    def __init__(self, k:int=200, shape:tuple=(), seed=None):
+        """
+        Initialising QuantileSketch class
+
+        Args:
+            k (int, optional): Capacity of the top level. Defaults to 200.
+            shape (tuple, optional): Shape of a single value. Defaults to ().
+            seed (int, optional): Seed of the random compaction offsets. Defaults to None.
+
+        Raises:
+            TypeError: k must be an integer
+            ValueError: k must be at least 2
+        """
+        if not isinstance(k, int):
+            raise TypeError('k must be an integer')
+        if k < 2:
+            raise ValueError('k must be at least 2')
+
+        self.k = k
+        self.shape = tuple(shape)
+        self.count = 0
+        self.levels = [np.empty(self.shape + (0,))]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level:int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * self.decay ** depth)))
+
+    def _compact(self, level:int):
+        items = np.sort(self.levels[level], axis=-1)
+        n_even = items.shape[-1] - items.shape[-1] % 2
+        offset = self._rng.integers(2)
+        promoted = items[..., offset:n_even:2]
+        self.levels[level] = items[..., n_even:]
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(self.shape + (0,)))
+        self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted], axis=-1)
+
+    def _compress(self):
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.levels)):
+                if self.levels[level].shape[-1] > self._capacity(level):
+                    self._compact(level)
+                    compacted = True
+
+    def update(self, values:np.ndarray):
+        """
+        Adds a batch of values to the streams
+
+        Args:
+            values (np.ndarray): Values with the batch on the first axis, e.g. predicted means from an emulator
+
+        Raises:
+            ValueError: values do not match the shape of the sketch
+        """
+        values = np.asarray(values, dtype=float)
+        if values.shape[1:] != self.shape:
+            raise ValueError('values do not match the shape of the sketch')
+
+        self.levels[0] = np.concatenate([self.levels[0], np.moveaxis(values, 0, -1)], axis=-1)
+        self.count += values.shape[0]
+        self._compress()
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one
+
+        Args:
+            other (QuantileSketch): Sketch of the same streams, e.g. from another run
+
+        Raises:
+            TypeError: other must be a QuantileSketch
+            ValueError: sketches must have the same k and shape
+        """
+        if not isinstance(other, QuantileSketch):
+            raise TypeError('other must be a QuantileSketch')
+        if other.k != self.k or other.shape != self.shape:
+            raise ValueError('sketches must have the same k and shape')
+
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(self.shape + (0,)))
+            self.levels[level] = np.concatenate([self.levels[level], items], axis=-1)
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q) -> np.ndarray:
+        """
+        Estimates quantiles of every stream
+
+        Args:
+            q (float, list): Quantile or quantiles between 0 and 1, e.g. [0.05, 0.5, 0.95, 0.99]
+
+        Raises:
+            ValueError: the sketch is empty
+            ValueError: quantiles must be between 0 and 1
+
+        Returns:
+            np.ndarray: Estimated quantiles with shape (len(q),) + shape, or shape for a single quantile
+        """
+        if self.count == 0:
+            raise ValueError('the sketch is empty')
+        q_arr = np.atleast_1d(np.asarray(q, dtype=float))
+        if np.any((q_arr < 0) | (q_arr > 1)):
+            raise ValueError('quantiles must be between 0 and 1')
+
+        items = np.concatenate(self.levels, axis=-1)
+        weights = np.concatenate([np.full(lev.shape[-1], 2 ** i) for i, lev in enumerate(self.levels)])
+        order = np.argsort(items, axis=-1)
+        items = np.take_along_axis(items, order, axis=-1)
+        cum_weights = np.cumsum(weights[order], axis=-1)
+
+        estimates = []
+        for quant in q_arr:
+            rank = quant * cum_weights[..., -1:]
+            idx = np.minimum(np.sum(cum_weights < rank, axis=-1, keepdims=True), items.shape[-1] - 1)
+            estimates.append(np.take_along_axis(items, idx, axis=-1)[..., 0])
+        estimates = np.stack(estimates)
+        return estimates if np.ndim(q) else estimates[0]
+
+    def save(self, path:str):
+        """
+        Writes the sketch into a .npz file
+
+        Args:
+            path (str): Path of the file
+        """
+        levels = {'level_' + str(i): lev for i, lev in enumerate(self.levels)}
+        np.savez_compressed(path, k=self.k, shape=np.array(self.shape, dtype=int), count=self.count, **levels)
+
+    @classmethod
+    def load(cls, path:str, seed=None):
+        """
+        Reads a sketch from a .npz file
+
+        Args:
+            path (str): Path of the file
+            seed (int, optional): Seed of the random compaction offsets. Defaults to None.
+
+        Returns:
+            QuantileSketch: Sketch stored in the file
+        """
+        with np.load(path) as stored:
+            sketch = cls(k=int(stored['k']), shape=tuple(int(i) for i in stored['shape']), seed=seed)
+            sketch.count = int(stored['count'])
+            n_levels = len([key for key in stored.files if key.startswith('level_')])
+            sketch.levels = [stored['level_' + str(i)] for i in range(n_levels)]
+        return sketch
+
+def scalar_sketches(emulator, input_pred:np.ndarray, batch_size:int=1000, k:int=200, seed=None) -> dict:
+    """ Feeds the predictions of every scalar of a ScalarEmulators object into quantile sketches
+
+    Args:
+        emulator (ScalarEmulators): Emulators of the scalars
+        input_pred (np.ndarray): Input testing dataset to perform prediction
+        batch_size (int, optional): Number of input samples per prediction call. Defaults to 1000.
+        k (int, optional): Capacity of the top level of the sketches. Defaults to 200.
+        seed (int, optional): Seed of the random compaction offsets. Defaults to None.
+
+    Returns:
+        sketches (dict): A dictionary of quantile sketches according to scalars
+    """
+    sketches = {}
+    for scalar in emulator.output.keys():
+        sketches[scalar] = QuantileSketch(k=k, seed=seed)
+        for predicted in emulator.predict_batches(scalar, input_pred, batch_size=batch_size):
+            sketches[scalar].update(predicted)
+    return sketches
+
+def vector_sketch(emulator, input_pred:np.ndarray, batch_size:int=100, k:int=200, seed=None) -> QuantileSketch:
+    """ Feeds the predictions of a VectorEmulators object into per-cell quantile sketches
+
+    Args:
+        emulator (VectorEmulators): Vector emulator of a quantity of interest
+        input_pred (np.ndarray): Input testing dataset to perform prediction
+        batch_size (int, optional): Number of input samples per prediction call. Defaults to 100.
+        k (int, optional): Capacity of the top level of the sketches. Defaults to 200.
+        seed (int, optional): Seed of the random compaction offsets. Defaults to None.
+
+    Returns:
+        sketch (QuantileSketch): Quantile sketch with one stream per valid cell
+    """
+    sketch = QuantileSketch(k=k, shape=(emulator.mask.size,), seed=seed)
+    for predicted in emulator.predict_batches(input_pred, batch_size=batch_size):
+        sketch.update(predicted)
+    return sketch
+
+def to_map(emulator, values:np.ndarray) -> np.ndarray:
+    """ Reconstructs per-cell values of a VectorEmulators object onto the raster grid
+
+    Args:
+        emulator (VectorEmulators): Vector emulator of a quantity of interest
+        values (np.ndarray): Values with the valid cells on the last axis, e.g. quantiles from vector_sketch
+
+    Returns:
+        np.ndarray: Values with shape (..., rows, cols). Cells outside the valid cells are NaN.
+    """
+    return emulator.mask.scatter(values, fill=np.nan, crop=False)
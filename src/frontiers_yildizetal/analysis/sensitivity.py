@@ -0,0 +1,171 @@
+import numpy as np
+
+def saltelli_design(input_sample:np.ndarray) -> np.ndarray:
+    """ Builds the A, B and AB_i matrices of the Saltelli sampling scheme
+
+    The first half of the input sample is used as matrix A and the second half as matrix B.
+    AB_i is A with its i-th column taken from B. The matrices are stacked as [A; B; AB_1; ...; AB_d]
+    so that the emulator can be evaluated on all of them in a single prediction call.
+
+    Args:
+        input_sample (np.ndarray): Input dataset, e.g. one of the MCS sets, with one input variable per column
+
+    Raises:
+        TypeError: input_sample must be a Numpy array
+        ValueError: input_sample must be a 2-D array with at least two rows
+
+    Returns:
+        design (np.ndarray): Stacked design with (d + 2) * n rows, where n is half the size of the sample
+    """
+    if not isinstance(input_sample, np.ndarray):
+        raise TypeError('input_sample must be a Numpy array')
+    if input_sample.ndim != 2 or input_sample.shape[0] < 2:
+        raise ValueError('input_sample must be a 2-D array with at least two rows')
+
+    n = input_sample.shape[0] // 2
+    dim = input_sample.shape[1]
+    mat_a = input_sample[:n]
+    mat_b = input_sample[n:2 * n]
+
+    mat_ab = np.repeat(mat_a[np.newaxis, :, :], dim, axis=0)
+    for i in range(dim):
+        mat_ab[i, :, i] = mat_b[:, i]
+
+    design = np.concatenate([mat_a, mat_b, mat_ab.reshape(dim * n, dim)], axis=0)
+    return design
+
+def split_outputs(predicted:np.ndarray, dim:int):
+    """ Splits the outputs predicted on a Saltelli design into f(A), f(B) and f(AB_i)
+
+    Args:
+        predicted (np.ndarray): Outputs predicted on the stacked design. Can be 1-D (scalars) or 2-D (cells as columns)
+        dim (int): Number of input variables
+
+    Returns:
+        y_a (np.ndarray): Outputs of matrix A
+        y_b (np.ndarray): Outputs of matrix B
+        y_ab (np.ndarray): Outputs of the AB_i matrices with the input variable on the first axis
+    """
+    n = predicted.shape[0] // (dim + 2)
+    y_a = predicted[:n]
+    y_b = predicted[n:2 * n]
+    y_ab = predicted[2 * n:].reshape((dim, n) + predicted.shape[1:])
+    return y_a, y_b, y_ab
+
+def estimate(y_a:np.ndarray, y_b:np.ndarray, y_ab:np.ndarray) -> dict:
+    """ Estimates first-order and total Sobol' indices
+
+    First-order indices use the estimator of Saltelli et al. (2010) and total indices use the
+    estimator of Jansen (1999). Any trailing axes after the sample axis, e.g. cells of a vector output,
+    are kept so that all cells are estimated at once. Indices of outputs without variance are NaN.
+
+    Args:
+        y_a (np.ndarray): Outputs of matrix A
+        y_b (np.ndarray): Outputs of matrix B
+        y_ab (np.ndarray): Outputs of the AB_i matrices with the input variable on the first axis
+
+    Returns:
+        indices (dict): First-order (S1) and total (ST) indices with the input variable on the first axis
+    """
+    var = np.var(np.concatenate([y_a, y_b], axis=0), axis=0, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        first = np.mean(y_b * (y_ab - y_a), axis=1) / var
+        total = 0.5 * np.mean((y_a - y_ab) ** 2, axis=1) / var
+    first = np.where(var > 0, first, np.nan)
+    total = np.where(var > 0, total, np.nan)
+    indices = {'S1':first, 'ST':total}
+    return indices
+
+def bootstrap(y_a:np.ndarray, y_b:np.ndarray, y_ab:np.ndarray, n_boot:int=100, conf:float=0.95, seed=None) -> dict:
+    """ Calculates bootstrap confidence intervals of the Sobol' indices
+
+    Args:
+        y_a (np.ndarray): Outputs of matrix A
+        y_b (np.ndarray): Outputs of matrix B
+        y_ab (np.ndarray): Outputs of the AB_i matrices with the input variable on the first axis
+        n_boot (int, optional): Number of bootstrap resamples. Defaults to 100.
+        conf (float, optional): Confidence level of the intervals. Defaults to 0.95.
+        seed (int, optional): Seed of the random number generator. Defaults to None.
+
+    Raises:
+        TypeError: n_boot must be an integer
+        ValueError: n_boot must be positive
+        ValueError: conf must be between 0 and 1
+
+    Returns:
+        intervals (dict): Lower and upper bounds of S1 and ST stacked on the first axis
+    """
+    if not isinstance(n_boot, int):
+        raise TypeError('n_boot must be an integer')
+    if n_boot < 1:
+        raise ValueError('n_boot must be positive')
+    if not 0 < conf < 1:
+        raise ValueError('conf must be between 0 and 1')
+
+    rng = np.random.default_rng(seed)
+    n = y_a.shape[0]
+    resampled = {'S1':[], 'ST':[]}
+    for _ in range(n_boot):
+        idx = rng.integers(0, n, n)
+        indices = estimate(y_a[idx], y_b[idx], y_ab[:, idx])
+        for key in resampled:
+            resampled[key].append(indices[key])
+
+    bounds = [100 * (1 - conf) / 2, 100 * (1 + conf) / 2]
+    intervals = {key: np.nanpercentile(np.stack(vals), bounds, axis=0) for key, vals in resampled.items()}
+    return intervals
+
+def scalar_indices(emulator, scalar:str, input_sample:np.ndarray, n_boot:int=100, conf:float=0.95, seed=None) -> dict:
+    """ Calculates Sobol' indices of a scalar using a trained ScalarEmulators object
+
+    The emulator is evaluated once on the stacked A, B and AB_i matrices.
+
+    Args:
+        emulator (ScalarEmulators): Emulators of the scalars
+        scalar (str): name of the scalar, i.e. ia, da, dv, hmax or vmax
+        input_sample (np.ndarray): Input dataset, e.g. one of the MCS sets, split in half into A and B
+        n_boot (int, optional): Number of bootstrap resamples. Defaults to 100.
+        conf (float, optional): Confidence level of the intervals. Defaults to 0.95.
+        seed (int, optional): Seed of the random number generator. Defaults to None.
+
+    Returns:
+        indices (dict): S1 and ST per input variable, and their confidence intervals S1_conf and ST_conf
+    """
+    design = saltelli_design(input_sample)
+    predicted = emulator.predict_scalar(scalar, design)[0]
+    y_a, y_b, y_ab = split_outputs(predicted, input_sample.shape[1])
+
+    indices = estimate(y_a, y_b, y_ab)
+    intervals = bootstrap(y_a, y_b, y_ab, n_boot=n_boot, conf=conf, seed=seed)
+    indices['S1_conf'] = intervals['S1']
+    indices['ST_conf'] = intervals['ST']
+    return indices
+
+def vector_indices(emulator, input_sample:np.ndarray, n_boot:int=100, conf:float=0.95, seed=None) -> dict:
+    """ Calculates per-cell Sobol' index maps using a trained VectorEmulators object
+
+    The emulator is evaluated once on the stacked A, B and AB_i matrices. The predicted matrix has
+    (d + 2) * n rows and one column per valid cell, so the size of input_sample should be chosen
+    according to the number of valid cells.
+
+    Args:
+        emulator (VectorEmulators): Vector emulator of a quantity of interest
+        input_sample (np.ndarray): Input dataset split in half into A and B
+        n_boot (int, optional): Number of bootstrap resamples. Defaults to 100.
+        conf (float, optional): Confidence level of the intervals. Defaults to 0.95.
+        seed (int, optional): Seed of the random number generator. Defaults to None.
+
+    Returns:
+        indices (dict): S1 and ST maps with shape (d, rows, cols), and their confidence intervals S1_conf
+        and ST_conf with shape (2, d, rows, cols). Cells outside the valid cells are NaN.
+    """
+    design = saltelli_design(input_sample)
+    predicted = emulator.predict_samples(design)
+    y_a, y_b, y_ab = split_outputs(predicted, input_sample.shape[1])
+
+    indices = estimate(y_a, y_b, y_ab)
+    intervals = bootstrap(y_a, y_b, y_ab, n_boot=n_boot, conf=conf, seed=seed)
+    indices['S1_conf'] = intervals['S1']
+    indices['ST_conf'] = intervals['ST']
+
+    return {key: emulator.mask.scatter(vals, fill=np.nan, crop=False) for key, vals in indices.items()}
@@ -1,8 +1,10 @@
 from frontiers_yildizetal.ravaflow import Simulations
-from frontiers_yildizetal.emulators import ScalarEmulators
+from frontiers_yildizetal.emulators import ScalarEmulators, converter, robustgasp
 from scipy.stats import skew
 import numpy as np
-from frontiers_yildizetal.utilities import data
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from frontiers_yildizetal.utilities import data, tracing
 
 class Moments:
     """
@@ -24,6 +26,7 @@ class Moments:
 
     """
     funcs = {'mean':np.mean, 'var':np.var, 'skew':skew}
+    loc_all = {'synth': [1000, 2000], 'acheron': [1490100, 5204100]}
 
     def __init__(self, name:str):
         if not isinstance(name,str):
@@ -31,37 +34,42 @@ class Moments:
         if name not in ['synth', 'acheron']:
             raise ValueError('name must be either synth or acheron')
         self.name = name
-        loc_all = {'synth': [1000, 2000], 'acheron': [1490100, 5204100]}
-        self.locs = loc_all[self.name]
+        self.locs = self.loc_all[self.name]
         
-    def get_mcs(self):
+    def get_mcs(self, emulator:ScalarEmulators=None, predicted:dict=None):
         """
         Calculates the three moments using Monte Carlo Simulations facilitated with Gaussian Process Emulation
 
+        Every scalar is predicted once at every MCS input set, unless the predictions are given.
+
+        Args:
+            emulator (ScalarEmulators, optional): Emulators of the set at the locations. Constructed if not given. Defaults to None.
+            predicted (dict, optional): predicted means according to the scalar and the MCS set, i.e. mcs1, mcs2 and mcs3, e.g. from an earlier run. Defaults to None.
+
         Returns:
             mcs_moments (dict): A dictionary storing the moments according to scalars
         """
         mcss = ['mcs' + str(i) for i in range(1, 4)]
-        emulator = ScalarEmulators(self.name, 0.1,
-                                   self.locs[0],
-                                   self.locs[1])
-        scalars = list(emulator.output.keys())    
-    
+        if predicted is None:
+            if emulator is None:
+                emulator = ScalarEmulators(self.name, 0.1,
+                                           self.locs[0],
+                                           self.locs[1])
+            inputs = {mcs: data.load_input(name=emulator.name, analysis=mcs) for mcs in mcss}
+            predicted = {key: {mcs: emulator.predict_scalar(key, inputs[mcs])[0] for mcs in mcss}
+                         for key in emulator.output.keys()}
         mcs_moments = {}
 
         for n, f in self.funcs.items():
             mcs_moments[n] = {}
-            for key in scalars:
+            for key in predicted:
                 mcs_moments[n][key] = []
                 for mcs in mcss:
-                    input_test = data.load_input(name=emulator.name, analysis=mcs)
-                    predicted = emulator.predict_scalar(key, input_test)[0]
-                
                     if f is np.var:
-                        val = f(predicted, ddof=1)
+                        val = f(predicted[key][mcs], ddof=1)
                         mcs_moments[n][key].append(round(val, 3))
                     else:
-                        val = f(predicted)
+                        val = f(predicted[key][mcs])
                         mcs_moments[n][key].append(round(val, 3))
         return mcs_moments
     
@@ -88,4 +96,115 @@ class Moments:
                     else:
                         val = f(scalars[key][8 * j : 8 * (j + 1)])
                         pem_moments[n][key].append(round(val, 3))
-        return pem_moments
\ No newline at end of file
+        return pem_moments
+
+def _predict_mcs(input_train:np.ndarray, response:np.ndarray, inputs:list) -> list:
+    """ Trains an rgasp emulator and predicts the mean at every MCS input set. Runs in a worker process. """
+    with tracing.span('gp_fit'), converter():
+        model = robustgasp.rgasp(design=input_train, response=np.asarray(response, dtype=np.float64))
+    predicted = []
+    for x in inputs:
+        with tracing.span('gp_predict', samples=len(x)), converter():
+            predicted.append(np.asarray(robustgasp.predict_rgasp(object=model, testing_input=x)[0]))
+    return predicted
+
+class SiteMoments:
+    """
+    A class to represent moments, i.e. mean, variance and skewness, at many locations
+    
+    Arguments:
+        name (str): name of the set. It can be either synth or acheron
+        locs (list): coordinates (x, y) at which hmax and vmax are extracted
+        threshold (float): threshold value to define the scalars from simulations. Defaults to 0.1.
+        
+    Methods:
+        get_mcs: returns the moments calculated with Monte Carlo simulations at every location
+        get_pem: returns the moments calculated with Point Estimate Method at every location
+
+    Raises:
+        TypeError: name must be a string
+        ValueError: name must be either synth or acheron
+        ValueError: locs cannot be empty
+
+    """
+    funcs = Moments.funcs
+
+    def __init__(self, name:str, locs, threshold:float=0.1):
+        if not isinstance(name,str):
+            raise TypeError('name must be a string')
+        if name not in ['synth', 'acheron']:
+            raise ValueError('name must be either synth or acheron')
+        if len(locs) == 0:
+            raise ValueError('locs cannot be empty')
+        self.name = name
+        self.locs = [tuple(loc) for loc in locs]
+        self.threshold = threshold
+
+    def _summarise(self, samples:dict) -> list:
+        site_moments = []
+        for site in range(len(self.locs)):
+            moments = {}
+            for n, f in self.funcs.items():
+                moments[n] = {}
+                for key, vals in samples.items():
+                    moments[n][key] = []
+                    for val in vals:
+                        val = val[:, site] if val.ndim == 2 else val
+                        if f is np.var:
+                            moments[n][key].append(round(f(val, ddof=1), 3))
+                        else:
+                            moments[n][key].append(round(f(val), 3))
+            site_moments.append(moments)
+        return site_moments
+
+    def get_mcs(self, workers:int=None) -> list:
+        """
+        Calculates the three moments using Monte Carlo Simulations facilitated with Gaussian Process Emulation
+        
+        The rasters are read once for all locations. Impact area, deposit area and deposit volume
+        are emulated once, and hmax and vmax are emulated at every location. The emulators are
+        trained in parallel worker processes. The workers are spawned rather than forked, as R
+        cannot be used in a fork of a process in which it is initialised, so scripts must guard
+        the call with if __name__ == '__main__'.
+
+        Args:
+            workers (int, optional): Number of worker processes. Defaults to the number of processors.
+
+        Returns:
+            mcs_moments (list): A list of dictionaries storing the moments according to scalars, one for every location
+        """
+        scalars = Simulations(self.name).curate_sites(self.threshold, self.locs)
+        input_train = data.load_input(self.name, 'emulator')
+        inputs = [data.load_input(name=self.name, analysis='mcs' + str(i)) for i in range(1, 4)]
+
+        responses = []
+        for key, vals in scalars.items():
+            if vals.ndim == 1:
+                responses.append((key, None, vals))
+            else:
+                responses.extend((key, site, vals[:, site]) for site in range(vals.shape[1]))
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_predict_mcs, input_train, response, inputs) for _, _, response in responses]
+            predicted = [future.result() for future in futures]
+
+        samples = {}
+        for (key, site, _), preds in zip(responses, predicted):
+            if site is None:
+                samples[key] = preds
+            else:
+                samples.setdefault(key, [np.empty((x.shape[0], len(self.locs))) for x in inputs])
+                for j, pred in enumerate(preds):
+                    samples[key][j][:, site] = pred
+        return self._summarise(samples)
+
+    def get_pem(self) -> list:
+        """
+        Calculates the three moments using Point Estimate Method at every location
+        
+        Returns:
+            pem_moments (list): A list of dictionaries storing the moments according to scalars, one for every location
+        """
+        scalars = Simulations((self.name + '_pem')).curate_sites(self.threshold, self.locs)
+        samples = {key: [vals[8 * j : 8 * (j + 1)] for j in range(3)] for key, vals in scalars.items()}
+        return self._summarise(samples)
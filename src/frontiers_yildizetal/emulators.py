@@ -1,20 +1,78 @@
 import numpy as np
 import rasterio
-from sklearn import metrics
+from rasterio.features import geometry_mask
+from rasterio.transform import rowcol
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from scipy import linalg, sparse
+from scipy.stats import t
 from frontiers_yildizetal.ravaflow import Simulations
-from frontiers_yildizetal.utilities import data
+from frontiers_yildizetal.utilities import data, memory, tracing
+from frontiers_yildizetal.utilities.grid import GridMask
 
-import os
-if os.name == 'nt':
-    r_path = os.environ["CONDA_PREFIX"] + '/lib/R'
-    os.environ['R_HOME'] = r_path 
+_package = None
+
+def load_robustgasp():
+    """
+    Starts the R runtime and loads RobustGaSP on first use
+
+    Importing this module does not start R, so raster-only workflows and worker processes that
+    never fit an emulator do not pay for it.
+
+    Returns:
+        RobustGaSP package imported with rpy2
+    """
+    global _package
+    if _package is None:
+        if os.name == 'nt':
+            r_path = os.environ["CONDA_PREFIX"] + '/lib/R'
+            os.environ['R_HOME'] = r_path
+        with tracing.span('r_import'):
+            import rpy2.robjects.packages as rpackages
+            _package = rpackages.importr('RobustGaSP')
+    return _package
+
+def converter():
+    """
+    Returns a context in which numpy arrays are converted to R objects and back
+
+    Returns:
+        context manager of the rpy2 conversion
+    """
+    from rpy2.robjects import default_converter, numpy2ri
+    from rpy2.robjects.conversion import localconverter
+    return localconverter(default_converter + numpy2ri.converter)
 
-import rpy2.robjects.packages as rpackages
-import rpy2.robjects.numpy2ri
+class _RobustGaSP:
+    """ Forwards attribute access to RobustGaSP, which is loaded on first use """
+    def __getattr__(self, attr):
+        return getattr(load_robustgasp(), attr)
 
-robustgasp = rpackages.importr('RobustGaSP')
-rpy2.robjects.numpy2ri.activate()
+robustgasp = _RobustGaSP()
+
+class _Moments:
+    """ Merges the mean and standard deviation over batches of predicted samples (rows) """
+    def __init__(self, cells:int, **attrs):
+        self.count = 0
+        # the batches are reduced in the dtype of the predictions and accumulated in the dtype policy
+        self.mean = np.zeros(cells, dtype=memory.get_dtype())
+        self.m2 = np.zeros(cells, dtype=memory.get_dtype())
+        self.attrs = attrs
+
+    def update(self, predicted:np.ndarray):
+        with tracing.span('reduction', **self.attrs):
+            size = predicted.shape[0]
+            batch_mean = predicted.mean(axis=0)
+            batch_m2 = ((predicted - batch_mean) ** 2).sum(axis=0)
+            delta = batch_mean - self.mean
+            total = self.count + size
+            self.mean += delta * size / total
+            self.m2 += batch_m2 + delta ** 2 * self.count * size / total
+            self.count = total
+
+    def result(self):
+        return self.mean, np.sqrt(self.m2 / self.count)
 
 class ScalarEmulators:
     """
@@ -84,9 +142,26 @@ class ScalarEmulators:
         if scalar not in ['ia', 'da', 'dv', 'hmax', 'vmax']:
             raise Exception('Invalid name. It must be ia, da, dv, hmax or vmax')
         
-        model = robustgasp.rgasp(design=self.input_train, response=self.output[scalar])
+        with tracing.span('gp_fit', simulations=self.name, scalar=scalar), converter():
+            model = robustgasp.rgasp(design=self.input_train, response=np.asarray(self.output[scalar], dtype=np.float64))
         return model
     
+    def incremental(self, scalar:str):
+        """
+        Constructs the GP emulator of a scalar in a form that can be updated with new simulations
+
+        Args:
+            scalar (str): name of the scalar to be emulated. Can be impact area (ia), deposit area (da), deposit volume, maximum flow height (hmax) or maximum flow velocity (vmax)
+
+        Raises:
+            Exception: Invalid emulator. The predictions differ from RobustGaSP.
+
+        Returns:
+            IncrementalGP: emulator with the hyperparameters of the fitted model, checked against it at the validation inputs
+        """
+        return IncrementalGP.from_model(self.model(scalar), self.input_train, self.output[scalar], kind='rgasp',
+                                        input_check=self.input_validate)
+
     def cv_loo(self,scalar:str):
         """
         Cross validation with leave-one-out technique
@@ -106,8 +181,12 @@ class ScalarEmulators:
         if scalar not in ['ia', 'da', 'dv', 'hmax', 'vmax']:
             raise Exception('Invalid name. It must be ia, da, dv, hmax or vmax')
         
+        from sklearn import metrics
+
         trained = self.model(scalar)
-        loo = robustgasp.leave_one_out_rgasp(trained)
+        with tracing.span('gp_loo', simulations=self.name, scalar=scalar), converter():
+            loo = robustgasp.leave_one_out_rgasp(trained)
+            loo = [np.asarray(loo[0])]
         loo_metrics = {}
         
         loo_metrics['r2'] = metrics.r2_score(y_true=self.output[scalar], y_pred=loo[0])
@@ -128,7 +207,7 @@ class ScalarEmulators:
             Exception: Invalid name. It must be ia, da, dv, hmax or vmax
 
         Returns:
-            predicted: An R object with the predictions. Consists of mean, lower95, upper95, and sd.
+            predicted (list): Numpy arrays of the predictions, i.e. mean, lower95, upper95, and sd.
         """
         if not isinstance(scalar,str):
             raise TypeError('scalar must be a string')
@@ -136,11 +215,44 @@ class ScalarEmulators:
             raise Exception('Invalid name. It must be ia, da, dv, hmax or vmax')
         
         trained = self.model(scalar)
-        predicted = robustgasp.predict_rgasp(object=trained, testing_input=input_pred)
+        with tracing.span('gp_predict', simulations=self.name, scalar=scalar, samples=len(input_pred)), converter():
+            predicted = robustgasp.predict_rgasp(object=trained, testing_input=input_pred)
+            with tracing.span('r_conversion'):
+                predicted = [np.asarray(array) for array in list(predicted)[:4]]
         return predicted
+
+    def predict_batches(self, scalar:str, input_pred:np.ndarray, batch_size:int=1000):
+        """
+        Performs prediction in batches using a model trained once
+
+        Args:
+            scalar (str): name of the scalar to be emulated. Can be impact area (ia), deposit area (da), deposit volume, maximum flow height (hmax) or maximum flow velocity (vmax)
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+            batch_size (int, optional): Number of input samples per prediction call. Defaults to 1000.
+
+        Raises:
+            TypeError: batch_size must be an integer
+            ValueError: batch_size must be positive
+
+        Yields:
+            np.ndarray: Predicted mean of a batch of input samples
+        """
+        if not isinstance(batch_size, int):
+            raise TypeError('batch_size must be an integer')
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+
+        trained = self.model(scalar)
+        for start in range(0, input_pred.shape[0], batch_size):
+            batch = input_pred[start:start + batch_size]
+            with tracing.span('gp_predict', simulations=self.name, scalar=scalar, samples=len(batch)), converter():
+                predicted = robustgasp.predict_rgasp(object=trained, testing_input=batch)
+                with tracing.span('r_conversion'):
+                    predicted = np.asarray(predicted[0])
+            yield predicted
     
 class VectorEmulators:
-    def __init__(self, name, qoi:str, threshold:float):
+    def __init__(self, name, qoi:str, threshold:float, crop:bool=False):
         """
         Initialising VectorEmulators class
 
@@ -148,6 +260,7 @@ class VectorEmulators:
             name (_type_): _description_
             qoi (_type_): _description_
             threshold (_type_): _description_
+            crop (bool, optional): read only the footprint of the stack, see Simulations.create_vector. Defaults to False.
 
         Raises:
             Exception: _description_
@@ -169,25 +282,35 @@ class VectorEmulators:
         with rasterio.open(self.sims.data_import.raster_link('hmax')) as src:
             self.size = src.count
             self.res = src.res[0]
+            self.transform = src.transform
             self.bounds = src.bounds
  
-        self.vector, self.valid_cols = self.sims.create_vector(qoi=qoi, threshold=threshold)
-        self.vector_validate, self.valid_cols = Simulations((self.name + '_validation')).create_vector(qoi=self.qoi, threshold=self.threshold, valid_cols=self.valid_cols)
-        
-        self.input_train = data.load_input(self.name, 'emulator')
-        self.input_validate = data.load_input(self.name, 'validation_emulator')
-        
         with rasterio.open(self.sims.data_import.raster_link(qoi)) as src:
             self.size = src.count
             self.rows = src.height
             self.cols = src.width
 
-        self.model = robustgasp.ppgasp(design=self.input_train, response=self.vector)
+        self.vector, self.valid_cols = self.sims.create_vector(qoi=qoi, threshold=threshold, crop=crop)
+        self.mask = GridMask.from_counts(self.valid_cols, (self.rows, self.cols), self.transform)
+        self.vector_validate, _ = Simulations((self.name + '_validation')).create_vector(qoi=self.qoi, threshold=self.threshold, valid_cols=self.mask)
+        
+        self.input_train = data.load_input(self.name, 'emulator')
+        self.input_validate = data.load_input(self.name, 'validation_emulator')
+
+        # column of every cell of the grid in the outputs, or -1 for cells that are never valid
+        self.cell_index = np.full(self.rows * self.cols, -1, dtype=np.int64)
+        self.cell_index[self.mask.indices] = np.arange(self.mask.size)
+        self._incremental = None
+
+        with tracing.span('gp_fit', simulations=self.name, qoi=self.qoi, cells=self.vector.shape[1]), converter():
+            self.model = robustgasp.ppgasp(design=self.input_train, response=np.asarray(self.vector, dtype=np.float64))
     
     def validate(self):
         
-        validated = robustgasp.predict_ppgasp(object=self.model, testing_input=self.input_validate)
-        val_arr = [np.array(matrix) for matrix in list(validated)]
+        with tracing.span('gp_predict', simulations=self.name, qoi=self.qoi, samples=len(self.input_validate)), converter():
+            validated = robustgasp.predict_ppgasp(object=self.model, testing_input=self.input_validate)
+            with tracing.span('r_conversion'):
+                val_arr = [np.array(matrix) for matrix in list(validated)]
         
         validated_mean = np.where(val_arr[0] < 0, 0 , val_arr[0])
         validated_lower = np.where(val_arr[1] < 0, 0 , val_arr[1])
@@ -199,27 +322,902 @@ class VectorEmulators:
         
         validation = {'validation':validated_mean, 'pci95':self.pci95, 'lci95':self.lci95, 'mean_sq_err':self.mean_squared_error}
         return validation
-    
+
+    def predict_samples(self, input_pred:np.ndarray) -> np.ndarray:
+        """
+        Performs prediction on the valid cells without reconstructing the maps
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+
+        Returns:
+            np.ndarray: Predicted mean of every input sample (rows) at every valid cell (columns)
+        """
+        with tracing.span('gp_predict', simulations=self.name, qoi=self.qoi, samples=len(input_pred)), converter():
+            predicted = robustgasp.predict_ppgasp(object=self.model, testing_input=input_pred)
+            with tracing.span('r_conversion'):
+                return np.asarray(predicted[0])
+
+    def predict_batches(self, input_pred:np.ndarray, batch_size:int=100):
+        """
+        Performs prediction on the valid cells in batches of input samples
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+            batch_size (int, optional): Number of input samples per prediction call. Defaults to 100.
+
+        Raises:
+            TypeError: batch_size must be an integer
+            ValueError: batch_size must be positive
+
+        Yields:
+            np.ndarray: Predicted mean of a batch of input samples (rows) at every valid cell (columns)
+        """
+        if not isinstance(batch_size, int):
+            raise TypeError('batch_size must be an integer')
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+
+        for start in range(0, input_pred.shape[0], batch_size):
+            yield self.predict_samples(input_pred[start:start + batch_size])
+
     def predict_vector(self,input_pred:np.ndarray):
         """
         predict_vector _summary_
 
+        The predictions are made in batches that fit into the memory budget (see utilities.memory),
+        and the mean and standard deviation are merged across the batches on the valid cells. The
+        batch size is logged and kept in memory.plans['predict_vector'].
+
         Args:
             input_pred (np.ndarray): _description_
 
         Returns:
             _type_: _description_
         """
-        predicted = robustgasp.predict_ppgasp(object=self.model, testing_input=input_pred)
-        
         pred_size = input_pred.shape[0]
-        indices = np.flatnonzero(self.valid_cols)
-        pred_index = [int(i) for i in list(indices)]
-        
-        pred = np.empty((pred_size, self.rows * self.cols))
-        pred[:,pred_index] = predicted[0]
-            
-        pred_mean = pred.mean(axis=0).reshape(self.rows, self.cols)
-        pred_sd = pred.std(axis=0).reshape(self.rows, self.cols)
-            
-        return pred_mean, pred_sd
\ No newline at end of file
+        # predict_ppgasp returns the mean, both bounds and the standard deviation of every sample
+        batch_size = memory.rows_within(4 * self.mask.size * 8, pred_size, share=0.5)
+
+        moments = _Moments(self.mask.size, qoi=self.qoi)
+        for predicted in self.predict_batches(input_pred, batch_size=batch_size):
+            moments.update(predicted)
+        mean, sd = moments.result()
+        memory.report('predict_vector', batch_size=batch_size, batches=-(-pred_size // batch_size),
+                      dtype=mean.dtype.name, storage='ram', cells=int(self.mask.size))
+
+        pred_mean = self.mask.scatter(mean, crop=False)
+        pred_sd = self.mask.scatter(sd, crop=False)
+        return pred_mean, pred_sd
+
+    def incremental(self):
+        """
+        Returns the fitted emulator in a form that can be updated with new simulations
+
+        Raises:
+            Exception: Invalid emulator. The predictions differ from RobustGaSP.
+
+        Returns:
+            IncrementalGP: emulator of the valid cells with the hyperparameters of the fitted model, checked against it at the validation inputs
+        """
+        return IncrementalGP.from_model(self.model, self.input_train, self.vector, kind='ppgasp', input_check=self.input_validate)
+
+    def cells(self, loc_x, loc_y) -> np.ndarray:
+        """
+        Returns the columns of the outputs at coordinates
+
+        Args:
+            loc_x (float, np.ndarray): x-coordinates of the points
+            loc_y (float, np.ndarray): y-coordinates of the points
+
+        Raises:
+            Exception: x-coordinate is out of bounds
+            Exception: y-coordinate is out of bounds
+
+        Returns:
+            np.ndarray: column of every point, or -1 for points in cells that are never valid
+        """
+        loc_x = np.atleast_1d(np.asarray(loc_x, dtype=np.float64))
+        loc_y = np.atleast_1d(np.asarray(loc_y, dtype=np.float64))
+        if np.any((loc_x <= self.bounds[0]) | (loc_x >= self.bounds[2])):
+            raise Exception('x-coordinate is out of bounds')
+        if np.any((loc_y <= self.bounds[1]) | (loc_y >= self.bounds[3])):
+            raise Exception('y-coordinate is out of bounds')
+        rows, cols = rowcol(self.transform, loc_x, loc_y)
+        return self.cell_index[np.asarray(rows) * self.cols + np.asarray(cols)]
+
+    def _predict_columns(self, input_pred:np.ndarray, columns:np.ndarray):
+        if self._incremental is None:
+            self._incremental = self.incremental()
+        input_pred = np.array(input_pred, dtype=np.float64, ndmin=2)
+        mean = np.zeros((len(input_pred), len(columns)), dtype=memory.get_dtype())
+        sd = np.zeros((len(input_pred), len(columns)), dtype=memory.get_dtype())
+        valid = columns >= 0
+        with tracing.span('gp_predict', simulations=self.name, qoi=self.qoi, samples=len(input_pred), cells=int(valid.sum())):
+            mean[:, valid], sd[:, valid] = self._incremental.predict(input_pred, columns=columns[valid])
+        return mean, sd
+
+    def predict_points(self, input_pred:np.ndarray, loc_x, loc_y):
+        """
+        Performs prediction at points without predicting the other cells
+
+        Only the outputs of the cells of the points are predicted, so a few sites cost a few
+        columns instead of the whole grid. Points in cells that are never valid are predicted as 0.
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+            loc_x (float, np.ndarray): x-coordinates of the points
+            loc_y (float, np.ndarray): y-coordinates of the points
+
+        Raises:
+            Exception: x-coordinate is out of bounds
+            Exception: y-coordinate is out of bounds
+
+        Returns:
+            pred_mean (np.ndarray): predicted mean of every input sample (rows) at every point (columns)
+            pred_sd (np.ndarray): predicted standard deviation with the same shape
+        """
+        return self._predict_columns(input_pred, self.cells(loc_x, loc_y))
+
+    def predict_region(self, input_pred:np.ndarray, region):
+        """
+        Performs prediction in a region without predicting the other cells
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+            region (np.ndarray, dict, list): boolean mask with shape (rows, cols), or GeoJSON-like polygons in the CRS of the stack
+
+        Raises:
+            ValueError: region mask must have the shape of the grid
+
+        Returns:
+            cells (np.ndarray): flat indices of the valid cells in the region
+            pred_mean (np.ndarray): predicted mean of every input sample (rows) at these cells (columns)
+            pred_sd (np.ndarray): predicted standard deviation with the same shape
+        """
+        if isinstance(region, np.ndarray):
+            if region.shape != (self.rows, self.cols):
+                raise ValueError('region mask must have the shape of the grid')
+            mask = region.astype(bool)
+        else:
+            shapes = [region] if isinstance(region, dict) or hasattr(region, '__geo_interface__') else region
+            mask = geometry_mask(shapes, out_shape=(self.rows, self.cols), transform=self.transform, invert=True)
+        cells = np.flatnonzero(mask.reshape(-1) & (self.cell_index >= 0))
+        mean, sd = self._predict_columns(input_pred, self.cell_index[cells])
+        return cells, mean, sd
+
+def _fit_ppgasp(design:np.ndarray, response:np.ndarray, input_check:np.ndarray=None):
+    """ Fits a ppgasp emulator and returns its hyperparameters as IncrementalGP checked at input_check. Runs in a worker process. """
+    with tracing.span('gp_fit', cells=response.shape[1]), converter():
+        model = robustgasp.ppgasp(design=design, response=np.asarray(response, dtype=np.float64))
+    emulator = IncrementalGP.from_model(model, design, response, kind='ppgasp', input_check=input_check)
+    emulator.model = None
+    return emulator
+
+def _bounds(mean:np.ndarray, sd:np.ndarray, dof:int):
+    """
+    Returns the 95% interval of a prediction of IncrementalGP like lower95 and upper95 of predict_ppgasp
+
+    The sd of IncrementalGP includes the factor dof / (dof - 2) of the Student t variance, while
+    the interval of RobustGaSP is the t quantile times the scale of the distribution.
+    """
+    half_width = t.ppf(0.975, dof) * sd * np.sqrt(max(dof - 2, 1) / dof)
+    return mean - half_width, mean + half_width
+
+class MultiVectorEmulators:
+    """
+    A class to represent vector emulators of several quantities of interest on shared valid cells
+
+    The stacks of all quantities are read in one pass, and a cell is valid if it is valid for any
+    quantity. The ppgasp emulators of the quantities are fitted in parallel worker processes, and
+    their hyperparameters are kept as IncrementalGP, so predictions of all quantities are made in
+    this process from a single input batch, sharing the distances between the design and the inputs.
+    Every emulator is checked against predict_ppgasp at the validation inputs (see IncrementalGP.check)
+    before it is used. The workers are spawned rather than forked, as R cannot be used in a fork of a process in which
+    it is initialised, so scripts must create the emulators under if __name__ == '__main__'.
+
+    Attributes:
+        name (str): name of the set of simulations, i.e. synth or acheron
+        qois (list): quantities of interest
+        vectors (dict): training outputs according to the quantity with simulations as rows and valid cells as columns
+        vector_validate (dict): validation outputs according to the quantity
+        valid_cols (np.ndarray): number of simulations in which every cell is valid for any quantity
+        mask (GridMask): valid cells
+        models (dict): fitted emulators according to the quantity
+
+    Methods:
+        validate(): validates the emulators of all quantities
+        predict_samples(input_pred): predicts all quantities on the valid cells
+        predict_vector(input_pred): predicts the mean and sd maps of all quantities
+    """
+    def __init__(self, name:str, qois=('hmax', 'vmax', 'pmax'), threshold=0.1, workers:int=None):
+        """
+        Initialising MultiVectorEmulators class
+
+        Args:
+            name (str): name of the set of simulations, i.e. synth or acheron
+            qois (list, optional): quantities of interest. Defaults to hmax, vmax and pmax.
+            threshold (int, float, dict, optional): Threshold value to define valid cells, or threshold values according to the quantity. Defaults to 0.1.
+            workers (int, optional): number of worker processes to fit the emulators. Defaults to the number of quantities.
+
+        Raises:
+            Exception: Invalid QoI. It should be hmax, vmax, or pmax.
+            Exception: Invalid emulator. The predictions differ from RobustGaSP.
+        """
+        qois = list(qois)
+        for qoi in qois:
+            if qoi not in ['hmax', 'vmax', 'pmax']:
+                raise Exception('Invalid QoI. It should be hmax, vmax, or pmax.')
+
+        self.name = name
+        self.qois = qois
+        self.threshold = threshold
+        self.sims = Simulations(self.name)
+
+        with self.sims._open(qois[0]) as src:
+            self.size = src.count
+            self.res = src.res[0]
+            self.transform = src.transform
+            self.bounds = src.bounds
+            self.rows = src.height
+            self.cols = src.width
+
+        self.vectors, self.valid_cols = self.sims.create_vectors(qois, threshold)
+        self.mask = GridMask.from_counts(self.valid_cols, (self.rows, self.cols), self.transform)
+        self.vector_validate, _ = Simulations(self.name + '_validation').create_vectors(qois, threshold, valid_cols=self.mask)
+
+        self.input_train = data.load_input(self.name, 'emulator')
+        self.input_validate = data.load_input(self.name, 'validation_emulator')
+
+        with ProcessPoolExecutor(max_workers=workers or len(qois), mp_context=multiprocessing.get_context('spawn')) as executor:
+            fitted = executor.map(_fit_ppgasp, [self.input_train] * len(qois), [self.vectors[qoi] for qoi in qois],
+                                  [self.input_validate] * len(qois))
+            self.models = dict(zip(qois, fitted))
+
+    def _distances(self, input_pred:np.ndarray) -> dict:
+        distances = {}
+        shared = None
+        for qoi in self.qois:
+            design = self.models[qoi].design
+            if shared is None or not np.array_equal(shared[0], design):
+                shared = (design, IncrementalGP.distances(design, input_pred))
+            distances[qoi] = shared[1]
+        return distances
+
+    def validate(self) -> dict:
+        """
+        Validates the emulators of all quantities with the validation set
+
+        Returns:
+            validation (dict): validated mean, pci95, lci95 and mean_sq_err according to the quantity
+        """
+        input_validate = np.asarray(self.input_validate, dtype=np.float64)
+        distances = self._distances(input_validate)
+        validation = {}
+        for qoi in self.qois:
+            model = self.models[qoi]
+            with tracing.span('gp_predict', simulations=self.name, qoi=qoi, samples=len(input_validate)):
+                mean, sd = model.predict(input_validate, distances[qoi])
+            lower, upper = _bounds(mean, sd, len(model.design) - model.theta.shape[0])
+
+            validated_mean = np.where(mean < 0, 0, mean)
+            validated_lower = np.where(lower < 0, 0, lower)
+            validated_upper = np.where(upper < 0, 0, upper)
+            actual = self.vector_validate[qoi]
+            validation[qoi] = {
+                'validation':validated_mean,
+                'pci95':np.mean(np.where((actual >= validated_lower) & (actual <= validated_upper), 1, 0)),
+                'lci95':np.mean(validated_upper - validated_lower),
+                'mean_sq_err':np.mean((validated_mean - actual) ** 2),
+            }
+        return validation
+
+    def predict_samples(self, input_pred:np.ndarray) -> dict:
+        """
+        Performs prediction of all quantities on the valid cells without reconstructing the maps
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+
+        Returns:
+            dict: Predicted mean of every input sample (rows) at every valid cell (columns) according to the quantity
+        """
+        input_pred = np.array(input_pred, dtype=np.float64, ndmin=2)
+        distances = self._distances(input_pred)
+        predicted = {}
+        for qoi in self.qois:
+            with tracing.span('gp_predict', simulations=self.name, qoi=qoi, samples=len(input_pred)):
+                predicted[qoi] = self.models[qoi].predict(input_pred, distances[qoi])[0]
+        return predicted
+
+    def predict_vector(self, input_pred:np.ndarray) -> dict:
+        """
+        Performs prediction of all quantities and summarises them over the input samples
+
+        The predictions are made in batches that fit into the memory budget (see utilities.memory).
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+
+        Returns:
+            dict: mean and standard deviation maps over the input samples according to the quantity
+        """
+        pred_size = input_pred.shape[0]
+        batch_size = memory.rows_within(len(self.qois) * (2 * self.mask.size + len(self.input_train)) * 8, pred_size, share=0.5)
+        moments = {qoi: _Moments(self.mask.size, qoi=qoi) for qoi in self.qois}
+        for start in range(0, pred_size, batch_size):
+            predicted = self.predict_samples(input_pred[start:start + batch_size])
+            for qoi in self.qois:
+                moments[qoi].update(predicted[qoi])
+        memory.report('predict_vector', batch_size=batch_size, batches=-(-pred_size // batch_size), dtype=memory.get_dtype().name,
+                      storage='ram', cells=int(self.mask.size))
+
+        maps = {}
+        for qoi in self.qois:
+            mean, sd = moments[qoi].result()
+            maps[qoi] = (self.mask.scatter(mean, crop=False), self.mask.scatter(sd, crop=False))
+        return maps
+
+class MultiResolutionEmulators:
+    """
+    A class to represent a vector emulator of a quantity of interest at two resolutions
+
+    The stacks are aggregated to blocks of factor x factor cells (see ravaflow.aggregate), and the
+    coarse field is emulated with ppgasp, whose cost grows with the number of valid blocks instead
+    of cells. The full resolution is only predicted within the footprint of the valid blocks, by
+    bilinear interpolation of the coarse prediction. With residual='emulate', the difference
+    between the simulations and the interpolated coarse field is emulated as well and added to
+    the interpolation, which is slower but more accurate. A larger factor trades accuracy for speed.
+    Both emulators are fitted in spawned worker processes, so scripts must create the emulator
+    under if __name__ == '__main__', and are checked against predict_ppgasp at the validation inputs.
+
+    The sd at the full resolution assumes that the interpolated blocks are fully correlated and
+    independent of the residual, i.e. sqrt((W sd_coarse)^2 + sd_residual^2) for the interpolation W.
+
+    Attributes:
+        name (str): name of the set of simulations, i.e. synth or acheron
+        qoi (str): quantity of interest
+        factor (int): size of the blocks in cells
+        residual (str): interpolate or emulate
+        vector (np.ndarray): coarse training outputs with simulations as rows and valid blocks as columns
+        valid_cols (np.ndarray): number of simulations in which every block is valid
+        mask (GridMask): valid blocks on the coarse grid
+        footprint (np.ndarray): True for the cells of valid blocks at the full resolution
+        fine_mask (GridMask): cells of the footprint
+        interpolation (scipy.sparse.csr_matrix): bilinear interpolation from the valid blocks to the footprint
+        models (dict): fitted emulators of the coarse field and, if emulated, of the residual
+
+    Methods:
+        validate(): validates the emulator at both levels
+        predict_samples(input_pred, level): predicts the valid blocks or the footprint
+        predict_vector(input_pred, level): predicts the mean and sd maps at a level
+    """
+    def __init__(self, name:str, qoi:str, threshold:float, factor:int=4, residual:str='interpolate'):
+        """
+        Initialising MultiResolutionEmulators class
+
+        Args:
+            name (str): name of the set of simulations, i.e. synth or acheron
+            qoi (str): quantity of interest, i.e. hmax, vmax or pmax
+            threshold (int, float): Threshold value to define valid cells from simulations
+            factor (int, optional): size of the blocks in cells. Defaults to 4.
+            residual (str, optional): interpolate or emulate the full resolution. Defaults to interpolate.
+
+        Raises:
+            Exception: Invalid residual. It must be interpolate or emulate.
+            Exception: Invalid emulator. The predictions differ from RobustGaSP.
+        """
+        if residual not in ['interpolate', 'emulate']:
+            raise Exception('Invalid residual. It must be interpolate or emulate.')
+
+        self.name = name
+        self.qoi = qoi
+        self.threshold = threshold
+        self.factor = factor
+        self.residual = residual
+        self.sims = Simulations(self.name)
+        validation = Simulations(self.name + '_validation')
+
+        self.vector, self.valid_cols = self.sims.create_vector(qoi, threshold, factor=factor)
+        self.vector_validate = {'coarse': validation.create_vector(qoi, threshold, valid_cols=self.valid_cols, factor=factor)[0]}
+
+        with self.sims._open(qoi) as src:
+            self.size = src.count
+            self.res = src.res[0]
+            self.transform = src.transform
+            self.bounds = src.bounds
+            self.rows = src.height
+            self.cols = src.width
+        self.coarse_rows = -(-self.rows // factor)
+        self.coarse_cols = -(-self.cols // factor)
+        self.coarse_transform = self.transform * rasterio.Affine.scale(factor)
+
+        self.mask = GridMask.from_counts(self.valid_cols, (self.coarse_rows, self.coarse_cols), self.coarse_transform)
+        blocks = (self.valid_cols > 0).reshape(self.coarse_rows, self.coarse_cols)
+        self.footprint = np.kron(blocks, np.ones((factor, factor), dtype=bool))[:self.rows, :self.cols].reshape(-1)
+        self.fine_mask = GridMask(np.flatnonzero(self.footprint), (self.rows, self.cols), self.transform)
+        self.interpolation = self._interpolation()
+        self.vector_validate['fine'] = validation.create_vector(qoi, threshold, valid_cols=self.fine_mask, factor=1)[0]
+
+        self.input_train = data.load_input(self.name, 'emulator')
+        self.input_validate = data.load_input(self.name, 'validation_emulator')
+
+        responses = {'coarse': self.vector}
+        if residual == 'emulate':
+            fine = self.sims.create_vector(qoi, threshold, valid_cols=self.fine_mask, factor=1)[0]
+            responses['residual'] = fine - self._interpolate(self.vector)
+        with ProcessPoolExecutor(max_workers=len(responses), mp_context=multiprocessing.get_context('spawn')) as executor:
+            fitted = executor.map(_fit_ppgasp, [self.input_train] * len(responses), list(responses.values()),
+                                  [self.input_validate] * len(responses))
+            self.models = dict(zip(responses, fitted))
+
+    def _interpolation(self) -> sparse.csr_matrix:
+        # bilinear weights of the centres of the four nearest blocks, clamped at the edges of the grid
+        def weights(count, blocks):
+            position = np.clip((np.arange(count) + 0.5) / self.factor - 0.5, 0, blocks - 1)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, blocks - 1)
+            return lower, upper, position - lower
+
+        row_lower, row_upper, row_weight = weights(self.rows, self.coarse_rows)
+        col_lower, col_upper, col_weight = weights(self.cols, self.coarse_cols)
+        cells = self.fine_mask.indices
+        rows, cols = cells // self.cols, cells % self.cols
+
+        matrix_rows, matrix_cols, matrix_weights = [], [], []
+        for block_rows, weight_rows in [(row_lower, 1 - row_weight), (row_upper, row_weight)]:
+            for block_cols, weight_cols in [(col_lower, 1 - col_weight), (col_upper, col_weight)]:
+                matrix_rows.append(np.arange(cells.size))
+                matrix_cols.append(block_rows[rows] * self.coarse_cols + block_cols[cols])
+                matrix_weights.append(weight_rows[rows] * weight_cols[cols])
+        matrix = sparse.csr_matrix((np.concatenate(matrix_weights), (np.concatenate(matrix_rows), np.concatenate(matrix_cols))),
+                                   shape=(cells.size, self.coarse_rows * self.coarse_cols))
+        # blocks that are never valid are zero, so only the columns of the valid blocks are kept
+        return matrix[:, self.mask.indices].tocsr()
+
+    def _interpolate(self, coarse:np.ndarray) -> np.ndarray:
+        return np.asarray((self.interpolation @ coarse.T).T)
+
+    def _predict(self, input_pred:np.ndarray, level:str):
+        if level not in ['coarse', 'fine']:
+            raise Exception('Invalid level. It must be coarse or fine.')
+        input_pred = np.array(input_pred, dtype=np.float64, ndmin=2)
+        distances = IncrementalGP.distances(self.input_train, input_pred)
+        with tracing.span('gp_predict', simulations=self.name, qoi=self.qoi, level='coarse', samples=len(input_pred)):
+            mean, sd = self.models['coarse'].predict(input_pred, distances)
+        if level == 'coarse':
+            return mean, sd
+        with tracing.span('interpolation', simulations=self.name, qoi=self.qoi, cells=self.interpolation.shape[0]):
+            mean, sd = self._interpolate(mean), self._interpolate(sd)
+        if 'residual' in self.models:
+            with tracing.span('gp_predict', simulations=self.name, qoi=self.qoi, level='residual', samples=len(input_pred)):
+                residual_mean, residual_sd = self.models['residual'].predict(input_pred, distances)
+            mean, sd = mean + residual_mean, np.sqrt(sd ** 2 + residual_sd ** 2)
+        return mean, sd
+
+    def validate(self) -> dict:
+        """
+        Validates the emulator with the validation set at both levels
+
+        Returns:
+            validation (dict): validated mean, pci95, lci95 and mean_sq_err at the coarse and the fine level
+        """
+        dof = min(len(model.design) - model.theta.shape[0] for model in self.models.values())
+        validation = {}
+        for level in ['coarse', 'fine']:
+            mean, sd = self._predict(self.input_validate, level)
+            lower, upper = _bounds(mean, sd, dof)
+
+            validated_mean = np.where(mean < 0, 0, mean)
+            validated_lower = np.where(lower < 0, 0, lower)
+            validated_upper = np.where(upper < 0, 0, upper)
+            actual = self.vector_validate[level]
+            validation[level] = {
+                'validation':validated_mean,
+                'pci95':np.mean(np.where((actual >= validated_lower) & (actual <= validated_upper), 1, 0)),
+                'lci95':np.mean(validated_upper - validated_lower),
+                'mean_sq_err':np.mean((validated_mean - actual) ** 2),
+            }
+        return validation
+
+    def predict_samples(self, input_pred:np.ndarray, level:str='fine') -> np.ndarray:
+        """
+        Performs prediction without reconstructing the maps
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+            level (str, optional): coarse for the valid blocks or fine for the cells of the footprint. Defaults to fine.
+
+        Raises:
+            Exception: Invalid level. It must be coarse or fine.
+
+        Returns:
+            np.ndarray: Predicted mean of every input sample (rows) at every valid block or cell of the footprint (columns)
+        """
+        return self._predict(input_pred, level)[0]
+
+    def predict_vector(self, input_pred:np.ndarray, level:str='fine'):
+        """
+        Performs prediction and summarises it over the input samples
+
+        The predictions are made in batches that fit into the memory budget (see utilities.memory).
+
+        Args:
+            input_pred (np.ndarray): Input testing dataset to perform prediction
+            level (str, optional): coarse for maps of blocks or fine for maps at the full resolution. Defaults to fine.
+
+        Raises:
+            Exception: Invalid level. It must be coarse or fine.
+
+        Returns:
+            pred_mean (np.ndarray): mean map over the input samples
+            pred_sd (np.ndarray): standard deviation map over the input samples
+        """
+        if level not in ['coarse', 'fine']:
+            raise Exception('Invalid level. It must be coarse or fine.')
+        mask = self.mask if level == 'coarse' else self.fine_mask
+        pred_size = input_pred.shape[0]
+        batch_size = memory.rows_within(4 * (mask.size + self.vector.shape[1] + len(self.input_train)) * 8, pred_size, share=0.5)
+
+        moments = _Moments(mask.size, qoi=self.qoi, level=level)
+        for start in range(0, pred_size, batch_size):
+            moments.update(self.predict_samples(input_pred[start:start + batch_size], level))
+        mean, sd = moments.result()
+        memory.report('predict_vector', batch_size=batch_size, batches=-(-pred_size // batch_size), dtype=memory.get_dtype().name,
+                      storage='ram', cells=int(mask.size))
+        return mask.scatter(mean, crop=False), mask.scatter(sd, crop=False)
+
+class IncrementalGP:
+    """
+    A class to represent a fitted GP emulator that is updated with new design points
+
+    The emulator keeps the Cholesky factor of the correlation matrix of the design. New design
+    points and responses are appended by extending the factor by k rows, which costs O(n^2 k)
+    instead of the O(n^3) of a refit, while the range parameters and the nugget are kept fixed.
+    The constant trend, its coefficients and the variance are re-estimated with every update, as
+    in RobustGaSP. The hyperparameters are re-optimised with RobustGaSP only on demand, or when
+    the standardised errors of the new points before the update show that they drifted away
+    from the emulator.
+
+    The predictions are a copy of those of RobustGaSP, so check compares them with predict_rgasp
+    or predict_ppgasp of the fitted model, and an updated factor with a factorisation of all
+    design points. Emulators taken from a model with input_check are checked before they are used.
+
+    Attributes:
+        design (np.ndarray): design points (rows)
+        response (np.ndarray): responses with design points as rows and outputs, e.g. cells, as columns
+        beta (np.ndarray): inverse range parameters of every input
+        nugget (float): nugget of the correlation
+        kernel_type (list): kernel of every input, i.e. matern_5_2, matern_3_2 or pow_exp
+        alpha (np.ndarray): exponents of pow_exp kernels
+        zero_mean (bool): True if the emulator has no trend
+        kind (str): rgasp for a scalar or ppgasp for a vector emulator, used for refits
+        drift_threshold (float): mean squared standardised error of new points that triggers a refit
+        drift (float): mean squared standardised error of the latest update
+        model: R object of the latest fit, or None
+
+    Methods:
+        from_model(model, design, response, kind, input_check): takes the hyperparameters of a fitted RobustGaSP model
+        predict(input_pred): returns the mean and sd at input samples
+        check(input_pred, rtol): compares the predictions with RobustGaSP and with a factorisation of all design points
+        correlation(a, b): returns the prior correlation between input samples
+        covariance(a, b): returns the posterior covariance in units of sigma2
+        update(input_new, output_new, refit): appends new design points and responses
+        refit(): re-optimises the hyperparameters with RobustGaSP
+    """
+    def __init__(self, design:np.ndarray, response:np.ndarray, beta, nugget:float=0.0, kernel_type='matern_5_2',
+                 alpha=1.9, zero_mean:bool=False, kind:str='rgasp', drift_threshold:float=4.0):
+        """
+        Initialising IncrementalGP class
+
+        Args:
+            design (np.ndarray): design points (rows)
+            response (np.ndarray): responses of the design points, a vector for a scalar emulator
+            beta (np.ndarray): inverse range parameters of every input
+            nugget (float, optional): nugget of the correlation. Defaults to 0.0.
+            kernel_type (str, list, optional): kernel of all or of every input. Defaults to matern_5_2.
+            alpha (float, np.ndarray, optional): exponents of pow_exp kernels. Defaults to 1.9.
+            zero_mean (bool, optional): True if the emulator has no trend. Defaults to False.
+            kind (str, optional): rgasp or ppgasp, used for refits. Defaults to rgasp.
+            drift_threshold (float, optional): mean squared standardised error of new points that triggers a refit. None disables refits by drift. Defaults to 4.0.
+
+        Raises:
+            Exception: Invalid kind. It must be rgasp or ppgasp.
+            Exception: Invalid kernel. It must be matern_5_2, matern_3_2 or pow_exp.
+            ValueError: design and response must have the same number of rows
+        """
+        if kind not in ['rgasp', 'ppgasp']:
+            raise Exception('Invalid kind. It must be rgasp or ppgasp.')
+        design = np.array(design, dtype=np.float64, ndmin=2)
+        response = np.asarray(response, dtype=np.float64)
+        self.scalar = response.ndim == 1
+        response = response.reshape(len(response), -1)
+        if design.shape[0] != response.shape[0]:
+            raise ValueError('design and response must have the same number of rows')
+
+        dim = design.shape[1]
+        self.beta = np.resize(np.asarray(beta, dtype=np.float64), dim)
+        self.nugget = float(nugget)
+        self.kernel_type = list(np.resize(np.asarray(kernel_type, dtype=str), dim))
+        for kernel in self.kernel_type:
+            if kernel not in ['matern_5_2', 'matern_3_2', 'pow_exp']:
+                raise Exception('Invalid kernel. It must be matern_5_2, matern_3_2 or pow_exp.')
+        self.alpha = np.resize(np.asarray(alpha, dtype=np.float64), dim)
+        self.zero_mean = zero_mean
+        self.kind = kind
+        self.drift_threshold = drift_threshold
+        self.drift = None
+        self.model = None
+        self._model_size = None
+        self._factorise(design, response)
+
+    @classmethod
+    def from_model(cls, model, design:np.ndarray, response:np.ndarray, kind:str='rgasp', drift_threshold:float=4.0,
+                   input_check:np.ndarray=None, rtol:float=1e-4):
+        """
+        Takes the hyperparameters of a fitted RobustGaSP model
+
+        Args:
+            model: R object of an rgasp or ppgasp emulator
+            design (np.ndarray): design points of the model
+            response (np.ndarray): responses of the model
+            kind (str, optional): rgasp or ppgasp. Defaults to rgasp.
+            drift_threshold (float, optional): mean squared standardised error of new points that triggers a refit. Defaults to 4.0.
+            input_check (np.ndarray, optional): input samples at which the emulator is compared with the model, see check. Defaults to None, i.e. not checked.
+            rtol (float, optional): tolerance of the check. Defaults to 1e-4.
+
+        Raises:
+            Exception: Invalid emulator. The predictions differ from RobustGaSP.
+
+        Returns:
+            IncrementalGP: emulator with the hyperparameters of the model
+        """
+        with converter():
+            slots = model.slots
+            emulator = cls(design, response,
+                           beta=np.asarray(slots['beta_hat'], dtype=np.float64).ravel(),
+                           nugget=float(np.asarray(slots['nugget']).ravel()[0]),
+                           kernel_type=[str(kernel) for kernel in np.asarray(slots['kernel_type']).ravel()],
+                           alpha=np.asarray(slots['alpha'], dtype=np.float64).ravel(),
+                           zero_mean=str(np.asarray(slots['zero_mean']).ravel()[0]) == 'Yes',
+                           kind=kind, drift_threshold=drift_threshold)
+        emulator.model = model
+        emulator._model_size = len(emulator.design)
+        if input_check is not None:
+            emulator.check(input_check, rtol)
+        return emulator
+
+    def correlation(self, a:np.ndarray, b:np.ndarray, distances:list=None) -> np.ndarray:
+        """
+        Returns the prior correlation between input samples
+
+        Args:
+            a (np.ndarray): input samples (rows)
+            b (np.ndarray): other input samples (columns of the result)
+            distances (list, optional): absolute differences between a and b of every input, see distances. Defaults to None.
+
+        Returns:
+            np.ndarray: correlation matrix
+        """
+        if distances is None:
+            distances = IncrementalGP.distances(a, b)
+        corr = np.ones((a.shape[0], b.shape[0]))
+        for i, kernel in enumerate(self.kernel_type):
+            dist = distances[i] * self.beta[i]
+            if kernel == 'matern_5_2':
+                corr *= (1 + np.sqrt(5) * dist + 5 / 3 * dist ** 2) * np.exp(-np.sqrt(5) * dist)
+            elif kernel == 'matern_3_2':
+                corr *= (1 + np.sqrt(3) * dist) * np.exp(-np.sqrt(3) * dist)
+            else:
+                corr *= np.exp(-dist ** self.alpha[i])
+        return corr
+
+    @staticmethod
+    def distances(a:np.ndarray, b:np.ndarray) -> list:
+        """
+        Returns the absolute differences between input samples of every input
+
+        They do not depend on the hyperparameters, so they can be shared between emulators with
+        the same design, e.g. of several quantities of interest.
+
+        Args:
+            a (np.ndarray): input samples (rows)
+            b (np.ndarray): other input samples (columns)
+
+        Returns:
+            list: absolute differences of every input
+        """
+        return [np.abs(a[:, i, np.newaxis] - b[np.newaxis, :, i]) for i in range(a.shape[1])]
+
+    def _trend(self, inputs:np.ndarray) -> np.ndarray:
+        return np.ones((inputs.shape[0], 0 if self.zero_mean else 1))
+
+    def _factorise(self, design:np.ndarray, response:np.ndarray):
+        self.design = design
+        self.response = response
+        corr = self.correlation(design, design) + self.nugget * np.eye(len(design))
+        self._chol = linalg.cholesky(corr, lower=True)
+        self._white_response = linalg.solve_triangular(self._chol, response, lower=True)
+        self._white_trend = linalg.solve_triangular(self._chol, self._trend(design), lower=True)
+        self._estimate()
+
+    def _estimate(self):
+        n, q = self._white_trend.shape
+        if q > 0:
+            self._trend_cov = np.linalg.inv(self._white_trend.T @ self._white_trend)
+            self.theta = self._trend_cov @ (self._white_trend.T @ self._white_response)
+        else:
+            self._trend_cov = np.zeros((0, 0))
+            self.theta = np.zeros((0, self.response.shape[1]))
+        self._white_residual = self._white_response - self._white_trend @ self.theta
+        self.sigma2 = np.sum(self._white_residual ** 2, axis=0) / (n - q)
+
+    def _whiten(self, inputs:np.ndarray, distances:list=None):
+        white_corr = linalg.solve_triangular(self._chol, self.correlation(self.design, inputs, distances), lower=True)
+        return white_corr, self._trend(inputs) - white_corr.T @ self._white_trend
+
+    def covariance(self, a:np.ndarray, b:np.ndarray=None) -> np.ndarray:
+        """
+        Returns the posterior covariance of the emulator in units of the variance sigma2
+
+        It does not depend on the responses, and all outputs of a vector emulator share it.
+
+        Args:
+            a (np.ndarray): input samples (rows)
+            b (np.ndarray, optional): other input samples. Defaults to None, i.e. the variances at a.
+
+        Returns:
+            np.ndarray: covariances between a (rows) and b (columns), or the variances at a
+        """
+        a = np.array(a, dtype=np.float64, ndmin=2)
+        white_a, unexplained_a = self._whiten(a)
+        if b is None:
+            return 1 - np.sum(white_a ** 2, axis=0) + np.sum((unexplained_a @ self._trend_cov) * unexplained_a, axis=1)
+        b = np.array(b, dtype=np.float64, ndmin=2)
+        white_b, unexplained_b = self._whiten(b)
+        return self.correlation(a, b) - white_a.T @ white_b + unexplained_a @ self._trend_cov @ unexplained_b.T
+
+    def predict(self, input_pred:np.ndarray, distances:list=None, columns:np.ndarray=None):
+        """
+        Performs prediction at input samples
+
+        The sd is the one of the Student t predictive distribution with n - q degrees of freedom,
+        where q is the number of trend coefficients.
+
+        Args:
+            input_pred (np.ndarray): input samples (rows)
+            distances (list, optional): distances between the design and the input samples. Defaults to None.
+            columns (np.ndarray, optional): outputs to predict, e.g. some cells of a vector emulator. Defaults to None, i.e. all.
+
+        Returns:
+            mean (np.ndarray): predicted mean of every input sample (rows) and output (columns), a vector for a scalar emulator
+            sd (np.ndarray): predicted standard deviation with the same shape
+        """
+        input_pred = np.array(input_pred, dtype=np.float64, ndmin=2)
+        columns = slice(None) if columns is None or self.scalar else columns
+        n, q = self._white_trend.shape
+        white_corr, unexplained = self._whiten(input_pred, distances)
+        mean = self._trend(input_pred) @ self.theta[:, columns] + white_corr.T @ self._white_residual[:, columns]
+
+        scale = 1 + self.nugget - np.sum(white_corr ** 2, axis=0) + np.sum((unexplained @ self._trend_cov) * unexplained, axis=1)
+        dof = n - q
+        var = np.maximum(scale, 0)[:, np.newaxis] * self.sigma2[np.newaxis, columns] * dof / max(dof - 2, 1)
+        sd = np.sqrt(var)
+        if self.scalar:
+            return mean[:, 0], sd[:, 0]
+        return mean, sd
+
+    def check(self, input_pred:np.ndarray, rtol:float=1e-4) -> dict:
+        """
+        Compares the predictions with RobustGaSP and with a factorisation of all design points
+
+        The mean, sd, lower95 and upper95 are compared with predict_rgasp or predict_ppgasp of the
+        model if the emulator was not updated since the model was fitted. The mean and sd are
+        compared with an emulator factorised from all design points with the same hyperparameters,
+        which checks the extended factor of update. The differences are relative to the largest
+        sd of the reference.
+
+        Args:
+            input_pred (np.ndarray): input samples (rows), e.g. the validation inputs
+            rtol (float, optional): largest relative difference. Defaults to 1e-4.
+
+        Raises:
+            Exception: Invalid emulator. The predictions differ from RobustGaSP.
+            Exception: Invalid emulator. The updated predictions differ from a refactorisation.
+
+        Returns:
+            differences (dict): largest relative differences according to the compared quantity
+        """
+        input_pred = np.array(input_pred, dtype=np.float64, ndmin=2)
+        mean, sd = self.predict(input_pred)
+        lower, upper = _bounds(mean, sd, self._white_trend.shape[0] - self._white_trend.shape[1])
+        differences = {}
+
+        def compare(names, computed, reference, sd_expected):
+            scale = max(float(np.max(sd_expected, initial=0)), np.finfo(float).tiny)
+            for name, value, expected in zip(names, computed, reference):
+                differences[name] = float(np.max(np.abs(value - expected.reshape(value.shape)), initial=0)) / scale
+
+        if self.model is not None and self._model_size == len(self.design):
+            with tracing.span('gp_check', kind=self.kind, samples=len(input_pred)), converter():
+                predict = robustgasp.predict_rgasp if self.kind == 'rgasp' else robustgasp.predict_ppgasp
+                predicted = predict(object=self.model, testing_input=input_pred)
+                reference = [np.asarray(array, dtype=np.float64) for array in list(predicted)[:4]]
+            compare(['mean', 'lower95', 'upper95', 'sd'], [mean, lower, upper, sd], reference, reference[3])
+            if max(differences.values()) > rtol:
+                raise Exception('Invalid emulator. The predictions differ from RobustGaSP: ' + str(differences))
+
+        refactorised = IncrementalGP(self.design, self.response[:, 0] if self.scalar else self.response, self.beta,
+                                     nugget=self.nugget, kernel_type=self.kernel_type, alpha=self.alpha,
+                                     zero_mean=self.zero_mean, kind=self.kind, drift_threshold=None)
+        expected_mean, expected_sd = refactorised.predict(input_pred)
+        compare(['refactorised_mean', 'refactorised_sd'], [mean, sd], [expected_mean, expected_sd], expected_sd)
+        if max(differences['refactorised_mean'], differences['refactorised_sd']) > rtol:
+            raise Exception('Invalid emulator. The updated predictions differ from a refactorisation: ' + str(differences))
+        return differences
+
+    def update(self, input_new:np.ndarray, output_new:np.ndarray, refit:bool=False) -> bool:
+        """
+        Appends new design points and responses
+
+        Args:
+            input_new (np.ndarray): new design points (rows)
+            output_new (np.ndarray): responses of the new design points
+            refit (bool, optional): re-optimise the hyperparameters with RobustGaSP. Defaults to False.
+
+        Raises:
+            ValueError: input_new and output_new must have the same number of rows
+
+        Returns:
+            bool: True if the emulator was refitted
+        """
+        input_new = np.array(input_new, dtype=np.float64, ndmin=2)
+        output_new = np.asarray(output_new, dtype=np.float64).reshape(input_new.shape[0], -1)
+        if output_new.shape[0] != input_new.shape[0]:
+            raise ValueError('input_new and output_new must have the same number of rows')
+
+        mean, sd = self.predict(input_new)
+        mean, sd = mean.reshape(output_new.shape), sd.reshape(output_new.shape)
+        self.drift = float(np.mean(((output_new - mean) / np.where(sd > 0, sd, np.inf)) ** 2))
+
+        design = np.concatenate([self.design, input_new])
+        response = np.concatenate([self.response, output_new])
+        if refit or (self.drift_threshold is not None and self.drift > self.drift_threshold):
+            previous = self.design, self.response
+            self.design, self.response = design, response
+            try:
+                self.refit()
+            except Exception:
+                self.design, self.response = previous
+                raise
+            return True
+
+        with tracing.span('gp_update', kind=self.kind, size=len(self.design), added=len(input_new)):
+            cross = linalg.solve_triangular(self._chol, self.correlation(self.design, input_new), lower=True)
+            schur = self.correlation(input_new, input_new) + self.nugget * np.eye(len(input_new)) - cross.T @ cross
+            chol_new = linalg.cholesky(schur, lower=True)
+
+            n, k = len(self.design), len(input_new)
+            chol = np.zeros((n + k, n + k))
+            chol[:n, :n] = self._chol
+            chol[n:, :n] = cross.T
+            chol[n:, n:] = chol_new
+            self._chol = chol
+            self._white_response = np.concatenate([self._white_response, linalg.solve_triangular(
+                chol_new, output_new - cross.T @ self._white_response, lower=True)])
+            self._white_trend = np.concatenate([self._white_trend, linalg.solve_triangular(
+                chol_new, self._trend(input_new) - cross.T @ self._white_trend, lower=True)])
+            self.design, self.response = design, response
+            self._estimate()
+        return False
+
+    def refit(self):
+        """ Re-optimises the hyperparameters with RobustGaSP on all design points """
+        response = self.response[:, 0] if self.scalar else self.response
+        with tracing.span('gp_fit', kind=self.kind, size=len(self.design)), converter():
+            fit = robustgasp.rgasp if self.kind == 'rgasp' else robustgasp.ppgasp
+            model = fit(design=self.design, response=response)
+        refitted = IncrementalGP.from_model(model, self.design, response, kind=self.kind, drift_threshold=self.drift_threshold)
+        drift = self.drift
+        self.__dict__.update(refitted.__dict__)
+        self.drift = drift
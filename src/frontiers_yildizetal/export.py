@@ -0,0 +1,149 @@
+import os
+import tempfile
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from frontiers_yildizetal.analysis.quantiles import QuantileSketch
+from frontiers_yildizetal.utilities import tracing
+
+def overview_factors(rows:int, cols:int, blocksize:int=512) -> list:
+    """
+    Returns the decimation factors of an overview pyramid down to a single block
+
+    Args:
+        rows (int): rows of the raster
+        cols (int): cols of the raster
+        blocksize (int, optional): size of the tiles. Defaults to 512.
+
+    Returns:
+        list: factors 2, 4, 8, ... until the coarsest overview fits into one tile
+    """
+    factors = []
+    factor = 2
+    while max(rows, cols) / (factor // 2) > blocksize:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+def write_cog(path:str, values:np.ndarray, mask, crs=None, nodata:float=np.nan, dtype:str='float32',
+              blocksize:int=512, compress:str='deflate', resampling:str='average', overviews:list=None,
+              description:str=None) -> str:
+    """
+    Writes values of the valid cells as a cloud-optimized GeoTIFF
+
+    The raster is written in strips of blocksize rows into a tiled temporary GeoTIFF, and only the
+    strips that overlap the bounding window of the mask are written, so the other tiles stay
+    sparse and the memory is limited to one strip. The overviews are built in the temporary file
+    and copied with the tiles into the COG, whose overviews follow the full resolution in the file.
+
+    Args:
+        path (str): path of the COG
+        values (np.ndarray): values of the valid cells of the mask
+        mask (GridMask): valid cells with the shape and the transform of the grid
+        crs (rasterio.crs.CRS, optional): coordinate reference system, e.g. of the stack. Defaults to None.
+        nodata (float, optional): value of the other cells. Defaults to NaN.
+        dtype (str, optional): data type of the raster. Defaults to float32.
+        blocksize (int, optional): size of the tiles, a multiple of 16. Defaults to 512.
+        compress (str, optional): compression of the tiles, e.g. deflate, lzw or zstd. Defaults to deflate.
+        resampling (str, optional): resampling of the overviews, e.g. average or nearest. Defaults to average.
+        overviews (list, optional): decimation factors of the overviews. Defaults to overview_factors.
+        description (str, optional): description of the band, e.g. mean. Defaults to None.
+
+    Raises:
+        ValueError: blocksize must be a positive multiple of 16
+        ValueError: values must have one value per valid cell
+
+    Returns:
+        str: path of the COG
+    """
+    if blocksize < 16 or blocksize % 16 != 0:
+        raise ValueError('blocksize must be a positive multiple of 16')
+    values = np.asarray(values).reshape(-1)
+    if values.size != mask.size:
+        raise ValueError('values must have one value per valid cell')
+    rows, cols = mask.shape
+    if overviews is None:
+        overviews = overview_factors(rows, cols, blocksize)
+
+    profile = dict(driver='GTiff', height=rows, width=cols, count=1, dtype=dtype, crs=crs, transform=mask.transform,
+                   nodata=nodata, tiled=True, blockxsize=blocksize, blockysize=blocksize, compress=compress,
+                   sparse_ok=True, bigtiff='IF_SAFER')
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp = tempfile.mkstemp(dir=directory, suffix='.tif')
+    os.close(handle)
+    try:
+        with tracing.span('cog_write', path=os.path.basename(path), cells=mask.size), rasterio.open(tmp, 'w', **profile) as dst:
+            window = mask.window
+            for row in range(int(window.row_off) // blocksize * blocksize, int(window.row_off + window.height), blocksize):
+                strip = Window(0, row, cols, min(blocksize, rows - row))
+                start, stop = np.searchsorted(mask.indices, [row * cols, (row + strip.height) * cols])
+                band = np.full(strip.height * cols, nodata, dtype=dtype)
+                band[mask.indices[start:stop] - row * cols] = values[start:stop]
+                dst.write(band.reshape(strip.height, cols), 1, window=strip)
+            if description is not None:
+                dst.set_band_description(1, description)
+            if overviews:
+                dst.build_overviews(overviews, Resampling[resampling])
+                dst.update_tags(ns='rio_overview', resampling=resampling)
+
+        with tracing.span('cog_copy', path=os.path.basename(path), overviews=len(overviews)):
+            rasterio.shutil.copy(tmp, path, driver='COG', compress=compress, blocksize=blocksize,
+                                 overviews='FORCE_USE_EXISTING' if overviews else 'NONE', bigtiff='IF_SAFER')
+    finally:
+        os.remove(tmp)
+    return path
+
+def export_maps(emulator, input_pred:np.ndarray, directory:str, thresholds=(), quantiles=(), batch_size:int=100,
+                k:int=200, seed=None, **options) -> dict:
+    """
+    Exports predicted hazard maps of a vector emulator as cloud-optimized GeoTIFFs
+
+    The predictions are streamed in batches into accumulators of the mean and sd, of the number of
+    samples that exceed every threshold and, if quantiles are requested, into a quantile sketch,
+    so the samples are never held at once. Every map is written with write_cog, with the CRS and
+    the transform of the stack, as <name>_<qoi>_<map>.tif, e.g. synth_hmax_mean.tif,
+    synth_hmax_exceedance_1.0.tif or synth_hmax_q0.95.tif.
+
+    Args:
+        emulator (VectorEmulators): vector emulator of a quantity of interest
+        input_pred (np.ndarray): Input testing dataset to perform prediction
+        directory (str): directory of the COGs
+        thresholds (list, optional): thresholds of the exceedance probabilities, e.g. 0.5 and 1.0 m. Defaults to none.
+        quantiles (list, optional): quantiles between 0 and 1, e.g. 0.05 and 0.95. Defaults to none.
+        batch_size (int, optional): number of input samples per prediction call. Defaults to 100.
+        k (int, optional): capacity of the top level of the quantile sketch. Defaults to 200.
+        seed (int, optional): seed of the random compaction offsets of the sketch. Defaults to None.
+        **options: options of write_cog, e.g. blocksize, compress or nodata
+
+    Returns:
+        paths (dict): paths of the COGs according to the map
+    """
+    from frontiers_yildizetal.emulators import _Moments
+
+    mask = emulator.mask
+    moments = _Moments(mask.size, qoi=emulator.qoi)
+    exceedances = np.zeros((len(thresholds), mask.size))
+    sketch = QuantileSketch(k=k, shape=(mask.size,), seed=seed) if len(quantiles) else None
+    for predicted in emulator.predict_batches(input_pred, batch_size=batch_size):
+        moments.update(predicted)
+        for i, threshold in enumerate(thresholds):
+            exceedances[i] += np.count_nonzero(predicted >= threshold, axis=0)
+        if sketch is not None:
+            sketch.update(predicted)
+
+    mean, sd = moments.result()
+    maps = {'mean':mean, 'sd':sd}
+    for i, threshold in enumerate(thresholds):
+        maps['exceedance_' + str(float(threshold))] = exceedances[i] / moments.count
+    if sketch is not None:
+        for q, values in zip(quantiles, sketch.quantile(np.asarray(quantiles, dtype=np.float64))):
+            maps['q' + str(float(q))] = values
+
+    with emulator.sims._open(emulator.qoi) as src:
+        crs = src.crs
+    os.makedirs(directory, exist_ok=True)
+    return {key: write_cog(os.path.join(directory, '%s_%s_%s.tif' % (emulator.name, emulator.qoi, key)), values, mask,
+                           crs=crs, description=key, **options)
+            for key, values in maps.items()}
@@ -1,6 +1,46 @@
+import json
+import os
+import tempfile
 import numpy as np
 import rasterio
-from frontiers_yildizetal.utilities import data
+from contextlib import ExitStack
+from rasterio.windows import Window
+from frontiers_yildizetal.utilities import data, memory, results, tracing
+from frontiers_yildizetal.utilities.grid import GridMask
+
+def area(values:np.ndarray, threshold:float, res:float) -> float:
+    """ Calculates the area in km2 of the cells of a band that are not below the threshold, e.g. the impact or deposit area """
+    valid_cells = np.where(values >= threshold, 1, 0)
+    return np.sum(valid_cells) * res ** 2 / 1000000
+
+def volume(values:np.ndarray, threshold:float, res:float) -> float:
+    """ Calculates the volume in 1e6 m3 of the cells of a band that are not below the threshold, e.g. the deposit volume """
+    valid_cells = np.where(values >= threshold, res ** 2, 0)
+    return round((np.sum(np.multiply(values, valid_cells)) / 1000000), 3)
+
+def aggregate(values:np.ndarray, factor:int, func=np.mean) -> np.ndarray:
+    """ Aggregates a band to blocks of factor x factor cells
+
+    Blocks at the right and bottom edges that extend beyond the band aggregate only the cells inside it.
+
+    Args:
+        values (np.ndarray): band with shape (rows, cols)
+        factor (int): size of the blocks in cells
+        func (callable, optional): aggregation of a block, e.g. np.mean or np.max. Defaults to np.mean.
+
+    Returns:
+        np.ndarray: aggregated band with shape (ceil(rows / factor), ceil(cols / factor))
+    """
+    rows, cols = values.shape
+    padded = np.full((-(-rows // factor) * factor, -(-cols // factor) * factor), np.nan)
+    padded[:rows, :cols] = values
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    nanfunc = {np.mean: np.nanmean, np.max: np.nanmax, np.min: np.nanmin, np.sum: np.nansum}.get(func, func)
+    return nanfunc(blocks, axis=(1, 3))
+
+# footprints found or loaded in this process, according to the checksum of the stack, the qoi and
+# the threshold. They are shared by all Simulations of the process and are also kept on disk.
+_footprints = {}
 
 class Simulations:
     """
@@ -23,10 +63,18 @@ class Simulations:
         Calculates the deposit volume of a collection of simulations    
     extract_qoi_at(qoi, loc_x, loc_y):
         Extracts an quantitiy of interest from a given coordinate
+    extract_qoi_at_sites(qoi, locs):
+        Extracts an quantitiy of interest from many coordinates
     curate_scalars(threshold, loc_x, loc_y):
         Curates a dataframe consisting of calculated or extracted scalars from simulations
-    create_vector(qoi, threshold, valid_cols=None):
+    curate_sites(threshold, locs):
+        Curates scalars from simulations at many coordinates
+    footprint(qoi, threshold):
+        Returns the bounding window of the cells that are valid in any simulation
+    create_vector(qoi, threshold, valid_cols=None, factor=1, crop=False):
         Creates a dataframe of simulation outputs to be used in vector emulators
+    create_vectors(qois, threshold, valid_cols=None):
+        Creates outputs of several quantities of interest on a shared set of valid cells
     """
 
     def __init__(self, name: str):
@@ -62,11 +110,101 @@ class Simulations:
         self.name = name
         self.data_import = data.FigshareData(self.name)
         
-        with rasterio.open(self.data_import.raster_link('hmax')) as src:
+        with self._open('hmax') as src:
             self.size = src.count
             self.res = src.res[0]
             self.bounds = src.bounds
 
+    def _open(self, qoi: str):
+        with tracing.span('raster_open', simulations=self.name, qoi=qoi):
+            return rasterio.open(self.data_import.raster_link(qoi))
+
+    def _read(self, src, band: int, qoi: str, window=None) -> np.ndarray:
+        with tracing.span('band_decode', qoi=qoi, band=band):
+            return src.read(band, window=window)
+
+    def _mask(self, src, valid_cols, factor: int = 1) -> GridMask:
+        if isinstance(valid_cols, GridMask):
+            return valid_cols
+        shape = (-(-src.height // factor), -(-src.width // factor))
+        return GridMask.from_counts(valid_cols, shape, src.transform * src.transform.scale(factor))
+
+    def footprint(self, qoi: str, threshold: float) -> Window:
+        """ Returns the bounding window of the cells that are not below the threshold in any simulation
+
+        Finding the window reads every band once, unless create_vector already recorded it from the
+        valid cells. The window is cached in the footprints directory of the cache according to the
+        checksum of the stack and the threshold, so it is read from the cache by later calls and
+        other processes.
+
+        Args:
+            qoi (str): quantity of interest, e.g. hmax
+            threshold (int, float): Threshold value to define valid cells from simulations
+
+        Raises:
+            TypeError: threshold must be a number
+            ValueError: threshold cannot be negative
+
+        Returns:
+            rasterio.windows.Window: bounding window, which is empty if no cell is valid
+        """
+        if not isinstance(threshold, (int, float)):
+            raise TypeError('threshold must be a number')
+        if threshold < 0:
+            raise ValueError('threshold cannot be negative')
+
+        window = self._cached_footprint(qoi, threshold)
+        if window is not None:
+            return window
+
+        with tracing.span('footprint', simulations=self.name, qoi=qoi), self._open(qoi) as src:
+            any_rows = np.zeros(src.height, dtype=bool)
+            any_cols = np.zeros(src.width, dtype=bool)
+            for sim in range(self.size):
+                valid = self._read(src, sim + 1, qoi) >= np.float64(threshold)
+                any_rows |= valid.any(axis=1)
+                any_cols |= valid.any(axis=0)
+        if any_rows.any():
+            rows, cols = np.flatnonzero(any_rows), np.flatnonzero(any_cols)
+            window = Window(int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+        else:
+            window = Window(0, 0, 0, 0)
+        self._store_footprint(qoi, threshold, window)
+        return window
+
+    def _footprint_key(self, qoi: str, threshold: float) -> str:
+        return '%s_%s_%r' % (self.data_import.checksum(qoi), qoi, float(threshold))
+
+    def _cached_footprint(self, qoi: str, threshold: float) -> Window:
+        # the footprint if it was found before in this process or any other, otherwise None
+        key = self._footprint_key(qoi, threshold)
+        if key not in _footprints:
+            path = os.path.join(data.cache_dir('footprints'), key + '.json')
+            if not os.path.exists(path):
+                return None
+            with open(path) as file:
+                _footprints[key] = Window(*json.load(file))
+        return _footprints[key]
+
+    def _store_footprint(self, qoi: str, threshold: float, window: Window):
+        key = self._footprint_key(qoi, threshold)
+        directory = data.cache_dir('footprints')
+        handle, tmp = tempfile.mkstemp(dir=directory, suffix='.json')
+        with os.fdopen(handle, 'w') as file:
+            json.dump([int(window.col_off), int(window.row_off), int(window.width), int(window.height)], file)
+        os.replace(tmp, os.path.join(directory, key + '.json'))
+        _footprints[key] = window
+
+    def _window(self, src, footprint: Window, factor: int) -> Window:
+        # the footprint aligned to the blocks, so that the aggregated window is a window of the coarse grid
+        if footprint.height == 0:
+            return Window(0, 0, 1, 1)
+        row_off = footprint.row_off // factor * factor
+        col_off = footprint.col_off // factor * factor
+        row_end = min(-(-(footprint.row_off + footprint.height) // factor) * factor, src.height)
+        col_end = min(-(-(footprint.col_off + footprint.width) // factor) * factor, src.width)
+        return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
     def calc_ia(self, threshold: float) -> np.ndarray:
         """ Calculates the impact area of a collection of simulations
 
@@ -86,15 +224,13 @@ class Simulations:
         if threshold < 0:
             raise ValueError('threshold cannot be negative')
         
-        ia = np.empty((self.size))
+        ia = np.empty(self.size, dtype=memory.get_dtype())
         
-        with rasterio.open(self.data_import.raster_link('hmax')) as src:
-            print('Calculating IA', end='\r')
+        with tracing.span('calc_ia', simulations=self.name), self._open('hmax') as src:
             for band in range(self.size):
-                valid_cells = np.where(src.read(band + 1) >= threshold, 1, 0)
-                ia_band = np.sum(valid_cells) * self.res ** 2 / 1000000
-                ia[band] = ia_band
-            print('IA calculated.')
+                values = self._read(src, band + 1, 'hmax')
+                with tracing.span('reduction', scalar='ia', band=band + 1):
+                    ia[band] = area(values, threshold, self.res)
             
         return ia
 
@@ -117,15 +253,13 @@ class Simulations:
         if threshold < 0:
             raise ValueError('threshold cannot be negative')
         
-        da = np.empty((self.size))
+        da = np.empty(self.size, dtype=memory.get_dtype())
         
-        with rasterio.open(self.data_import.raster_link('hfin')) as src:
-            print('Calculating DA', end='\r')
+        with tracing.span('calc_da', simulations=self.name), self._open('hfin') as src:
             for band in range(self.size):
-                valid_cells = np.where(src.read(band + 1) >= threshold, 1, 0)
-                da_band = np.sum(valid_cells) * self.res ** 2 / 1000000
-                da[band] = da_band
-            print('DA calculated.')
+                values = self._read(src, band + 1, 'hfin')
+                with tracing.span('reduction', scalar='da', band=band + 1):
+                    da[band] = area(values, threshold, self.res)
         
         return da
 
@@ -148,16 +282,13 @@ class Simulations:
         if threshold < 0:
             raise ValueError('threshold cannot be negative')
 
-        dv = np.empty((self.size))
+        dv = np.empty(self.size, dtype=memory.get_dtype())
         
-        with rasterio.open(self.data_import.raster_link('hfin')) as src:
-            print('Calculating DV', end='\r')
+        with tracing.span('calc_dv', simulations=self.name), self._open('hfin') as src:
             for band in range(self.size):
-                valid_cells = np.where(src.read(band + 1) >= threshold, self.res ** 2, 0)
-                volume = np.multiply(src.read(band + 1), valid_cells)
-                dv_band = round((np.sum(volume) / 1000000), 3)
-                dv[band] = dv_band
-            print('DV calculated.')
+                values = self._read(src, band + 1, 'hfin')
+                with tracing.span('reduction', scalar='dv', band=band + 1):
+                    dv[band] = volume(values, threshold, self.res)
             
         return dv
 
@@ -195,22 +326,64 @@ class Simulations:
         if loc_y <= self.bounds[1] or loc_y >= self.bounds[3]:
             raise Exception('y-coordinate is out of bounds')
         
-        extracted_qoi = np.empty((self.size))
+        extracted_qoi = np.empty(self.size, dtype=memory.get_dtype())
         
-        with rasterio.open(self.data_import.raster_link(qoi)) as src:
+        with tracing.span('extract_qoi_at', simulations=self.name, qoi=qoi), self._open(qoi) as src:
             row = src.index(loc_x, loc_y)[0]
             col = src.index(loc_x, loc_y)[1]
-            print('Extracting ' + qoi, end='\r')
             for band in range(self.size):
-                val_qoi = src.read(band + 1)[row, col]
+                val_qoi = self._read(src, band + 1, qoi)[row, col]
                 extracted_qoi[band] = val_qoi
-            print(qoi + ' extracted.')
             
         return extracted_qoi
 
+    def extract_qoi_at_sites(self, qoi, locs) -> np.ndarray:
+        """ Extract a quantity of interest from many locations with a single read of each band
+
+        Args:
+            qoi (str): quantity of interest, i.e. hmax for maximum flow height,
+            vmax for maximum flow height, and pmax for maximum flow pressure
+            locs (list): a list of (x, y) coordinates of the points of extract
+
+        Raises:
+            TypeError: qoi must be a string
+            Exception: Invalid QoI. It should be hmax, vmax, or pmax.
+            TypeError: coordinates must be integers or floats
+            Exception: x-coordinate is out of bounds
+            Exception: y-coordinate is out of bounds
+
+        Returns:
+            extracted_qoi (np.ndarray): an array of extracted quantity of interest with simulations as rows and sites as columns
+        """
+
+        if not isinstance(qoi, str):
+            raise TypeError('qoi must be a string')
+        if qoi not in ['hmax', 'vmax', 'pmax']:
+            raise Exception('Invalid QoI. It should be hmax, vmax, or pmax.')
+        for loc_x, loc_y in locs:
+            if not isinstance(loc_x, (int, float)) or not isinstance(loc_y, (int, float)):
+                raise TypeError('coordinates must be integers or floats')
+            if loc_x <= self.bounds[0] or loc_x >= self.bounds[2]:
+                raise Exception('x-coordinate is out of bounds')
+            if loc_y <= self.bounds[1] or loc_y >= self.bounds[3]:
+                raise Exception('y-coordinate is out of bounds')
+
+        extracted_qoi = np.empty((self.size, len(locs)), dtype=memory.get_dtype())
+
+        with tracing.span('extract_qoi_at_sites', simulations=self.name, qoi=qoi, sites=len(locs)), self._open(qoi) as src:
+            rows, cols = np.array([src.index(loc_x, loc_y) for loc_x, loc_y in locs]).T
+            for band in range(self.size):
+                extracted_qoi[band] = self._read(src, band + 1, qoi)[rows, cols]
+
+        return extracted_qoi
+
     def curate_scalars(self, threshold: float, loc_x: float, loc_y: float) -> dict:
         """ Curates scalar outputs from simulations
 
+        The scalars are kept in the result cache (see utilities.results) according to the checksums
+        of the stacks, the arguments, the precision policy and the package sources, so they are
+        computed once for all processes and again after the code changed.
+
         Args:
             threshold (float): Threshold value to define the scalars from simulations
             loc_x (int, float): x coordinate of the point of extract
@@ -237,6 +410,11 @@ class Simulations:
         if not isinstance(loc_y, (int, float)):
             raise TypeError('y-coordinate (loc_y) must be an integer or a float')
 
+        key = results.key('curate_scalars', [self.data_import.checksum(qoi) for qoi in ['hmax', 'hfin', 'vmax']],
+                          threshold=float(threshold), loc_x=float(loc_x), loc_y=float(loc_y), dtype=memory.get_dtype().name)
+        scalars = results.load(key)
+        if scalars is not None:
+            return scalars
         scalars = {}
 
         scalars['ia'] = self.calc_ia(threshold)
@@ -246,25 +424,83 @@ class Simulations:
         scalars['vmax'] = self.extract_qoi_at(qoi='vmax', loc_x=loc_x, loc_y=loc_y)
         scalars['hmax'] = self.extract_qoi_at(qoi='hmax', loc_x=loc_x, loc_y=loc_y)
 
+        results.save(key, scalars, compress=True)
+        return scalars
+
+    def curate_sites(self, threshold: float, locs) -> dict:
+        """ Curates scalar outputs from simulations at many locations
+
+        Impact area, deposit area and deposit volume do not depend on the location, so they are
+        calculated once. Maximum flow velocity and height are extracted at all locations from a
+        single read of each band.
+
+        Args:
+            threshold (float): Threshold value to define the scalars from simulations
+            locs (list): a list of (x, y) coordinates of the points of extract
+
+        Raises:
+            TypeError: threshold must be a number
+            ValueError: threshold cannot be negative
+
+        Returns:
+            scalars(dict): a dictionary of curated scalars. vmax and hmax have simulations as rows and sites as columns
+        """
+
+        if not isinstance(threshold, (int, float)):
+            raise TypeError('threshold must be a number')
+        if threshold < 0:
+            raise ValueError('threshold cannot be negative')
+
+        scalars = {}
+
+        scalars['ia'] = self.calc_ia(threshold)
+        scalars['da'] = self.calc_da(threshold)
+        scalars['dv'] = self.calc_dv(threshold)
+
+        scalars['vmax'] = self.extract_qoi_at_sites(qoi='vmax', locs=locs)
+        scalars['hmax'] = self.extract_qoi_at_sites(qoi='hmax', locs=locs)
+
         return scalars
 
-    def create_vector(self, qoi, threshold, valid_cols=None):
+    def create_vector(self, qoi, threshold, valid_cols=None, factor:int=1, crop:bool=False):
         """ Creates an output to train vector emulators
 
+        The conversion respects the memory budget (see utilities.memory). If the stack does not fit,
+        the bands are read twice instead of being held at once, and if the output does not fit, it is
+        stored as float32 or memory-mapped to a temporary file. The choice is logged and kept in
+        memory.plans['create_vector'].
+
+        With a factor larger than 1, every band is aggregated to blocks of factor x factor cells
+        (see aggregate), and a block is valid if any of its cells is valid.
+
+        With crop, only the footprint of the stack (see footprint) is read and held, so reading
+        and decoding scale with the area of the flows rather than the grid. The footprint is read
+        from the cache if it was found before. Otherwise the whole grid is read in the same single
+        pass as without crop, and at the native resolution the footprint is recorded from the
+        valid cells, so cropping never costs an extra pass.
+
+        The outputs are kept in the result cache (see utilities.results) according to the checksum
+        of the stack, the threshold, the factor, the given cells, the precision policy and the
+        package sources, so later calls in any process map them from the cache without reading the
+        stack until the code changes.
+
         Args:
             qoi (str): quantity of interest, i.e. hmax for maximum flow height,
             vmax for maximum flow height, and pmax for maximum flow pressure
             threshold (int, float): Threshold value to define valid cells from simulations
-            valid_cols (list, optional): column numbers to extract. Defaults to None.
+            valid_cols (np.ndarray, GridMask, optional): cells to extract. Only the bounding window of a GridMask is read. Defaults to None.
+            factor (int, optional): size of the blocks in cells. Defaults to 1, i.e. the native resolution.
+            crop (bool, optional): read only the footprint if valid_cols is None. Defaults to False.
 
         Raises:
             Exception: Invalid QoI. It should be hmax, vmax, or pmax.
             TypeError: threshold must be a number
             ValueError: threshold cannot be negative
+            ValueError: factor must be a positive integer
 
         Returns:
             training (np.ndarray): A data frame consisting of the vector outputs from simulations
-            valid_cols (np.ndarray): An array consisting of the valid column names
+            valid_cols (np.ndarray, GridMask): number of simulations in which every cell is valid, or the given cells
         """
         if qoi not in ['hmax', 'vmax', 'pmax']:
             raise Exception('Invalid QoI. It should be hmax, vmax, or pmax.')
@@ -272,18 +508,154 @@ class Simulations:
             raise TypeError('threshold must be a number')
         if threshold < 0:
             raise ValueError('threshold cannot be negative')
+        if not isinstance(factor, int) or factor < 1:
+            raise ValueError('factor must be a positive integer')
+
+        if valid_cols is None:
+            cells = None
+        else:
+            cells = results.digest(valid_cols.indices if isinstance(valid_cols, GridMask) else np.flatnonzero(valid_cols))
+        key = results.key('create_vector', [self.data_import.checksum(qoi)], qoi=qoi, threshold=float(threshold),
+                          factor=factor, cells=cells, dtype=memory.get_dtype().name)
+        cached = results.load(key)
+        if cached is not None:
+            if valid_cols is None:
+                valid_cols = GridMask(cached['indices'], tuple(cached['shape']), counts=cached['counts']).dense()
+            return cached['training'], valid_cols
+
+        training, mask = self._create_vector(qoi, threshold, valid_cols, factor, crop)
+        if valid_cols is None:
+            results.save(key, {'training':training, 'indices':mask.indices, 'counts':mask.counts, 'shape':np.array(mask.shape)})
+            return training, mask.dense()
+        results.save(key, {'training':training})
+        return training, valid_cols
+
+    def _create_vector(self, qoi, threshold, valid_cols, factor, crop):
+        with tracing.span('create_vector', simulations=self.name, qoi=qoi, factor=factor) as span, self._open(qoi) as src:
+            rows = -(-src.height // factor)
+            cols = -(-src.width // factor)
+            dtype = np.dtype(src.dtypes[0])
+            footprint = self._cached_footprint(qoi, threshold) if valid_cols is None else None
+            if crop and footprint is not None:
+                window = self._window(src, footprint, factor)
+            else:
+                window = Window(0, 0, src.width, src.height)
+            window_rows = -(-int(window.height) // factor)
+            window_cols = -(-int(window.width) // factor)
+            # flat index on the grid of every cell of the window
+            cells = ((np.arange(window_rows) + window.row_off // factor)[:, np.newaxis] * cols
+                     + np.arange(window_cols) + window.col_off // factor).reshape(-1)
+
+            def read(sim):
+                values = self._read(src, sim + 1, qoi, window)
+                with tracing.span('reduction', qoi=qoi):
+                    valid = values >= np.float64(threshold)
+                    if factor > 1:
+                        valid = aggregate(valid, factor, np.max).astype(bool)
+                        values = aggregate(values, factor).astype(dtype)
+                return values.reshape(cells.size), valid.reshape(cells.size)
+
+            # The whole stack is kept in the dtype of the raster if it fits into half of the budget.
+            # Otherwise the valid cells are counted in a first pass and gathered in a second one,
+            # so that only one band is held at a time.
+            stack_bytes = self.size * cells.size * dtype.itemsize
+            in_memory = valid_cols is not None or memory.fits(stack_bytes, share=0.5)
+            unstacked = np.empty((self.size, cells.size), dtype=dtype) if in_memory and valid_cols is None else None
+
+            if valid_cols is None:
+                counts = np.zeros(cells.size, dtype=np.int64)
+                for sim in range(self.size):
+                    values, valid = read(sim)
+                    counts += valid
+                    if unstacked is not None:
+                        unstacked[sim, :] = values
+                local = np.flatnonzero(counts)
+                mask = GridMask(cells[local], (rows, cols), counts=counts[local])
+                if footprint is None and factor == 1:
+                    self._store_footprint(qoi, threshold, mask.window)
+            else:
+                mask = self._mask(src, valid_cols, factor)
+                local = mask.indices
+
+            training, storage = memory.allocate((self.size, mask.size), memory.get_dtype())
+            for sim in range(self.size):
+                if unstacked is not None:
+                    training[sim, :] = unstacked[sim, local]
+                elif factor == 1:
+                    training[sim, :] = mask.gather(self._read(src, sim + 1, qoi, mask.window))
+                else:
+                    training[sim, :] = read(sim)[0][local]
+            span.set(cells=mask.size, window_cells=cells.size)
+            memory.report('create_vector', passes=1 if in_memory else 2, dtype=training.dtype.name,
+                          storage=storage, cells=int(mask.size))
+        return training, mask
+
+    def create_vectors(self, qois, threshold, valid_cols=None):
+        """ Creates outputs of several quantities of interest on a shared set of valid cells
+
+        The stacks of all quantities are read in one pass over the bands. A cell is valid if any
+        quantity is not below its threshold in any simulation, so all outputs have the same columns.
+        Like create_vector, the stacks are read twice if they do not fit into the memory budget.
 
-        with rasterio.open(self.data_import.raster_link(qoi)) as src:
-            rows = src.height
-            cols = src.width
+        Args:
+            qois (list): quantities of interest, i.e. hmax, vmax or pmax
+            threshold (int, float, dict): Threshold value to define valid cells, or threshold values according to the quantity
+            valid_cols (np.ndarray, GridMask, optional): valid cells of another set. Only the bounding window of a GridMask is read. Defaults to None.
 
-            unstacked = np.zeros((self.size, rows * cols))
+        Raises:
+            Exception: Invalid QoI. It should be hmax, vmax, or pmax.
+            TypeError: threshold must be a number
+            ValueError: threshold cannot be negative
 
+        Returns:
+            training (dict): outputs according to the quantity with simulations as rows and valid cells as columns
+            valid_cols (np.ndarray): number of simulations in which every cell is valid for any quantity
+        """
+        thresholds = threshold if isinstance(threshold, dict) else {qoi: threshold for qoi in qois}
+        for qoi in qois:
+            if qoi not in ['hmax', 'vmax', 'pmax']:
+                raise Exception('Invalid QoI. It should be hmax, vmax, or pmax.')
+            if not isinstance(thresholds.get(qoi), (int, float)):
+                raise TypeError('threshold must be a number')
+            if thresholds[qoi] < 0:
+                raise ValueError('threshold cannot be negative')
+
+        with tracing.span('create_vectors', simulations=self.name, qois=','.join(qois)) as span, ExitStack() as stack:
+            srcs = {qoi: stack.enter_context(self._open(qoi)) for qoi in qois}
+            rows = srcs[qois[0]].height
+            cols = srcs[qois[0]].width
+            dtype = np.dtype(srcs[qois[0]].dtypes[0])
+
+            stack_bytes = len(qois) * self.size * rows * cols * dtype.itemsize
+            in_memory = valid_cols is not None or memory.fits(stack_bytes, share=0.5)
+            unstacked = {qoi: np.empty((self.size, rows * cols), dtype=dtype) for qoi in qois} if in_memory and valid_cols is None else None
+
+            if valid_cols is None:
+                valid_cols = np.zeros(rows * cols, dtype=np.int64)
+                for sim in range(self.size):
+                    valid = np.zeros(rows * cols, dtype=bool)
+                    for qoi in qois:
+                        values = self._read(srcs[qoi], sim + 1, qoi).reshape(rows * cols)
+                        with tracing.span('reduction', qoi=qoi):
+                            valid |= values >= np.float64(thresholds[qoi])
+                        if unstacked is not None:
+                            unstacked[qoi][sim, :] = values
+                    valid_cols += valid
+                mask = GridMask.from_counts(valid_cols, (rows, cols))
+            else:
+                mask = self._mask(srcs[qois[0]], valid_cols)
+            indices = mask.indices
+
+            training = {}
+            for qoi in qois:
+                training[qoi], storage = memory.allocate((self.size, indices.size), memory.get_dtype())
             for sim in range(self.size):
-                unstacked[sim, :] = src.read(sim + 1).reshape(1, rows * cols)
-
-        if valid_cols is None:
-            valid_cols = np.where(unstacked >= threshold, 1, 0).sum(axis=0)
-        indices = np.flatnonzero(valid_cols)
-        training = unstacked[:, indices]
-        return training, valid_cols
\ No newline at end of file
+                for qoi in qois:
+                    if unstacked is not None:
+                        training[qoi][sim, :] = unstacked[qoi][sim, indices]
+                    else:
+                        training[qoi][sim, :] = mask.gather(self._read(srcs[qoi], sim + 1, qoi, mask.window))
+            span.set(cells=indices.size)
+            memory.report('create_vectors', passes=1 if in_memory else 2, dtype=training[qois[0]].dtype.name,
+                          storage=storage, cells=int(indices.size))
+        return training, valid_cols
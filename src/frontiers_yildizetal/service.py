@@ -0,0 +1,314 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+from frontiers_yildizetal.utilities import tracing
+
+class _Server(ThreadingHTTPServer):
+    # many clients connect at once when their requests are coalesced
+    request_queue_size = 128
+    daemon_threads = True
+
+class PredictionService:
+    """
+    A class to serve predictions of fitted emulators from a long-running process
+
+    The emulators are fitted once when they are added. Requests are put into a queue, and a single
+    dispatcher thread makes all calls into R, because R is not thread-safe. Requests that arrive
+    within max_wait of each other are coalesced: their inputs are stacked into one batch per model,
+    predicted in one call, and split again.
+
+    Attributes:
+        max_wait (float): seconds to wait for more requests before a batch is predicted
+        max_rows (int): maximum number of input samples of a coalesced batch
+        models (dict): predictor and description of every model according to its key
+
+    Methods:
+        add(key, predictor, **info): registers a model
+        add_scalar(emulator): registers a model for every scalar of ScalarEmulators
+        add_vector(emulator): registers the model of VectorEmulators
+        submit(key, inputs, stat): queues a prediction and returns a future
+        predict(key, inputs, stat): returns a prediction
+        start(host, port): serves the models over HTTP in a background thread
+        stop(): stops the server and the dispatcher
+    """
+    def __init__(self, max_wait:float=0.005, max_rows:int=10000):
+        """
+        Initialising PredictionService class
+
+        Args:
+            max_wait (float, optional): seconds to wait for more requests before a batch is predicted. Defaults to 0.005.
+            max_rows (int, optional): maximum number of input samples of a coalesced batch. Defaults to 10000.
+
+        Raises:
+            ValueError: max_wait cannot be negative
+            ValueError: max_rows must be positive
+        """
+        if max_wait < 0:
+            raise ValueError('max_wait cannot be negative')
+        if max_rows < 1:
+            raise ValueError('max_rows must be positive')
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self.models = {}
+        self._queue = queue.Queue()
+        self._server = None
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def add(self, key:str, predictor, **info):
+        """
+        Registers a model
+
+        Args:
+            key (str): key of the model, e.g. synth:ia
+            predictor (callable): function that returns the mean and sd of every input sample
+            **info: description of the model returned by GET /models, e.g. dim or cells
+        """
+        if not isinstance(key, str):
+            raise TypeError('key must be a string')
+        self.models[key] = (predictor, info)
+
+    def add_scalar(self, emulator):
+        """
+        Fits and registers a model for every scalar of ScalarEmulators. The keys are <name>:<scalar>.
+
+        Args:
+            emulator (ScalarEmulators): emulators of a set of simulations at a location
+        """
+        from frontiers_yildizetal.emulators import converter, robustgasp
+
+        for scalar in emulator.output:
+            trained = emulator.model(scalar)
+
+            def predictor(inputs, trained=trained):
+                with converter():
+                    predicted = robustgasp.predict_rgasp(object=trained, testing_input=inputs)
+                    return np.asarray(predicted[0]), np.asarray(predicted[3])
+
+            self.add(emulator.name + ':' + scalar, predictor, kind='scalar', dim=emulator.input_train.shape[1],
+                     loc_x=emulator.loc_x, loc_y=emulator.loc_y)
+
+    def add_vector(self, emulator):
+        """
+        Registers the fitted model of VectorEmulators. The key is <name>:<qoi>.
+
+        Args:
+            emulator (VectorEmulators): vector emulator of a quantity of interest
+        """
+        from frontiers_yildizetal.emulators import converter, robustgasp
+
+        def predictor(inputs):
+            with converter():
+                predicted = robustgasp.predict_ppgasp(object=emulator.model, testing_input=inputs)
+                return np.asarray(predicted[0]), np.asarray(predicted[3])
+
+        self.add(emulator.name + ':' + emulator.qoi, predictor, kind='vector', dim=emulator.input_train.shape[1],
+                 rows=emulator.rows, cols=emulator.cols, cells=emulator.mask.indices.tolist(),
+                 transform=list(emulator.transform)[:6])
+
+    def submit(self, key:str, inputs:np.ndarray, stat:str='samples') -> Future:
+        """
+        Queues a prediction
+
+        Args:
+            key (str): key of the model
+            inputs (np.ndarray): input samples (rows)
+            stat (str, optional): samples for the mean and sd of every sample, or summary for the mean and sd of the
+                predicted means over the samples, e.g. per cell. Defaults to samples.
+
+        Raises:
+            Exception: Unknown model
+            ValueError: stat must be samples or summary
+            ValueError: inputs must have one column per input variable
+
+        Returns:
+            Future: future of a dict with mean and sd
+        """
+        if key not in self.models:
+            raise Exception('Unknown model: ' + key)
+        if stat not in ['samples', 'summary']:
+            raise ValueError('stat must be samples or summary')
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=np.float64))
+        if inputs.shape[1] != self.models[key][1].get('dim', inputs.shape[1]):
+            raise ValueError('inputs must have one column per input variable')
+        future = Future()
+        self._queue.put((key, inputs, stat, future))
+        return future
+
+    def predict(self, key:str, inputs:np.ndarray, stat:str='samples') -> dict:
+        """
+        Returns a prediction. See submit.
+
+        Returns:
+            dict: mean and sd
+        """
+        return self.submit(key, inputs, stat).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        rows = len(batch[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+            rows += len(item[1])
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0], []).append(item)
+            for key, items in groups.items():
+                try:
+                    with tracing.span('gp_predict', model=key, requests=len(items), samples=sum(len(item[1]) for item in items)):
+                        mean, sd = self.models[key][0](np.concatenate([item[1] for item in items]))
+                except Exception as error:
+                    for item in items:
+                        item[3].set_exception(error)
+                    continue
+                start = 0
+                for _, inputs, stat, future in items:
+                    stop = start + len(inputs)
+                    if stat == 'samples':
+                        future.set_result({'mean':mean[start:stop], 'sd':sd[start:stop]})
+                    else:
+                        future.set_result({'mean':mean[start:stop].mean(axis=0), 'sd':mean[start:stop].std(axis=0)})
+                    start = stop
+
+    def start(self, host:str='127.0.0.1', port:int=0) -> str:
+        """
+        Serves the models over HTTP in a background thread
+
+        GET /models lists the models and their descriptions. POST /predict with a JSON body
+        {"model": key, "inputs": [[...], ...], "stat": "samples" or "summary"} returns the mean and sd.
+
+        Args:
+            host (str, optional): host to bind. Defaults to 127.0.0.1.
+            port (int, optional): port to bind. Defaults to 0, i.e. a free port.
+
+        Returns:
+            str: URL of the service
+        """
+        handler = type('Handler', (PredictionHandler,), {'service':self})
+        self._server = _Server((host, port), handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return 'http://%s:%d' % (host, self._server.server_port)
+
+    def stop(self):
+        """ Stops the server and the dispatcher """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._queue.put(None)
+        self._dispatcher.join()
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """ A request handler that exposes a PredictionService over HTTP """
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status:int, content:dict):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split('?')[0].rstrip('/') != '/models':
+            return self._send(404, {'message':'Not found'})
+        self._send(200, {key: info for key, (_, info) in self.service.models.items()})
+
+    def do_POST(self):
+        if self.path.split('?')[0].rstrip('/') != '/predict':
+            return self._send(404, {'message':'Not found'})
+        try:
+            content = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            result = self.service.predict(content['model'], content['inputs'], content.get('stat', 'samples'))
+        except Exception as error:
+            return self._send(400, {'message':str(error)})
+        self._send(200, {key: np.asarray(val).tolist() for key, val in result.items()})
+
+class PredictionClient:
+    """
+    A client of a PredictionService served over HTTP
+
+    Attributes:
+        url (str): URL of the service
+    """
+    def __init__(self, url:str):
+        self.url = url.rstrip('/')
+        self._session = requests.Session()
+
+    def models(self) -> dict:
+        """ Returns the models and their descriptions """
+        return self._session.get(self.url + '/models').json()
+
+    def predict(self, model:str, inputs:np.ndarray, stat:str='samples') -> dict:
+        """
+        Returns a prediction
+
+        Args:
+            model (str): key of the model, e.g. synth:ia
+            inputs (np.ndarray): input samples (rows)
+            stat (str, optional): samples or summary. Defaults to samples.
+
+        Raises:
+            Exception: message of the service if the request failed
+
+        Returns:
+            dict: mean and sd as numpy arrays
+        """
+        response = self._session.post(self.url + '/predict', json={
+            'model':model, 'inputs':np.atleast_2d(inputs).tolist(), 'stat':stat})
+        content = response.json()
+        if response.status_code != 200:
+            raise Exception(content['message'])
+        return {key: np.asarray(val) for key, val in content.items()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves predictions of fitted emulators')
+    parser.add_argument('--scalar', nargs=4, action='append', default=[], metavar=('NAME', 'THRESHOLD', 'LOC_X', 'LOC_Y'),
+                        help='fit ScalarEmulators of a set at a location')
+    parser.add_argument('--vector', nargs=3, action='append', default=[], metavar=('NAME', 'QOI', 'THRESHOLD'),
+                        help='fit VectorEmulators of a set and a quantity of interest')
+    parser.add_argument('--port', type=int, default=8001, help='port to bind')
+    parser.add_argument('--max-wait', type=float, default=0.005, help='seconds to wait for requests to coalesce')
+    args = parser.parse_args()
+
+    from frontiers_yildizetal.emulators import ScalarEmulators, VectorEmulators
+
+    service = PredictionService(max_wait=args.max_wait)
+    for name, threshold, loc_x, loc_y in args.scalar:
+        service.add_scalar(ScalarEmulators(name, float(threshold), float(loc_x), float(loc_y)))
+    for name, qoi, threshold in args.vector:
+        service.add_vector(VectorEmulators(name, qoi, float(threshold)))
+    url = service.start(port=args.port)
+    print('Serving ' + ', '.join(service.models) + ' at ' + url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
@@ -0,0 +1,256 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.transform import rowcol
+from frontiers_yildizetal.ravaflow import area, volume
+from frontiers_yildizetal.utilities import data, memory, tracing
+from frontiers_yildizetal.utilities.grid import GridMask
+
+class _Job:
+    """ A stack of a set of simulations and the reducer of its bands """
+    def __init__(self, name:str, qoi:str, reducer):
+        self.name = name
+        self.qoi = qoi
+        self.reducer = reducer
+
+class _ScalarReducer:
+    """ Reduces the bands of a stack to the scalars of curate_scalars that depend on it """
+    def __init__(self, scalars:dict, qoi:str, threshold:float, loc):
+        self.scalars = scalars
+        self.qoi = qoi
+        self.threshold = threshold
+        self.loc = loc
+
+    def start(self, meta:dict):
+        bounds = meta['bounds']
+        loc_x, loc_y = self.loc
+        if loc_x <= bounds[0] or loc_x >= bounds[2]:
+            raise Exception('x-coordinate is out of bounds')
+        if loc_y <= bounds[1] or loc_y >= bounds[3]:
+            raise Exception('y-coordinate is out of bounds')
+        self.res = meta['res']
+        self.row, self.col = rowcol(meta['transform'], loc_x, loc_y)
+        names = {'hmax':['ia', 'hmax'], 'hfin':['da', 'dv'], 'vmax':['vmax']}[self.qoi]
+        for name in names:
+            self.scalars[name] = np.empty(meta['count'], dtype=memory.get_dtype())
+
+    def band(self, band:int, values:np.ndarray):
+        if self.qoi == 'hmax':
+            self.scalars['ia'][band] = area(values, self.threshold, self.res)
+            self.scalars['hmax'][band] = values[self.row, self.col]
+        elif self.qoi == 'hfin':
+            self.scalars['da'][band] = area(values, self.threshold, self.res)
+            self.scalars['dv'][band] = volume(values, self.threshold, self.res)
+        else:
+            self.scalars['vmax'][band] = values[self.row, self.col]
+
+    def finish(self):
+        pass
+
+class _VectorReducer:
+    """ Reduces the bands of a stack to the output of create_vector """
+    def __init__(self, results:dict, name:str, threshold:float, valid_cols):
+        self.results = results
+        self.name = name
+        self.threshold = threshold
+        self.valid_cols = valid_cols
+
+    def start(self, meta:dict):
+        cells = meta['height'] * meta['width']
+        if isinstance(self.valid_cols, str):
+            self.valid_cols = self.results[self.valid_cols][1]
+        if self.valid_cols is None:
+            # the stack is held until the valid cells are known, within half of the memory budget
+            self.counts = np.zeros(cells, dtype=np.int64)
+            self.stack, storage = memory.allocate((meta['count'], cells), memory.get_dtype(), share=0.5)
+            memory.report('streaming_create_vector', dtype=self.stack.dtype.name, storage=storage, cells=cells)
+        else:
+            self.indices = self.valid_cols.indices if isinstance(self.valid_cols, GridMask) else np.flatnonzero(self.valid_cols)
+            self.training, _ = memory.allocate((meta['count'], self.indices.size), memory.get_dtype())
+
+    def band(self, band:int, values:np.ndarray):
+        values = values.reshape(-1)
+        if self.valid_cols is None:
+            self.counts += values >= np.float64(self.threshold)
+            self.stack[band] = values
+        else:
+            self.training[band] = values[self.indices]
+
+    def finish(self):
+        if self.valid_cols is None:
+            self.valid_cols = self.counts
+            self.indices = np.flatnonzero(self.counts)
+            self.training, _ = memory.allocate((self.stack.shape[0], self.indices.size), memory.get_dtype())
+            for band in range(self.stack.shape[0]):
+                self.training[band] = self.stack[band, self.indices]
+            del self.stack
+        self.results[self.name] = (self.training, self.valid_cols)
+
+def _meta(src) -> dict:
+    return {'count':src.count, 'height':src.height, 'width':src.width, 'dtype':src.dtypes[0],
+            'res':src.res[0], 'transform':src.transform, 'bounds':src.bounds}
+
+def _read(src, band:int, qoi:str) -> np.ndarray:
+    with tracing.span('band_decode', qoi=qoi, band=band):
+        return src.read(band)
+
+def _reduce(job:_Job, band:int, values:np.ndarray):
+    with tracing.span('reduction', simulations=job.name, qoi=job.qoi, band=band + 1):
+        job.reducer.band(band, values)
+
+async def _fetch_stage(jobs:list, stacks:asyncio.Queue, executor:ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+    sources = {}
+    for job in jobs:
+        if job.name not in sources:
+            sources[job.name] = await loop.run_in_executor(executor, data.FigshareData, job.name)
+        path = await loop.run_in_executor(executor, sources[job.name].download, job.qoi)
+        await stacks.put((job, path))
+    await stacks.put(None)
+
+async def _decode_stage(stacks:asyncio.Queue, bands:asyncio.Queue, executor:ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await stacks.get()
+        if item is None:
+            break
+        job, path = item
+        src = await loop.run_in_executor(executor, rasterio.open, path)
+        try:
+            await bands.put((job, 'start', _meta(src)))
+            for band in range(src.count):
+                values = await loop.run_in_executor(executor, _read, src, band + 1, job.qoi)
+                await bands.put((job, band, values))
+            await bands.put((job, 'finish', None))
+        finally:
+            await loop.run_in_executor(executor, src.close)
+    await bands.put(None)
+
+async def _reduce_stage(bands:asyncio.Queue, executor:ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await bands.get()
+        if item is None:
+            break
+        job, band, values = item
+        if band == 'start':
+            await loop.run_in_executor(executor, job.reducer.start, values)
+        elif band == 'finish':
+            await loop.run_in_executor(executor, job.reducer.finish)
+        else:
+            await loop.run_in_executor(executor, _reduce, job, band, values)
+
+async def run(jobs:list, prefetch:int=1, bands_ahead:int=8):
+    """
+    Streams stacks through download, decode and reduction stages that run concurrently
+
+    Each stage runs in its own thread, so the next stack is downloaded while the current one is
+    decoded and earlier bands are reduced. The bounded queues between the stages hold at most
+    prefetch downloaded stacks and bands_ahead decoded bands, which limits the memory and lets a
+    slow stage hold back the faster ones. A run is limited by its slowest stage rather than by
+    the sum of the stages.
+
+    Args:
+        jobs (list): stacks to process in order, built by curate_scalars or create_vectors
+        prefetch (int, optional): number of downloaded stacks waiting to be decoded. Defaults to 1.
+        bands_ahead (int, optional): number of decoded bands waiting to be reduced. Defaults to 8.
+
+    Raises:
+        ValueError: prefetch and bands_ahead must be positive
+    """
+    if prefetch < 1 or bands_ahead < 1:
+        raise ValueError('prefetch and bands_ahead must be positive')
+    stacks = asyncio.Queue(maxsize=prefetch)
+    bands = asyncio.Queue(maxsize=bands_ahead)
+    executors = [ThreadPoolExecutor(max_workers=1) for _ in range(3)]
+    tasks = [
+        asyncio.ensure_future(_fetch_stage(jobs, stacks, executors[0])),
+        asyncio.ensure_future(_decode_stage(stacks, bands, executors[1])),
+        asyncio.ensure_future(_reduce_stage(bands, executors[2])),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=False)
+
+def _check(threshold):
+    if not isinstance(threshold, (int, float)):
+        raise TypeError('threshold must be a number')
+    if threshold < 0:
+        raise ValueError('threshold cannot be negative')
+
+def curate_scalars(names:list, threshold:float, locs, prefetch:int=1, bands_ahead:int=8) -> dict:
+    """
+    Curates scalar outputs of several sets of simulations with overlapping download, decode and reduction
+
+    The results are the same as Simulations(name).curate_scalars(threshold, loc_x, loc_y). The
+    hmax, hfin and vmax stacks of every set are each read once.
+
+    Args:
+        names (list): sets of simulations, e.g. synth, synth_pem and synth_validation
+        threshold (float): Threshold value to define the scalars from simulations
+        locs (tuple, dict): (x, y) coordinates of the point of extract, or such coordinates according to the set
+        prefetch (int, optional): number of downloaded stacks waiting to be decoded. Defaults to 1.
+        bands_ahead (int, optional): number of decoded bands waiting to be reduced. Defaults to 8.
+
+    Raises:
+        TypeError: threshold must be a number
+        ValueError: threshold cannot be negative
+
+    Returns:
+        scalars (dict): a dictionary of curated scalars according to the set
+    """
+    _check(threshold)
+    scalars = {name: {} for name in names}
+    jobs = []
+    for name in names:
+        loc = locs[name] if isinstance(locs, dict) else locs
+        for qoi in ['hmax', 'hfin', 'vmax']:
+            jobs.append(_Job(name, qoi, _ScalarReducer(scalars[name], qoi, threshold, loc)))
+    asyncio.run(run(jobs, prefetch=prefetch, bands_ahead=bands_ahead))
+    return {name: {key: scalars[name][key] for key in ['ia', 'da', 'dv', 'vmax', 'hmax']} for name in names}
+
+def create_vectors(names:list, qoi:str, threshold:float, valid_cols=None, prefetch:int=1, bands_ahead:int=8) -> dict:
+    """
+    Creates outputs to train vector emulators from several sets with overlapping download, decode and reduction
+
+    The results are the same as Simulations(name).create_vector(qoi, threshold, valid_cols). The
+    valid cells of a set can be taken from a set processed earlier in the same run, e.g.
+    valid_cols={'synth_validation': 'synth'}. Without valid cells, a stack is held until they are
+    known, in the dtype of memory.get_dtype() within half of the memory budget, i.e. as float32 or
+    memory-mapped if it does not fit (see utilities.memory).
+
+    Args:
+        names (list): sets of simulations in the order of processing, e.g. synth and synth_validation
+        qoi (str): quantity of interest, i.e. hmax, vmax or pmax
+        threshold (int, float): Threshold value to define valid cells from simulations
+        valid_cols (dict, optional): valid cells or GridMask, or the name of an earlier set, according to the set. Defaults to None.
+        prefetch (int, optional): number of downloaded stacks waiting to be decoded. Defaults to 1.
+        bands_ahead (int, optional): number of decoded bands waiting to be reduced. Defaults to 8.
+
+    Raises:
+        Exception: Invalid QoI. It should be hmax, vmax, or pmax.
+        TypeError: threshold must be a number
+        ValueError: threshold cannot be negative
+        Exception: valid cells must come from an earlier set
+
+    Returns:
+        vectors (dict): training outputs and valid cells according to the set
+    """
+    if qoi not in ['hmax', 'vmax', 'pmax']:
+        raise Exception('Invalid QoI. It should be hmax, vmax, or pmax.')
+    _check(threshold)
+    valid_cols = valid_cols or {}
+    for name, source in valid_cols.items():
+        if isinstance(source, str) and (source not in names or name not in names or names.index(source) >= names.index(name)):
+            raise Exception('valid cells must come from an earlier set')
+    vectors = {}
+    jobs = [_Job(name, qoi, _VectorReducer(vectors, name, threshold, valid_cols.get(name))) for name in names]
+    asyncio.run(run(jobs, prefetch=prefetch, bands_ahead=bands_ahead))
+    return {name: vectors[name] for name in names}
@@ -1 +1 @@
-from frontiers_yildizetal.utilities import data
\ No newline at end of file
+from frontiers_yildizetal.utilities import data, grid, memory, pipeline, results, tracing
\ No newline at end of file
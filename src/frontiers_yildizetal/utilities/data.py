@@ -1,7 +1,31 @@
 # Task 2
+import hashlib
+import os
+import tempfile
 import requests
 import numpy as np
 from pkg_resources import resource_filename
+from frontiers_yildizetal.utilities import tracing
+
+def cache_dir(subdir:str='') -> str:
+    """
+    Returns a directory to cache derived data, creating it if necessary
+
+    The root is the FRONTIERS_YILDIZETAL_CACHE environment variable if set, otherwise ~/.cache/frontiers_yildizetal
+
+    Args:
+        subdir (str, optional): subdirectory of the cache. Defaults to ''.
+
+    Returns:
+        str: path of the directory
+    """
+    root = os.environ.get('FRONTIERS_YILDIZETAL_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'frontiers_yildizetal'))
+    path = os.path.join(root, subdir)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# MD5 checksums of the input CSVs according to their path, modification time and size
+_checksums = {}
 
 class FigshareData:
     """
@@ -26,17 +50,23 @@ class FigshareData:
             'acheron':20449410,
             'acheron_pem': 20454927,
             'acheron_validation':20454936}
-    def __init__(self, name):
+    base_url = 'https://api.figshare.com/v2'
+    def __init__(self, name, base_url=None):
         """ Constructus all the necessary attributes for Figshare class.
 
         Parameters
         ----------
             article_id (int): ID number of the article hosted on Figshare
+            base_url (str, optional): Base URL of the Figshare API. Defaults to the FIGSHARE_BASE_URL
+                environment variable if set, otherwise https://api.figshare.com/v2
             link (str): API link to the article hosted on Figshare
         """
         self.name = name
-        self.link = 'https://api.figshare.com/v2/articles/' + str(self.article_id[name])
-        self.files = requests.get(self.link + '/files').json()
+        if base_url is None:
+            base_url = os.environ.get('FIGSHARE_BASE_URL', self.base_url)
+        self.link = base_url.rstrip('/') + '/articles/' + str(self.article_id[name])
+        with tracing.span('network_fetch', url=self.link + '/files'):
+            self.files = requests.get(self.link + '/files').json()
         self.filenames = [file['name'] for file in self.files]
         self.parameters = [filename.strip('_stack.tif') for filename in self.filenames]
         
@@ -46,11 +76,77 @@ class FigshareData:
         url = self.files[index_no]['download_url']
         
         return url
+
+    def checksum(self, parameter:str) -> str:
+        """
+        Returns an identifier of the content of a stack, e.g. to key derived data in the cache
+
+        Args:
+            parameter (str): quantity of the stack, e.g. hmax
+
+        Returns:
+            str: MD5 checksum of the file listing, or the file id and size if the listing has no checksum
+        """
+        file = self.files[self.parameters.index(parameter)]
+        return file.get('computed_md5') or '%s-%s' % (file.get('id'), file.get('size'))
+
+    def download(self, parameter:str, directory:str=None) -> str:
+        """
+        Downloads a stack unless an identical copy exists
+
+        The copy is identified by the MD5 checksum of the file listing, which is kept next to the
+        stack. Without a checksum, an existing copy with the listed size is used.
+
+        Args:
+            parameter (str): quantity of the stack, e.g. hmax
+            directory (str, optional): directory of the copy. Defaults to stacks/<article_id> in the cache.
+
+        Raises:
+            Exception: Invalid download. The checksum does not match the file listing.
+
+        Returns:
+            str: path of the local copy
+        """
+        file = self.files[self.parameters.index(parameter)]
+        if directory is None:
+            directory = cache_dir(os.path.join('stacks', str(self.article_id[self.name])))
+        path = os.path.join(directory, file['name'])
+        md5 = file.get('computed_md5')
+
+        if os.path.exists(path):
+            if md5 is None and os.path.getsize(path) == file.get('size'):
+                return path
+            if md5 is not None and os.path.exists(path + '.md5'):
+                with open(path + '.md5') as checksum:
+                    if checksum.read() == md5:
+                        return path
+
+        digest = hashlib.md5()
+        handle, tmp = tempfile.mkstemp(dir=directory)
+        with tracing.span('network_fetch', url=file['download_url']), os.fdopen(handle, 'wb') as local:
+            with requests.get(file['download_url'], stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(1 << 20):
+                    digest.update(chunk)
+                    local.write(chunk)
+        if md5 is not None and digest.hexdigest() != md5:
+            os.remove(tmp)
+            raise Exception('Invalid download. The checksum of ' + file['name'] + ' does not match the file listing.')
+        os.replace(tmp, path)
+        with open(path + '.md5', 'w') as checksum:
+            checksum.write(digest.hexdigest())
+        return path
         
 def load_input(name:str, analysis:str) -> np.ndarray:
     """
     Imports the input training dataset
 
+    The CSV is parsed once into a .npy file in the input directory of the cache, which is named
+    after the MD5 checksum of the CSV, so a changed CSV is parsed again. Later loads memory-map
+    the .npy file copy-on-write, so every caller gets its own array that it may change without
+    changing the cache or the arrays of other callers. The checksum is memoised in the process
+    until the modification time or the size of the CSV changes, so later loads only map the file.
+
     Args:
         name (str): name of the set, i.e. synth, synth_validate, acheron, or acheron_validate
         analysis (str): analysis to conduct, i.e. mcs1, mcs2, mcs3 or emulator
@@ -75,6 +171,20 @@ def load_input(name:str, analysis:str) -> np.ndarray:
     
     path = 'utilities/input/' + name + '_' + analysis + '.csv'
     filepath = resource_filename('frontiers_yildizetal', path)
-    data = np.genfromtxt(filepath, delimiter=',', skip_header=1)
-    
+    stat = os.stat(filepath)
+    key = (filepath, stat.st_mtime_ns, stat.st_size)
+    if key not in _checksums:
+        with open(filepath, 'rb') as file:
+            _checksums[key] = hashlib.md5(file.read()).hexdigest()
+    checksum = _checksums[key]
+
+    binary = os.path.join(cache_dir('input'), name + '_' + analysis + '_' + checksum + '.npy')
+    if not os.path.exists(binary):
+        data = np.genfromtxt(filepath, delimiter=',', skip_header=1)
+        handle, tmp = tempfile.mkstemp(dir=os.path.dirname(binary), suffix='.npy')
+        with os.fdopen(handle, 'wb') as file:
+            np.save(file, data)
+        os.replace(tmp, binary)
+    data = np.load(binary, mmap_mode='c')
+
     return data
\ No newline at end of file
@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from frontiers_yildizetal.utilities import synthetic
+
+@lru_cache(maxsize=None)
+def _md5(path:str, mtime:float) -> str:
+    digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FigshareHandler(BaseHTTPRequestHandler):
+    """
+    A request handler that mimics the parts of the Figshare API used by FigshareData
+
+    Files are served from root/<article_id>/<filename>. GET /v2/articles/<article_id>/files lists
+    the files of an article, and GET or HEAD /files/<article_id>/<filename> downloads a file with
+    support for byte ranges, which GDAL uses to read remote rasters.
+    """
+    root = '.'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status:int, body:bytes, content_type:str, extra=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, val in (extra or {}).items():
+            self.send_header(key, val)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _list(self, article_id:str):
+        directory = os.path.join(self.root, article_id)
+        if not os.path.isdir(directory):
+            return self._send(404, b'{"message": "Article not found"}', 'application/json')
+        host = 'http://' + self.headers.get('Host', '%s:%s' % self.server.server_address[:2])
+        files = []
+        for i, filename in enumerate(sorted(os.listdir(directory))):
+            path = os.path.join(directory, filename)
+            files.append({
+                'id':i,
+                'name':filename,
+                'size':os.path.getsize(path),
+                'computed_md5':_md5(path, os.path.getmtime(path)),
+                'download_url':host + '/files/' + article_id + '/' + filename,
+            })
+        self._send(200, json.dumps(files).encode(), 'application/json')
+
+    def _file(self, article_id:str, filename:str):
+        path = os.path.join(self.root, article_id, os.path.basename(filename))
+        if not os.path.isfile(path):
+            return self._send(404, b'', 'application/octet-stream')
+        size = os.path.getsize(path)
+        byte_range = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if byte_range is None:
+            start, end, status = 0, size - 1, 200
+        else:
+            first, last = byte_range.groups()
+            if first == '':
+                start, end = max(0, size - int(last)), size - 1
+            else:
+                start, end = int(first), min(size - 1, int(last)) if last else size - 1
+            status = 206
+        if start > end:
+            return self._send(416, b'', 'application/octet-stream', {'Content-Range':'bytes */' + str(size)})
+
+        with open(path, 'rb') as file:
+            file.seek(start)
+            body = file.read(end - start + 1) if self.command != 'HEAD' else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        listing = re.fullmatch(r'/v2/articles/(\d+)/files/?', self.path.split('?')[0])
+        download = re.fullmatch(r'/files/(\d+)/([^/]+)', self.path.split('?')[0])
+        if listing:
+            self._list(listing.group(1))
+        elif download:
+            self._file(*download.groups())
+        else:
+            self._send(404, b'', 'text/plain')
+
+    def do_HEAD(self):
+        self.do_GET()
+
+def _run(root:str, host:str, port:int, conn):
+    handler = type('Handler', (FigshareHandler,), {'root':os.path.abspath(root)})
+    server = ThreadingHTTPServer((host, port), handler)
+    conn.send(server.server_port)
+    conn.close()
+    server.serve_forever()
+
+def serve(root:str, host:str='127.0.0.1', port:int=0):
+    """
+    Starts a local stand-in of the Figshare API in a background process
+
+    The server runs in its own process, because GDAL may hold the interpreter lock of the
+    calling process while it reads a remote raster.
+
+    Args:
+        root (str): root directory of the articles, e.g. written by synthetic.write_articles
+        host (str, optional): host to bind. Defaults to 127.0.0.1.
+        port (int, optional): port to bind. Defaults to 0, i.e. a free port.
+
+    Returns:
+        process (multiprocessing.Process): process of the server. Call terminate() to stop it.
+        base_url (str): base URL to pass to FigshareData or to set as FIGSHARE_BASE_URL
+    """
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_run, args=(root, host, port, child_conn), daemon=True)
+    process.start()
+    base_url = 'http://%s:%d/v2' % (host, parent_conn.recv())
+    return process, base_url
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves synthetic r.avaflow stacks through a local stand-in of the Figshare API')
+    parser.add_argument('root', help='root directory of the articles')
+    parser.add_argument('--port', type=int, default=8000, help='port to bind')
+    parser.add_argument('--generate', action='store_true', help='write synthetic stacks into root first')
+    parser.add_argument('--rows', type=int, default=400, help='number of rows of the generated grids')
+    parser.add_argument('--cols', type=int, default=500, help='number of columns of the generated grids')
+    parser.add_argument('--res', type=float, default=10.0, help='resolution of the generated grids')
+    parser.add_argument('--size', type=int, default=None, help='number of generated training and validation simulations')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the generator')
+    args = parser.parse_args()
+
+    if args.generate:
+        synthetic.write_articles(args.root, rows=args.rows, cols=args.cols, res=args.res, size=args.size, seed=args.seed)
+    print('Serving ' + args.root + ' at http://127.0.0.1:%d/v2' % args.port)
+    print('export FIGSHARE_BASE_URL=http://127.0.0.1:%d/v2' % args.port)
+    handler = type('Handler', (FigshareHandler,), {'root':os.path.abspath(args.root)})
+    try:
+        ThreadingHTTPServer(('127.0.0.1', args.port), handler).serve_forever()
+    except KeyboardInterrupt:
+        pass
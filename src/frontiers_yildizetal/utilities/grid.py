@@ -0,0 +1,185 @@
+import numpy as np
+from rasterio.windows import Window, transform as window_transform
+
+class GridMask:
+    """
+    A class to represent the valid cells of a raster grid
+
+    The cells are kept as sorted flat indices of the grid together with the bounding window of
+    the cells and the affine transform of the grid. Bands are read only within the window and
+    results are written into it, so reads and writes scale with the flow footprint instead of
+    the grid.
+
+    Attributes:
+        indices (np.ndarray): sorted flat indices of the valid cells in the grid
+        local (np.ndarray): flat indices of the valid cells in the window
+        counts (np.ndarray): number of simulations in which every valid cell is valid, or None
+        shape (tuple): rows and cols of the grid
+        transform (affine.Affine): affine transform of the grid, or None
+        window (rasterio.windows.Window): bounding window of the valid cells
+
+    Methods:
+        from_counts(counts, shape, transform): creates a mask from a count of every cell of the grid
+        dense(): returns the counts on the whole grid
+        gather(values, out): extracts the valid cells of a band or a window
+        scatter(values, fill, crop, out): places values of the valid cells on the window or the grid
+        read(src, band, out): reads the valid cells of a band within the window
+        write(dst, values, band, fill): writes values of the valid cells into the window of a raster
+    """
+    def __init__(self, indices:np.ndarray, shape:tuple, transform=None, counts:np.ndarray=None):
+        """
+        Initialising GridMask class
+
+        Args:
+            indices (np.ndarray): flat indices of the valid cells in the grid
+            shape (tuple): rows and cols of the grid
+            transform (affine.Affine, optional): affine transform of the grid. Defaults to None.
+            counts (np.ndarray, optional): count of every valid cell in the order of indices. Defaults to None.
+
+        Raises:
+            ValueError: indices must be within the grid
+            ValueError: counts must have one value per valid cell
+        """
+        rows, cols = int(shape[0]), int(shape[1])
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind='stable')
+        self.indices = indices[order]
+        if self.indices.size and (self.indices[0] < 0 or self.indices[-1] >= rows * cols):
+            raise ValueError('indices must be within the grid')
+        if counts is not None:
+            counts = np.asarray(counts)
+            if counts.shape != indices.shape:
+                raise ValueError('counts must have one value per valid cell')
+            counts = counts[order]
+        self.counts = counts
+        self.shape = (rows, cols)
+        self.transform = transform
+
+        cell_rows, cell_cols = self.indices // cols, self.indices % cols
+        if self.indices.size:
+            row_off, col_off = int(cell_rows.min()), int(cell_cols.min())
+            self.window = Window(col_off, row_off, int(cell_cols.max()) - col_off + 1, int(cell_rows.max()) - row_off + 1)
+        else:
+            self.window = Window(0, 0, 0, 0)
+        self.local = (cell_rows - self.window.row_off) * self.window.width + (cell_cols - self.window.col_off)
+
+    @classmethod
+    def from_counts(cls, counts:np.ndarray, shape:tuple, transform=None):
+        """
+        Creates a mask from a count of every cell of the grid, e.g. valid_cols of create_vector
+
+        Args:
+            counts (np.ndarray): count of every cell, where cells with a count of 0 are not valid
+            shape (tuple): rows and cols of the grid
+            transform (affine.Affine, optional): affine transform of the grid. Defaults to None.
+
+        Returns:
+            GridMask: mask of the cells with a positive count
+        """
+        counts = np.asarray(counts).reshape(-1)
+        indices = np.flatnonzero(counts)
+        return cls(indices, shape, transform, counts[indices])
+
+    @property
+    def size(self) -> int:
+        """ Number of valid cells """
+        return self.indices.size
+
+    @property
+    def window_shape(self) -> tuple:
+        """ Rows and cols of the window """
+        return (int(self.window.height), int(self.window.width))
+
+    @property
+    def window_transform(self):
+        """ Affine transform of the window, e.g. to write a cropped raster """
+        return window_transform(self.window, self.transform)
+
+    def dense(self) -> np.ndarray:
+        """
+        Returns the counts on the whole grid as a flat array, like valid_cols of create_vector
+
+        Returns:
+            np.ndarray: count of every cell, or 1 for the valid cells if there are no counts
+        """
+        counts = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+        counts[self.indices] = 1 if self.counts is None else self.counts
+        return counts
+
+    def gather(self, values:np.ndarray, out:np.ndarray=None) -> np.ndarray:
+        """
+        Extracts the valid cells of a band of the grid or of the window
+
+        Args:
+            values (np.ndarray): band with the shape of the grid or of the window, or flat
+            out (np.ndarray, optional): array to write the valid cells into. Defaults to None.
+
+        Raises:
+            ValueError: values must have the shape of the grid or of the window
+
+        Returns:
+            np.ndarray: values of the valid cells
+        """
+        values = np.asarray(values)
+        size = values.size
+        if size == self.shape[0] * self.shape[1]:
+            indices = self.indices
+        elif size == self.window.height * self.window.width:
+            indices = self.local
+        else:
+            raise ValueError('values must have the shape of the grid or of the window')
+        return np.take(values.reshape(-1), indices, out=out)
+
+    def scatter(self, values:np.ndarray, fill:float=0, crop:bool=True, out:np.ndarray=None) -> np.ndarray:
+        """
+        Places values of the valid cells on the window or the grid
+
+        Args:
+            values (np.ndarray): values with the valid cells on the last axis
+            fill (float, optional): value of the other cells. Defaults to 0.
+            crop (bool, optional): True for the shape of the window, False for the shape of the grid. Defaults to True.
+            out (np.ndarray, optional): array with the shape of the result to write into. Defaults to None.
+
+        Raises:
+            ValueError: values must have one value per valid cell on the last axis
+
+        Returns:
+            np.ndarray: values with shape (..., rows, cols) of the window or the grid
+        """
+        values = np.asarray(values)
+        if values.shape[-1] != self.size:
+            raise ValueError('values must have one value per valid cell on the last axis')
+        shape = self.window_shape if crop else self.shape
+        if out is None:
+            out = np.empty(values.shape[:-1] + shape, dtype=np.result_type(values.dtype, np.min_scalar_type(fill)))
+        flat = out.reshape(values.shape[:-1] + (shape[0] * shape[1],))
+        flat[...] = fill
+        flat[..., self.local if crop else self.indices] = values
+        return out
+
+    def read(self, src, band:int, out:np.ndarray=None) -> np.ndarray:
+        """
+        Reads the valid cells of a band within the window
+
+        Args:
+            src (rasterio.DatasetReader): raster with the shape of the grid
+            band (int): band number starting at 1
+            out (np.ndarray, optional): array to write the valid cells into. Defaults to None.
+
+        Returns:
+            np.ndarray: values of the valid cells
+        """
+        return self.gather(src.read(int(band), window=self.window), out=out)
+
+    def write(self, dst, values:np.ndarray, band:int=1, fill:float=0):
+        """
+        Writes values of the valid cells into the window of a raster with the shape of the grid
+
+        Args:
+            dst (rasterio.DatasetWriter): raster opened for writing
+            values (np.ndarray): values of the valid cells
+            band (int, optional): band number starting at 1. Defaults to 1.
+            fill (float, optional): value of the other cells of the window. Defaults to 0.
+        """
+        window = self.scatter(values, fill=fill, crop=True, out=np.empty(self.window_shape, dtype=dst.dtypes[band - 1]))
+        dst.write(window, int(band), window=self.window)
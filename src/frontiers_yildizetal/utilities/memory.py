@@ -0,0 +1,215 @@
+import logging
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+from frontiers_yildizetal.utilities import data
+
+_budget = None
+_dtype = None
+_units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+plans = {}
+logger = logging.getLogger('frontiers_yildizetal')
+
+def parse_size(size) -> int:
+    """
+    Converts a size such as 512M or 2.5G into bytes
+
+    Args:
+        size (int, float, str): number of bytes, or a number followed by K, M, G or T
+
+    Raises:
+        TypeError: size must be a number or a string
+        ValueError: Invalid size
+
+    Returns:
+        int: number of bytes
+    """
+    if isinstance(size, (int, float)) and not isinstance(size, bool):
+        nbytes = size
+    elif isinstance(size, str):
+        match = re.fullmatch(r'\s*([0-9.]+)\s*([KMGT]?)i?B?\s*', size.upper())
+        if match is None:
+            raise ValueError('Invalid size: ' + size)
+        nbytes = float(match.group(1)) * _units[match.group(2)]
+    else:
+        raise TypeError('size must be a number or a string')
+    if nbytes <= 0:
+        raise ValueError('Invalid size: size must be positive')
+    return int(nbytes)
+
+def set_budget(size):
+    """
+    Sets the memory budget of raster-to-matrix conversions
+
+    Args:
+        size (int, float, str): budget in bytes or with a unit, e.g. 4G. None removes the budget.
+    """
+    global _budget
+    _budget = None if size is None else parse_size(size)
+
+def get_budget():
+    """
+    Returns the memory budget
+
+    The budget set by set_budget is used if there is one, otherwise the FRONTIERS_YILDIZETAL_MEMORY_BUDGET
+    environment variable, e.g. 4G.
+
+    Returns:
+        int: budget in bytes, or None if there is no budget
+    """
+    if _budget is not None:
+        return _budget
+    env = os.environ.get('FRONTIERS_YILDIZETAL_MEMORY_BUDGET')
+    return parse_size(env) if env else None
+
+@contextmanager
+def budget(size):
+    """
+    Sets the memory budget within a with block
+
+    Args:
+        size (int, float, str): budget in bytes or with a unit, e.g. 4G. None removes the budget.
+    """
+    global _budget
+    previous = _budget
+    set_budget(size)
+    try:
+        yield get_budget()
+    finally:
+        _budget = previous
+
+def set_dtype(dtype):
+    """
+    Sets the dtype of raster-derived matrices and per-cell statistics
+
+    float32 halves the memory and bandwidth of the largest arrays and matches the single-precision
+    stacks. The GP linear algebra always runs in float64, and its inputs are upcast when needed.
+
+    Args:
+        dtype (str, np.dtype): float32 or float64. None restores the default.
+
+    Raises:
+        ValueError: dtype must be float32 or float64
+    """
+    global _dtype
+    if dtype is not None and np.dtype(dtype) not in [np.float32, np.float64]:
+        raise ValueError('dtype must be float32 or float64')
+    _dtype = None if dtype is None else np.dtype(dtype)
+
+def get_dtype() -> np.dtype:
+    """
+    Returns the dtype of raster-derived matrices and per-cell statistics
+
+    The dtype set by set_dtype is used if there is one, otherwise the FRONTIERS_YILDIZETAL_DTYPE
+    environment variable, i.e. float32 or float64, which defaults to float64.
+
+    Raises:
+        ValueError: dtype must be float32 or float64
+
+    Returns:
+        np.dtype: float32 or float64
+    """
+    if _dtype is not None:
+        return _dtype
+    dtype = np.dtype(os.environ.get('FRONTIERS_YILDIZETAL_DTYPE', 'float64'))
+    if dtype not in [np.float32, np.float64]:
+        raise ValueError('dtype must be float32 or float64')
+    return dtype
+
+@contextmanager
+def precision(dtype):
+    """
+    Sets the dtype of raster-derived matrices and per-cell statistics within a with block
+
+    Args:
+        dtype (str, np.dtype): float32 or float64. None restores the default.
+    """
+    global _dtype
+    previous = _dtype
+    set_dtype(dtype)
+    try:
+        yield get_dtype()
+    finally:
+        _dtype = previous
+
+def fits(nbytes:int, share:float=1.0) -> bool:
+    """
+    Checks if an allocation fits into a share of the budget
+
+    Args:
+        nbytes (int): size of the allocation in bytes
+        share (float, optional): share of the budget that is available. Defaults to 1.0.
+
+    Returns:
+        bool: True if there is no budget or the allocation fits
+    """
+    limit = get_budget()
+    return limit is None or nbytes <= limit * share
+
+def rows_within(row_bytes:int, total:int, share:float=1.0) -> int:
+    """
+    Returns the number of rows of a chunk that fits into a share of the budget
+
+    Args:
+        row_bytes (int): size of one row in bytes
+        total (int): number of rows of the whole array
+        share (float, optional): share of the budget that is available. Defaults to 1.0.
+
+    Returns:
+        int: number of rows between 1 and total
+    """
+    limit = get_budget()
+    if limit is None:
+        return max(1, total)
+    return int(min(max(1, total), max(1, limit * share // max(1, row_bytes))))
+
+def allocate(shape, dtype=np.float64, share:float=1.0, fill=None):
+    """
+    Allocates an array within a share of the budget
+
+    float64 arrays that do not fit are allocated as float32. Arrays that do not fit even then are
+    memory-mapped to a temporary file in the cache, which is deleted when the array is released.
+
+    Args:
+        shape (tuple): shape of the array
+        dtype (np.dtype, optional): preferred dtype of the array. Defaults to np.float64.
+        share (float, optional): share of the budget that is available. Defaults to 1.0.
+        fill (float, optional): initial value of the array. Defaults to None, i.e. uninitialised.
+
+    Returns:
+        array (np.ndarray): the allocated array
+        storage (str): ram or memmap
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if not fits(nbytes, share) and dtype == np.float64:
+        dtype = np.dtype(np.float32)
+        nbytes //= 2
+    if fits(nbytes, share):
+        array = np.empty(shape, dtype=dtype) if fill is None else np.full(shape, fill, dtype=dtype)
+        return array, 'ram'
+    array = np.memmap(tempfile.TemporaryFile(dir=data.cache_dir('tmp')), dtype=dtype, mode='w+', shape=shape)
+    if fill is not None and fill != 0:
+        array[...] = fill
+    return array, 'memmap'
+
+def report(operation:str, **plan) -> dict:
+    """
+    Records and logs what a conversion chose to stay under the budget
+
+    The latest plan of every operation is kept in memory.plans.
+
+    Args:
+        operation (str): name of the conversion, e.g. create_vector
+        **plan: choices of the conversion, e.g. dtype, storage and chunk size
+
+    Returns:
+        dict: the plan including the budget
+    """
+    plan = dict(budget=get_budget(), **plan)
+    plans[operation] = plan
+    logger.info('%s: %s', operation, plan)
+    return plan
@@ -0,0 +1,226 @@
+import hashlib
+import inspect
+import multiprocessing
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from frontiers_yildizetal.utilities import data, memory
+
+_sources = None
+
+def _build(pipeline, name):
+    pipeline.build(name)
+    return name
+
+def sources() -> str:
+    """
+    Returns a hash of the installed package, i.e. its version, its modules and the input designs
+
+    Returns:
+        str: hexadecimal SHA-256 of the version and of every .py and .csv file of the package
+    """
+    global _sources
+    if _sources is None:
+        try:
+            from importlib.metadata import version
+            package_version = version('frontiers_yildizetal')
+        except Exception:
+            package_version = 'unknown'
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha256(package_version.encode())
+        for directory, subdirs, files in sorted(os.walk(root)):
+            subdirs.sort()
+            for filename in sorted(files):
+                if filename.endswith(('.py', '.csv')):
+                    path = os.path.join(directory, filename)
+                    digest.update(os.path.relpath(path, root).encode())
+                    with open(path, 'rb') as file:
+                        digest.update(hashlib.sha256(file.read()).digest())
+        _sources = digest.hexdigest()
+    return _sources
+
+class Pipeline:
+    """
+    A class to represent a graph of named artifacts that are cached on disk
+
+    Every artifact is produced by a function of its dependencies and parameters. The key of an
+    artifact is a hash of its name, the source of its function, its parameters, the content
+    hashes of its dependencies, the checksums of the Figshare stacks it is derived from, the
+    package version, modules and input designs (see sources) and the precision policy of
+    memory.get_dtype(). An artifact is rebuilt only if no file with its key exists, so
+    artifacts are shared between scripts and processes, and are rebuilt only when their inputs change.
+
+    Attributes:
+        cache_dir (str): directory in which the artifacts are stored
+        tasks (dict): function, dependencies and parameters of every artifact
+
+    Methods:
+        add(name, func, deps, stacks, **params): registers an artifact
+        key(name): returns the key of an artifact
+        content_hash(name): returns the hash of the stored content of an artifact
+        build(name): builds an artifact and its dependencies unless they are cached
+        get(name): returns the value of an artifact
+        run(names, workers): builds artifacts in parallel worker processes
+    """
+    def __init__(self, cache_dir:str=None):
+        """
+        Initialising Pipeline class
+
+        Args:
+            cache_dir (str, optional): directory in which the artifacts are stored. Defaults to the artifacts directory of the package cache.
+        """
+        self.cache_dir = cache_dir if cache_dir is not None else data.cache_dir('artifacts')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.tasks = {}
+        self.checksums = {}
+
+    def add(self, name:str, func, /, deps=(), stacks=(), **params):
+        """
+        Registers an artifact
+
+        Args:
+            name (str): name of the artifact
+            func (callable): module-level function called with the values of the dependencies followed by the parameters as keywords
+            deps (tuple, optional): names of the artifacts that the function needs. Defaults to ().
+            stacks (tuple, optional): names of the Figshare articles whose stacks the artifact is derived from, e.g. synth_pem. Defaults to ().
+            **params: parameters of the function, which may include name. Their repr is part of the key.
+
+        Raises:
+            TypeError: name must be a string
+            Exception: Unknown artifact
+        """
+        if not isinstance(name, str):
+            raise TypeError('name must be a string')
+        for dep in deps:
+            if dep not in self.tasks:
+                raise Exception('Unknown artifact: ' + dep)
+        self.tasks[name] = (func, tuple(deps), params, tuple(stacks))
+
+    def _task(self, name):
+        if name not in self.tasks:
+            raise Exception('Unknown artifact: ' + name)
+        return self.tasks[name]
+
+    def _checksums(self, stack:str) -> list:
+        if stack not in self.checksums:
+            figshare = data.FigshareData(stack)
+            self.checksums[stack] = [(parameter, figshare.checksum(parameter)) for parameter in sorted(figshare.parameters)]
+        return self.checksums[stack]
+
+    def key(self, name:str) -> str:
+        """
+        Returns the key of an artifact. The dependencies are built if they are not cached.
+
+        Args:
+            name (str): name of the artifact
+
+        Returns:
+            str: hexadecimal SHA-256 key
+        """
+        func, deps, params, stacks = self._task(name)
+        try:
+            source = inspect.getsource(func)
+        except (OSError, TypeError):
+            source = func.__module__ + '.' + func.__qualname__
+        digest = hashlib.sha256()
+        digest.update(name.encode())
+        digest.update(source.encode())
+        digest.update(repr(sorted(params.items())).encode())
+        digest.update(sources().encode())
+        digest.update(memory.get_dtype().str.encode())
+        for stack in stacks:
+            digest.update(repr((stack, self._checksums(stack))).encode())
+        for dep in deps:
+            digest.update(self.content_hash(dep).encode())
+        return digest.hexdigest()
+
+    def _path(self, name:str, key:str) -> str:
+        filename = name.replace(':', '_').replace('/', '_') + '-' + key[:16]
+        return os.path.join(self.cache_dir, filename)
+
+    def _write(self, path:str, content:bytes):
+        handle, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(handle, 'wb') as file:
+            file.write(content)
+        os.replace(tmp, path)
+
+    def build(self, name:str) -> str:
+        """
+        Builds an artifact and its dependencies unless they are cached
+
+        Args:
+            name (str): name of the artifact
+
+        Returns:
+            str: path of the stored artifact
+        """
+        func, deps, params, _ = self._task(name)
+        path = self._path(name, self.key(name))
+        if os.path.exists(path + '.sha256'):
+            return path
+
+        value = func(*[self.get(dep) for dep in deps], **params)
+        content = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(path + '.pkl', content)
+        self._write(path + '.sha256', hashlib.sha256(content).hexdigest().encode())
+        return path
+
+    def content_hash(self, name:str) -> str:
+        """
+        Returns the hash of the stored content of an artifact, building it if necessary
+
+        Args:
+            name (str): name of the artifact
+
+        Returns:
+            str: hexadecimal SHA-256 hash of the pickled value
+        """
+        with open(self.build(name) + '.sha256') as file:
+            return file.read()
+
+    def get(self, name:str):
+        """
+        Returns the value of an artifact, building it if necessary
+
+        Args:
+            name (str): name of the artifact
+
+        Returns:
+            value of the artifact
+        """
+        with open(self.build(name) + '.pkl', 'rb') as file:
+            return pickle.load(file)
+
+    def _depth(self, name:str) -> int:
+        deps = self._task(name)[1]
+        return 0 if not deps else 1 + max(self._depth(dep) for dep in deps)
+
+    def run(self, names, workers:int=None):
+        """
+        Builds artifacts and their dependencies in parallel worker processes
+
+        Artifacts with the same depth in the graph do not depend on each other, so they are built
+        in parallel, one depth after the other. The workers are spawned rather than forked, as R
+        cannot be used in a fork of a process in which it is initialised, so the functions of the
+        artifacts must be importable and scripts must call run under if __name__ == '__main__'.
+
+        Args:
+            names (list): names of the artifacts
+            workers (int, optional): number of worker processes. Defaults to the number of processors.
+        """
+        required = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in required:
+                required.add(name)
+                stack.extend(self._task(name)[1])
+
+        levels = {}
+        for name in required:
+            levels.setdefault(self._depth(name), []).append(name)
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for depth in sorted(levels):
+                list(executor.map(_build, [self] * len(levels[depth]), levels[depth]))
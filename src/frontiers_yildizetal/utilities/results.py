@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from frontiers_yildizetal.utilities import data, memory, pipeline, tracing
+
+_limit = None
+_enabled = None
+
+def set_limit(size):
+    """
+    Sets the size limit of the result cache
+
+    Args:
+        size (int, float, str): limit in bytes or with a unit, e.g. 10G. None restores the default.
+    """
+    global _limit
+    _limit = None if size is None else memory.parse_size(size)
+
+def get_limit() -> int:
+    """
+    Returns the size limit of the result cache
+
+    The limit set by set_limit is used if there is one, otherwise the FRONTIERS_YILDIZETAL_RESULT_CACHE_SIZE
+    environment variable, e.g. 10G, which defaults to 10G.
+
+    Returns:
+        int: limit in bytes
+    """
+    if _limit is not None:
+        return _limit
+    return memory.parse_size(os.environ.get('FRONTIERS_YILDIZETAL_RESULT_CACHE_SIZE', '10G'))
+
+def set_enabled(enabled):
+    """
+    Enables or disables the result cache
+
+    Args:
+        enabled (bool): False to compute all results. None restores the default.
+    """
+    global _enabled
+    _enabled = enabled
+
+def enabled() -> bool:
+    """
+    Returns True if results are cached
+
+    The cache is enabled unless set_enabled(False) was called or the FRONTIERS_YILDIZETAL_RESULT_CACHE
+    environment variable is 0, off or false.
+
+    Returns:
+        bool: True if results are cached
+    """
+    if _enabled is not None:
+        return bool(_enabled)
+    return os.environ.get('FRONTIERS_YILDIZETAL_RESULT_CACHE', '1').lower() not in ['0', 'off', 'false']
+
+def digest(array:np.ndarray) -> str:
+    """
+    Returns a checksum of the content of an array, e.g. of the valid cells a result depends on
+
+    Args:
+        array (np.ndarray): array
+
+    Returns:
+        str: MD5 checksum of the dtype, the shape and the values
+    """
+    array = np.ascontiguousarray(array)
+    checksum = hashlib.md5(str((array.dtype.str, array.shape)).encode())
+    checksum.update(array.data)
+    return checksum.hexdigest()
+
+def key(operation:str, checksums, **params) -> str:
+    """
+    Returns the key of a result
+
+    The key includes the hash of the package sources (see pipeline.sources), so results of an
+    earlier version of the code that produced them are not served after the code changed.
+
+    Args:
+        operation (str): name of the computation, e.g. create_vector
+        checksums (list): checksums of the stacks the result is derived from, see FigshareData.checksum
+        **params: parameters of the computation, e.g. qoi and threshold
+
+    Returns:
+        str: SHA-256 of the operation, the checksums, the parameters and the package sources
+    """
+    content = json.dumps([operation, list(checksums), sorted(params.items()), pipeline.sources()], default=repr)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def _path(key:str) -> str:
+    return os.path.join(data.cache_dir('results'), key)
+
+def _size(path:str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+def load(key:str) -> dict:
+    """
+    Returns a cached result and marks it as recently used
+
+    Results saved without compression are memory-mapped copy-on-write, so they are not read
+    until they are used and can be changed without changing the cache.
+
+    Args:
+        key (str): key of the result
+
+    Returns:
+        dict: arrays of the result according to their names, or None if it is not cached
+    """
+    if not enabled():
+        return None
+    path = _path(key)
+    with tracing.span('result_cache', key=key[:12]) as span:
+        try:
+            if os.path.isdir(path):
+                arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='c')
+                          for name in os.listdir(path) if name.endswith('.npy')}
+            elif os.path.exists(path + '.npz'):
+                path += '.npz'
+                with np.load(path) as file:
+                    arrays = {name: file[name] for name in file.files}
+            else:
+                span.set(hit=False)
+                return None
+            os.utime(path)
+        except (OSError, ValueError):
+            # the entry was evicted or is being replaced by another process
+            span.set(hit=False)
+            return None
+        span.set(hit=True)
+    return arrays
+
+def save(key:str, arrays:dict, compress:bool=False) -> str:
+    """
+    Caches a result and evicts the least recently used results beyond the size limit
+
+    Args:
+        key (str): key of the result
+        arrays (dict): arrays of the result according to their names
+        compress (bool, optional): True for a compressed .npz file, False for .npy files that are memory-mapped. Defaults to False.
+
+    Returns:
+        str: path of the entry, or None if the cache is disabled
+    """
+    if not enabled():
+        return None
+    path = _path(key)
+    root = os.path.dirname(path)
+    with tracing.span('result_cache_save', key=key[:12], compress=compress):
+        if compress:
+            handle, tmp = tempfile.mkstemp(dir=root, suffix='.npz.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                np.savez_compressed(file, **arrays)
+            path += '.npz'
+            os.replace(tmp, path)
+        else:
+            tmp = tempfile.mkdtemp(dir=root, suffix='.tmp')
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), np.asarray(array))
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.replace(tmp, path)
+            except OSError:
+                # another process saved the same result in the meantime
+                shutil.rmtree(tmp, ignore_errors=True)
+    evict()
+    return path
+
+def evict(limit:int=None) -> int:
+    """
+    Removes the least recently used results until the cache fits into the size limit
+
+    Args:
+        limit (int, optional): size limit in bytes. Defaults to get_limit().
+
+    Returns:
+        int: number of removed bytes
+    """
+    limit = get_limit() if limit is None else limit
+    root = data.cache_dir('results')
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.endswith('.tmp'):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), _size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total - removed <= limit:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+        removed += size
+    if removed:
+        memory.logger.info('result_cache: evicted %d bytes', removed)
+    return removed
+
+def clear():
+    """ Removes all cached results """
+    shutil.rmtree(data.cache_dir('results'), ignore_errors=True)
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from frontiers_yildizetal.utilities import data
+
+ranges = {'coulomb':(0.02, 0.3), 'turbulent':(100, 2200), 'volume':(0.716, 2.148)}
+sites = {'synth':(1000, 2000), 'acheron':(1490100, 5204100)}
+
+def design(size:int, seed=None) -> np.ndarray:
+    """
+    Draws random inputs within the ranges of the training designs
+
+    Args:
+        size (int): number of simulations
+        seed (int, optional): seed of the random number generator. Defaults to None.
+
+    Returns:
+        np.ndarray: coulomb, turbulent and volume of every simulation
+    """
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(low, high, size) for low, high in ranges.values()])
+
+def write_stack(directory:str, inputs:np.ndarray, rows:int, cols:int, res:float=10.0,
+                origin=(0.0, None), crs=None, seed=None) -> dict:
+    """
+    Writes hmax, hfin, vmax and pmax stacks of synthetic r.avaflow simulations
+
+    Every simulation is an elliptical flow released at one tenth of the width of the domain and
+    moving along the x axis. Lower Coulomb friction and larger release volumes make longer, wider
+    and faster flows, and higher turbulent friction makes faster flows. The deposit forms at the
+    distal part of the flow. Every band has 5 % multiplicative noise, so that the stacks behave like
+    results of r.avaflow for reading, thresholding and emulation.
+
+    Args:
+        directory (str): directory of the stacks
+        inputs (np.ndarray): coulomb, turbulent and volume of every simulation
+        rows (int): number of rows of the grid
+        cols (int): number of columns of the grid
+        res (float, optional): resolution of the grid. Defaults to 10.0.
+        origin (tuple, optional): x and y coordinates of the upper left corner. y defaults to rows * res. Defaults to (0.0, None).
+        crs (str, optional): coordinate reference system. Defaults to None.
+        seed (int, optional): seed of the random number generator. Defaults to None.
+
+    Raises:
+        ValueError: inputs must have three columns
+
+    Returns:
+        paths (dict): paths of the stacks according to the quantity of interest
+    """
+    inputs = np.atleast_2d(inputs)
+    if inputs.shape[1] != 3:
+        raise ValueError('inputs must have three columns')
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    west = origin[0]
+    north = rows * res if origin[1] is None else origin[1]
+    transform = from_origin(west, north, res, res)
+    width, height = cols * res, rows * res
+    x = west + (np.arange(cols, dtype=np.float32) + 0.5) * res
+    y = north - (np.arange(rows, dtype=np.float32) + 0.5) * res
+
+    profile = {
+        'driver':'GTiff', 'height':rows, 'width':cols, 'count':inputs.shape[0], 'dtype':'float32',
+        'crs':crs, 'transform':transform, 'tiled':True, 'blockxsize':256, 'blockysize':256,
+        'compress':'deflate',
+    }
+    paths = {qoi: os.path.join(directory, qoi + '_stack.tif') for qoi in ['hmax', 'hfin', 'vmax', 'pmax']}
+    stacks = {qoi: rasterio.open(path, 'w', **profile) for qoi, path in paths.items()}
+    try:
+        for band, (coulomb, turbulent, volume) in enumerate(inputs):
+            mobility = 1 - (coulomb - ranges['coulomb'][0]) / (ranges['coulomb'][1] - ranges['coulomb'][0])
+            speed = (turbulent - ranges['turbulent'][0]) / (ranges['turbulent'][1] - ranges['turbulent'][0])
+            scale = np.cbrt(volume / np.mean(ranges['volume']))
+
+            length = min(0.85, (0.45 + 0.35 * mobility) * scale) * width
+            half_width = (0.08 + 0.06 * mobility) * scale * height
+            start = west + 0.1 * width
+            centre_x, centre_y = start + length / 2, north - height / 2
+            peak = (5 + 15 * scale) * (1 - 0.4 * mobility)
+
+            shape = 1 - ((x[np.newaxis, :] - centre_x) / (length / 2)) ** 2 - ((y[:, np.newaxis] - centre_y) / half_width) ** 2
+            noise = rng.lognormal(0, 0.05, (rows, cols)).astype(np.float32)
+            hmax = np.where(shape > 0, peak * shape * noise, 0).astype(np.float32)
+            distal = 1 / (1 + np.exp(-(x[np.newaxis, :] - (start + 0.7 * length)) / (0.05 * length)))
+            hfin = (0.6 * hmax * distal).astype(np.float32)
+            vmax = np.where(hmax > 0, (10 + 40 * mobility + 10 * speed) * np.sqrt(hmax / peak), 0).astype(np.float32)
+            pmax = (2000 * vmax ** 2 / 1000).astype(np.float32)
+
+            for qoi, arr in zip(['hmax', 'hfin', 'vmax', 'pmax'], [hmax, hfin, vmax, pmax]):
+                stacks[qoi].write(arr, band + 1)
+    finally:
+        for stack in stacks.values():
+            stack.close()
+    return paths
+
+def write_articles(root:str, rows:int=400, cols:int=500, res:float=10.0, size:int=None, seed=None, names=None) -> dict:
+    """
+    Writes synthetic stacks of all sets of simulations in the layout served by figshare_server
+
+    The stacks of a set are written into root/<article_id>. If size is None, the training and
+    validation sets use the designs of the package, so that the emulators can be trained on them.
+    The grid of acheron is centred at the location used in the analysis of acheron.
+
+    Args:
+        root (str): root directory of the articles
+        rows (int, optional): number of rows of the grid. Defaults to 400.
+        cols (int, optional): number of columns of the grid. Defaults to 500.
+        res (float, optional): resolution of the grid. Defaults to 10.0.
+        size (int, optional): number of simulations of the training and validation sets. Defaults to None.
+        seed (int, optional): seed of the random number generator. Defaults to None.
+        names (list, optional): sets of simulations to write, e.g. synth and synth_validation. Defaults to all sets.
+
+    Returns:
+        paths (dict): paths of the stacks according to the set and the quantity of interest
+    """
+    rng = np.random.default_rng(seed)
+    paths = {}
+    for name, article_id in data.FigshareData.article_id.items():
+        if names is not None and name not in names:
+            continue
+        site = name.split('_')[0]
+        if name.endswith('_pem'):
+            inputs = design(24, rng)
+        elif size is not None:
+            inputs = design(size, rng)
+        else:
+            analysis = 'validation_emulator' if name.endswith('_validation') else 'emulator'
+            inputs = data.load_input(site, analysis)
+        if site == 'acheron':
+            origin = (sites[site][0] - cols * res / 2, sites[site][1] + rows * res / 2)
+        else:
+            origin = (0.0, None)
+        paths[name] = write_stack(os.path.join(root, str(article_id)), inputs, rows, cols, res=res,
+                                  origin=origin, seed=rng)
+    return paths
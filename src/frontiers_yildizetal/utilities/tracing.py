@@ -0,0 +1,175 @@
+import json
+import logging
+import threading
+import time
+
+_sinks = []
+_local = threading.local()
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_null_span = _NullSpan()
+
+class Span:
+    """
+    A class to represent a timed section of code
+
+    A span is a context manager. When it exits, a record with its name, parent, depth, start time,
+    duration, thread and attributes is sent to every sink.
+    """
+    __slots__ = ('name', 'attrs', 'parent', 'depth', 'start', 'wall')
+
+    def __init__(self, name:str, attrs:dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """ Adds attributes to the record of the span, e.g. the number of cells that were reduced """
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        record = {
+            'name':self.name,
+            'parent':self.parent,
+            'depth':self.depth,
+            'start':self.wall,
+            'duration':duration,
+            'thread':threading.get_ident(),
+            'error':exc_type.__name__ if exc_type is not None else None,
+        }
+        record.update(self.attrs)
+        for sink in list(_sinks):
+            sink.emit(record)
+        return False
+
+def span(name:str, **attrs):
+    """
+    Returns a span that times a section of code
+
+    If no sink is registered, a shared no-op context is returned, so instrumented code pays
+    only for a function call.
+
+    Args:
+        name (str): name of the span, e.g. gp_fit
+        **attrs: attributes of the record, e.g. qoi or band
+
+    Returns:
+        context manager of the span
+    """
+    if not _sinks:
+        return _null_span
+    return Span(name, attrs)
+
+def enabled() -> bool:
+    """ Returns True if a sink is registered """
+    return bool(_sinks)
+
+def add_sink(sink):
+    """
+    Registers a sink that receives the records of all spans
+
+    Args:
+        sink: any object with an emit(record) method, e.g. LoggingSink, JsonLinesSink or MemorySink
+
+    Returns:
+        the registered sink
+    """
+    _sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    """ Unregisters a sink """
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+def clear_sinks():
+    """ Unregisters all sinks, which disables tracing """
+    _sinks.clear()
+
+class LoggingSink:
+    """
+    A sink that writes every span to a logger
+
+    Attributes:
+        logger (logging.Logger): logger of the records. Defaults to the logger of the package.
+        level (int): level of the records. Defaults to logging.INFO.
+    """
+    def __init__(self, logger:logging.Logger=None, level:int=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger('frontiers_yildizetal')
+        self.level = level
+
+    def emit(self, record:dict):
+        attrs = {key: val for key, val in record.items() if key not in ['name', 'parent', 'depth', 'start', 'duration', 'thread', 'error']}
+        if record['error'] is not None:
+            attrs['error'] = record['error']
+        self.logger.log(self.level, '%s%s took %.4f s %s', '  ' * record['depth'], record['name'], record['duration'], attrs)
+
+class JsonLinesSink:
+    """
+    A sink that appends every span as a JSON line to a file
+
+    Attributes:
+        path (str): path of the file
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def emit(self, record:dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class MemorySink:
+    """
+    A sink that keeps the records in memory, e.g. for tests
+
+    Attributes:
+        records (list): records of the spans in the order they ended
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record:dict):
+        with self._lock:
+            self.records.append(record)
+
+    def totals(self) -> dict:
+        """
+        Sums up the records according to the span names
+
+        Returns:
+            totals (dict): number of spans and total duration according to the span names
+        """
+        totals = {}
+        for record in self.records:
+            count, duration = totals.get(record['name'], (0, 0.0))
+            totals[record['name']] = (count + 1, duration + record['duration'])
+        return totals